@@ -16,12 +16,29 @@
 
 import logging
 import os
+import atexit
+import functools
+import threading
 import pika
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from time import time
 from utils import utils
 
 logger = logging.getLogger("analyzerApp.amqp")
 
 
+class ThreadSafeChannel:
+    """ThreadSafeChannel passes publishing from worker threads to the connection thread"""
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+
+    def basic_publish(self, **kwargs):
+        self.connection.add_callback_threadsafe(
+            functools.partial(self.channel.basic_publish, **kwargs))
+
+
 class AmqpClient:
     """AmqpClient handles communication with rabbitmq"""
     def __init__(self, amqpUrl):
@@ -55,10 +72,10 @@ class AmqpClient:
         return True
 
     @staticmethod
-    def consume_queue(channel, queue, auto_ack, exclusive, msg_callback):
+    def consume_queue(channel, queue, auto_ack, exclusive, msg_callback, prefetch_count=1):
         """AmqpClient shows how to handle a message from the queue"""
         try:
-            channel.basic_qos(prefetch_count=1, prefetch_size=0)
+            channel.basic_qos(prefetch_count=prefetch_count, prefetch_size=0)
         except Exception as err:
             logger.error("Failed to configure Qos pid(%d)", os.getpid())
             logger.error(err)
@@ -71,13 +88,38 @@ class AmqpClient:
             logger.error(err)
             os.kill(os.getpid(), 9)
 
-    def receive(self, exchange_name, queue, auto_ack, exclusive, msg_callback):
-        """AmqpClient starts consuming messages from a specific queue"""
+    def process_in_worker(self, channel, method, props, body, msg_callback):
+        """AmqpClient processes a message in a pool worker and acks it afterwards"""
+        try:
+            msg_callback(ThreadSafeChannel(self.connection, channel), method, props, body)
+        except Exception as err:
+            logger.error("Failed to process a message pid(%d)", os.getpid())
+            logger.error(err)
+        finally:
+            self.connection.add_callback_threadsafe(
+                functools.partial(channel.basic_ack, delivery_tag=method.delivery_tag))
+
+    def dispatch_to_pool(self, executor, msg_callback):
+        """AmqpClient creates a callback, which passes messages to the worker pool"""
+        def _dispatch(channel, method, props, body):
+            executor.submit(self.process_in_worker, channel, method, props, body, msg_callback)
+        return _dispatch
+
+    def receive(self, exchange_name, queue, auto_ack, exclusive, msg_callback, consumers_number=1):
+        """AmqpClient starts consuming messages from a specific queue.
+        If consumers_number > 1, messages are processed by a pool of worker threads
+        and acknowledged after processing, so prefetch limits messages in progress"""
         try:
             channel = self.connection.channel()
             AmqpClient.bind_queue(channel, queue, exchange_name)
-            AmqpClient.consume_queue(channel, queue, auto_ack, exclusive, msg_callback)
-            logger.info("started consuming pid(%d) on the queue %s", os.getpid(), queue)
+            if consumers_number > 1:
+                executor = ThreadPoolExecutor(max_workers=consumers_number)
+                msg_callback = self.dispatch_to_pool(executor, msg_callback)
+                auto_ack = False
+            AmqpClient.consume_queue(channel, queue, auto_ack, exclusive, msg_callback,
+                                     prefetch_count=max(1, consumers_number))
+            logger.info("started consuming pid(%d) on the queue %s with %d consumers",
+                        os.getpid(), queue, max(1, consumers_number))
             channel.start_consuming()
         except Exception as err:
             logger.error("Failed to consume messages pid(%d) in queue %s", os.getpid(), queue)
@@ -94,3 +136,133 @@ class AmqpClient:
         except Exception as err:
             logger.error("Failed to publish messages in queue %s", queue)
             logger.error(err)
+
+
+class AmqpPublisher:
+    """AmqpPublisher keeps a long-lived connection for publishing inner messages.
+    Blocking connections are not thread-safe, so messages are put into a queue
+    and published by one thread, which owns the connection and a transactional channel.
+    Messages are gathered in batches of batch_size messages or for batch_timeout seconds,
+    and a batch is confirmed by one commit"""
+
+    def __init__(self, amqpUrl, batch_size=1, batch_timeout=0.5):
+        self.amqpUrl = amqpUrl
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout = batch_timeout
+        self.messages = Queue()
+        self.connection = None
+        self.channel = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send_to_inner_queue(self, exchange_name, queue, data):
+        self.messages.put((exchange_name, queue, data))
+
+    def get_batch(self):
+        """Waits for messages and gathers them into a batch"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = 1.0 if deadline is None else deadline - time()
+            if timeout <= 0:
+                break
+            try:
+                message = self.messages.get(timeout=timeout)
+            except Empty:
+                if deadline is None:
+                    self.process_data_events()
+                    continue
+                break
+            if message is None:
+                self.stopped = True
+                break
+            batch.append(message)
+            if deadline is None:
+                deadline = time() + self.batch_timeout
+        return batch
+
+    def process_data_events(self):
+        """Lets the connection send heartbeats while there is nothing to publish"""
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.process_data_events(time_limit=0)
+        except Exception as err:
+            logger.error("Publisher connection is broken pid(%d)", os.getpid())
+            logger.error(err)
+            self.close_connection()
+
+    def close_connection(self):
+        """Closes the connection, if it is still open, errors of a broken connection are ignored"""
+        connection, self.connection, self.channel = self.connection, None, None
+        try:
+            if connection is not None and connection.is_open:
+                connection.close()
+        except Exception as err:
+            logger.debug("Couldn't close the publisher connection: %s", err)
+
+    def open_channel(self):
+        if self.connection is None or not self.connection.is_open or\
+                self.channel is None or not self.channel.is_open:
+            self.close_connection()
+            self.connection = AmqpClient.create_ampq_connection(self.amqpUrl)
+            self.channel = self.connection.channel()
+            self.channel.tx_select()
+        return self.channel
+
+    def publish_batch(self, batch):
+        """Publishes messages of the batch and commits them, if the commit fails,
+        the whole batch is published once again"""
+        for attempt in range(2):
+            try:
+                channel = self.open_channel()
+                for exchange_name, queue, data in batch:
+                    channel.basic_publish(
+                        exchange=exchange_name,
+                        routing_key=queue,
+                        body=data)
+                channel.tx_commit()
+                return True
+            except Exception as err:
+                logger.error("Failed to publish %d messages, attempt %d", len(batch), attempt + 1)
+                logger.error(err)
+                self.close_connection()
+        return False
+
+    def run(self):
+        while not self.stopped:
+            batch = self.get_batch()
+            if batch:
+                self.publish_batch(batch)
+        self.close_connection()
+
+    def close(self, timeout=10):
+        """Publishes the remaining messages and closes the connection"""
+        if self.thread.is_alive():
+            self.messages.put(None)
+            self.thread.join(timeout)
+
+
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+def get_publisher(app_config):
+    """Gets the publisher of the current process, a forked process creates its own publisher"""
+    key = (app_config["amqpUrl"], os.getpid())
+    with _publishers_lock:
+        if key not in _publishers:
+            _publishers[key] = AmqpPublisher(
+                app_config["amqpUrl"],
+                batch_size=app_config.get("amqpPublisherBatchSize", 1),
+                batch_timeout=app_config.get("amqpPublisherBatchTimeout", 0.5))
+        return _publishers[key]
+
+
+@atexit.register
+def close_publishers():
+    """Publishes queued messages of the publishers of the current process"""
+    for key in list(_publishers):
+        if key[1] == os.getpid():
+            _publishers[key].close()
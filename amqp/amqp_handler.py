@@ -16,17 +16,46 @@
 
 import logging
 import json
+import gzip
 import pika
+import msgpack
 import commons.launch_objects as launch_objects
+from commons import metrics
+from commons.launch_stream import LaunchStream
 
 logger = logging.getLogger("analyzerApp.amqpHandler")
 
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+GZIP_CONTENT_ENCODING = "gzip"
 
-def prepare_launches(launches):
+
+def msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def msgpack_loads(body):
+    return msgpack.unpackb(body, raw=False)
+
+
+def prepare_launches(launches, trusted=False):
     """Function for deserializing array of launches"""
+    if trusted:
+        return [launch_objects.construct_launch(launch) for launch in launches]
     return [launch_objects.Launch(**launch) for launch in launches]
 
 
+def prepare_launches_stream(body, trusted=False, min_stream_size=0):
+    """Function for deserializing array of launches from the message body, test items of
+    bodies of at least min_stream_size bytes are decoded on iteration, if it is more than 0.
+    Launches decoded from a binary body are deserialized as they are"""
+    if isinstance(body, list):
+        return prepare_launches(body, trusted=trusted)
+    if min_stream_size <= 0 or len(body) < min_stream_size:
+        return prepare_launches(json.loads(body, strict=False), trusted=trusted)
+    return LaunchStream(body, trusted=trusted)
+
+
 def prepare_search_logs(search_data):
     """Function for deserializing search logs object"""
     return launch_objects.SearchLogs(**search_data)
@@ -47,42 +76,95 @@ def prepare_delete_index(body):
     return int(body)
 
 
-def prepare_test_item_info(test_item_info):
+def prepare_test_item_info(test_item_info, trusted=False):
     """Function for deserializing test item info for suggestions"""
+    if trusted:
+        return launch_objects.construct_test_item_info(test_item_info)
     return launch_objects.TestItemInfo(**test_item_info)
 
 
-def prepare_search_response_data(response):
+def prepare_search_response_data(response, dumps=json.dumps):
     """Function for serializing response from search request"""
-    return json.dumps(response)
+    return dumps(response)
 
 
-def prepare_analyze_response_data(response):
+def prepare_analyze_response_data(response, dumps=json.dumps):
     """Function for serializing response from analyze request"""
-    return json.dumps([resp.dict() for resp in response])
+    return dumps([resp.dict() for resp in response])
 
 
-def prepare_index_response_data(response):
+def prepare_index_response_data(response, dumps=None):
     """Function for serializing response from index request
     and other objects, which are pydantic objects"""
-    return response.json()
+    if dumps is None:
+        return response.json()
+    return dumps(response.dict())
 
 
-def output_result(response):
+def output_result(response, dumps=None):
     """Function for serializing int object"""
-    return str(response)
+    if dumps is None:
+        return str(response)
+    return dumps(response)
+
+
+def get_header(props, header_name):
+    if props.headers and header_name in props.headers:
+        return props.headers[header_name]
+    return None
+
+
+def choose_response_format(props):
+    """Chooses content type and encoding of the response. The content type is taken from
+    the "accept" header or from the request, the response is compressed, if the request
+    was compressed or "accept-encoding" header contains gzip. JSON is used by default"""
+    content_type = get_header(props, "accept") or props.content_type
+    if content_type != MSGPACK_CONTENT_TYPE:
+        content_type = JSON_CONTENT_TYPE
+    content_encoding = None
+    if props.content_encoding == GZIP_CONTENT_ENCODING or\
+            GZIP_CONTENT_ENCODING in (get_header(props, "accept-encoding") or ""):
+        content_encoding = GZIP_CONTENT_ENCODING
+    return content_type, content_encoding
+
+
+def decode_request_body(props, body, decode_body=True):
+    """Decodes the request body according to its content type and encoding"""
+    if props.content_encoding == GZIP_CONTENT_ENCODING:
+        body = gzip.decompress(body)
+    if props.content_type == MSGPACK_CONTENT_TYPE:
+        return msgpack_loads(body)
+    if decode_body:
+        return json.loads(body, strict=False)
+    return body
+
+
+def encode_response_body(response, prepare_response_data, content_type, content_encoding):
+    """Serializes the response in the chosen content type and encoding"""
+    if content_type == MSGPACK_CONTENT_TYPE:
+        response_body = prepare_response_data(response, dumps=msgpack_dumps)
+    else:
+        response_body = prepare_response_data(response)
+    if content_encoding == GZIP_CONTENT_ENCODING:
+        if isinstance(response_body, str):
+            response_body = response_body.encode("utf-8")
+        response_body = gzip.compress(response_body, compresslevel=1)
+    return response_body
 
 
+@metrics.track_amqp_request
 def handle_amqp_request(channel, method, props, body,
                         request_handler, prepare_data_func=prepare_launches,
-                        prepare_response_data=prepare_search_response_data):
-    """Function for handling amqp reuqest: index, search and analyze"""
+                        prepare_response_data=prepare_search_response_data,
+                        decode_body=True):
+    """Function for handling amqp reuqest: index, search and analyze,
+    when decode_body is False, a json body is passed to prepare_data_func as it is"""
     logger.debug("Started processing %s method %s props", method, props)
     logger.debug("Started processing data %s", body)
     try:
-        launches = json.loads(body, strict=False)
+        launches = decode_request_body(props, body, decode_body=decode_body)
     except Exception as err:
-        logger.error("Failed to load json from body")
+        logger.error("Failed to load data from body")
         logger.error(err)
         return False
     try:
@@ -98,8 +180,10 @@ def handle_amqp_request(channel, method, props, body,
         logger.error(err)
         return False
 
+    content_type, content_encoding = choose_response_format(props)
     try:
-        response_body = prepare_response_data(response)
+        response_body = encode_response_body(
+            response, prepare_response_data, content_type, content_encoding)
     except Exception as err:
         logger.error("Failed to dump launches result")
         logger.error(err)
@@ -109,7 +193,8 @@ def handle_amqp_request(channel, method, props, body,
                               routing_key=props.reply_to,
                               properties=pika.BasicProperties(
                                   correlation_id=props.correlation_id,
-                                  content_type="application/json"),
+                                  content_type=content_type,
+                                  content_encoding=content_encoding),
                               mandatory=False,
                               body=response_body)
     except Exception as err:
@@ -119,6 +204,7 @@ def handle_amqp_request(channel, method, props, body,
     return True
 
 
+@metrics.track_amqp_request
 def handle_inner_amqp_request(channel, method, props, body, request_handler):
     """Function for handling inner amqp reuqests"""
     logger.debug("Started processing %s method %s props", method, props)
@@ -16,7 +16,7 @@
 
 import logging
 import logging.config
-from signal import signal, SIGINT
+from signal import signal, SIGINT, SIGTERM
 from sys import exit
 import os
 import threading
@@ -26,16 +26,22 @@ from flask import Flask, Response, jsonify
 from flask_cors import CORS
 import amqp.amqp_handler as amqp_handler
 from amqp.amqp import AmqpClient
+from amqp import amqp
 from commons.esclient import EsClient
 from utils import utils
 from service.cluster_service import ClusterService
-from service.auto_analyzer_service import AutoAnalyzerService
+from service.auto_analyzer_service import AutoAnalyzerService, AnalysisState
 from service.suggest_service import SuggestService
 from service.search_service import SearchService
 from service.namespace_finder_service import NamespaceFinderService
 from service.delete_index_service import DeleteIndexService
-from service.retraining_service import RetrainingService
 from service.suggest_patterns_service import SuggestPatternsService
+from commons.worker_supervisor import WorkerSupervisor
+from commons.analysis_scheduler import AnalysisScheduler
+from commons import metrics
+from commons import stats_sink
+from commons import merge_scheduler
+from boosting_decision_making.model_registry import model_registry
 
 
 APP_CONFIG = {
@@ -53,6 +59,7 @@ APP_CONFIG = {
     "esCAcert":          os.getenv("ES_CA_CERT", ""),
     "esClientCert":      os.getenv("ES_CLIENT_CERT", ""),
     "esClientKey":       os.getenv("ES_CLIENT_KEY", ""),
+    "esIndexCacheTtl":   float(os.getenv("ES_INDEX_CACHE_TTL", "60")),
     "minioHost":         os.getenv("MINIO_SHORT_HOST", "minio:9000"),
     "minioAccessKey":    os.getenv("MINIO_ACCESS_KEY", "minio"),
     "minioSecretKey":    os.getenv("MINIO_SECRET_KEY", "minio123"),
@@ -62,6 +69,39 @@ APP_CONFIG = {
     "minioRegion":       os.getenv("ANALYZER_BINARYSTORE_MINIO_REGION", None),
     "instanceTaskType":  os.getenv("INSTANCE_TASK_TYPE", "").strip(),
     "filesystemDefaultPath": os.getenv("FILESYSTEM_DEFAULT_PATH", "storage").strip(),
+    "amqpDefaultConsumers": int(os.getenv("AMQP_DEFAULT_CONSUMERS", "1")),
+    "amqpConsumers":     json.loads(os.getenv("AMQP_CONSUMERS", "{}")),
+    "workerProcesses":   int(os.getenv("ANALYZER_WORKER_PROCESSES", "0")),
+    "amqpPublisherBatchSize":    int(os.getenv("AMQP_PUBLISHER_BATCH_SIZE", "1")),
+    "amqpPublisherBatchTimeout": float(os.getenv("AMQP_PUBLISHER_BATCH_TIMEOUT", "0.5")),
+    "statsBufferSize":   int(os.getenv("STATS_BUFFER_SIZE", "100")),
+    "statsFlushInterval": float(os.getenv("STATS_FLUSH_INTERVAL", "10")),
+    "trustedPayloads":   json.loads(os.getenv("ANALYZER_TRUSTED_PAYLOADS", "false").lower()),
+    "launchStreamMinSize": int(os.getenv("ANALYZER_LAUNCH_STREAM_MIN_SIZE", "0")),
+    "schedulerWorkers":  int(os.getenv("ANALYZER_SCHEDULER_WORKERS", "0")),
+    "schedulerChunkSize": int(os.getenv("ANALYZER_SCHEDULER_CHUNK_SIZE", "100")),
+    "projectWeights":    json.loads(os.getenv("ANALYZER_PROJECT_WEIGHTS", "{}")),
+    "projectMaxConcurrency": int(os.getenv("ANALYZER_PROJECT_MAX_CONCURRENCY", "1")),
+    "projectConcurrency": json.loads(os.getenv("ANALYZER_PROJECT_CONCURRENCY", "{}")),
+    "esMsearchConcurrency": int(os.getenv("ES_MSEARCH_CONCURRENCY", "4")),
+    "analyzeResultsQueueSize": int(os.getenv("ANALYZER_RESULTS_QUEUE_SIZE", "200")),
+    "esMsearchMinBatchSize": int(os.getenv("ES_MSEARCH_MIN_BATCH_SIZE", "5")),
+    "esMsearchMaxBatchSize": int(os.getenv("ES_MSEARCH_MAX_BATCH_SIZE", "200")),
+    "esBulkMinBatchSize": int(os.getenv("ES_BULK_MIN_BATCH_SIZE", "100")),
+    "esBulkMaxBatchSize": int(os.getenv("ES_BULK_MAX_BATCH_SIZE", "5000")),
+    "esBatchTargetLatency": float(os.getenv("ES_BATCH_TARGET_LATENCY", "1.0")),
+    "esBatchMaxPayloadBytes": int(os.getenv("ES_BATCH_MAX_PAYLOAD_BYTES", "10485760")),
+    "searchLogsPageSize": int(os.getenv("ANALYZER_SEARCH_LOGS_PAGE_SIZE", "1000")),
+    "esBulkChunkSize":   int(os.getenv("ES_BULK_CHUNK_SIZE", "1000")),
+    "esBulkThreads":     int(os.getenv("ES_BULK_THREADS", "1")),
+    "esRefreshPolicies": json.loads(os.getenv("ES_REFRESH_POLICIES", "{}")),
+    "esAsyncClean":      json.loads(os.getenv("ES_ASYNC_CLEAN", "false").lower()),
+    "cleanMergeDebounceInterval": float(os.getenv("CLEAN_MERGE_DEBOUNCE_INTERVAL", "5")),
+    "cleanMergeMaxDelay": float(os.getenv("CLEAN_MERGE_MAX_DELAY", "60")),
+    "esSharedClient":    json.loads(os.getenv("ES_SHARED_CLIENT", "true").lower()),
+    "esConnectionPoolSize": int(os.getenv("ES_CONNECTION_POOL_SIZE", "20")),
+    "esHttpCompress":    json.loads(os.getenv("ES_HTTP_COMPRESS", "true").lower()),
+    "metricsDir":        os.getenv("ANALYZER_METRICS_DIR", ""),
 }
 
 SEARCH_CONFIG = {
@@ -95,6 +135,11 @@ def create_thread(func, args):
     return thread
 
 
+def get_consumers_number(queue):
+    """Gets the number of concurrent consumers for the queue"""
+    return int(APP_CONFIG["amqpConsumers"].get(queue, APP_CONFIG["amqpDefaultConsumers"]))
+
+
 def declare_exchange(channel, config):
     """Declares exchange for rabbitmq"""
     logger.info("ExchangeName: %s", config["exchangeName"])
@@ -115,6 +160,115 @@ def declare_exchange(channel, config):
     return True
 
 
+def get_service(services, queue, service_class):
+    """Gets a service for processing a message. Preloaded services keep no state
+    of a request, so they are shared by all messages together with loaded models"""
+    if queue in services:
+        return services[queue]
+    return service_class(APP_CONFIG, SEARCH_CONFIG)
+
+
+def preload_analysis_services():
+    """Creates services for analysis queues, which load models before workers are forked"""
+    return {
+        "analyze": AutoAnalyzerService(APP_CONFIG, SEARCH_CONFIG),
+        "suggest": SuggestService(APP_CONFIG, SEARCH_CONFIG),
+        "cluster": ClusterService(APP_CONFIG, SEARCH_CONFIG)}
+
+
+def get_analyze_handler(services):
+    """Gets the handler of analyze requests, when the scheduler is turned on,
+    requests are split into chunks, which are analyzed in turn by projects"""
+    if APP_CONFIG["schedulerWorkers"] <= 0:
+        return lambda launches: get_service(
+            services, "analyze", AutoAnalyzerService).analyze_logs(launches)
+    scheduler = AnalysisScheduler(
+        lambda launches, context, state: get_service(
+            services, "analyze", AutoAnalyzerService).analyze_logs(launches, context=context, state=state),
+        state_factory=AnalysisState,
+        finish_func=lambda state: get_service(
+            services, "analyze", AutoAnalyzerService).send_stats_info(state),
+        workers_number=APP_CONFIG["schedulerWorkers"],
+        chunk_size=APP_CONFIG["schedulerChunkSize"],
+        project_weights=APP_CONFIG["projectWeights"],
+        max_project_concurrency=APP_CONFIG["projectMaxConcurrency"],
+        project_concurrency=APP_CONFIG["projectConcurrency"])
+    return scheduler.analyze_logs
+
+
+def init_analysis_amqp(services):
+    """Starts threads for processing analyze, suggest and cluster queues messages"""
+    threads = []
+    analyze_handler = get_analyze_handler(services)
+    threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
+                   (APP_CONFIG["exchangeName"], "analyze", True, False,
+                   lambda channel, method, props, body:
+                   amqp_handler.handle_amqp_request(channel, method, props, body,
+                                                    analyze_handler,
+                                                    prepare_data_func=lambda body:
+                                                    amqp_handler.prepare_launches_stream(
+                                                        body, APP_CONFIG["trustedPayloads"],
+                                                        APP_CONFIG["launchStreamMinSize"]),
+                                                    prepare_response_data=amqp_handler.
+                                                    prepare_analyze_response_data,
+                                                    decode_body=False),
+                   get_consumers_number("analyze"))))
+    threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
+                   (APP_CONFIG["exchangeName"], "suggest", True, False,
+                   lambda channel, method, props, body:
+                   amqp_handler.handle_amqp_request(channel, method, props, body,
+                                                    get_service(
+                                                        services, "suggest",
+                                                        SuggestService).suggest_items,
+                                                    prepare_data_func=lambda test_item_info:
+                                                    amqp_handler.prepare_test_item_info(
+                                                        test_item_info, APP_CONFIG["trustedPayloads"]),
+                                                    prepare_response_data=amqp_handler.
+                                                    prepare_analyze_response_data),
+                   get_consumers_number("suggest"))))
+    threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
+                   (APP_CONFIG["exchangeName"], "cluster", True, False,
+                   lambda channel, method, props, body:
+                   amqp_handler.handle_amqp_request(channel, method, props, body,
+                                                    get_service(
+                                                        services, "cluster",
+                                                        ClusterService).find_clusters,
+                                                    prepare_data_func=amqp_handler.
+                                                    prepare_launch_info,
+                                                    prepare_response_data=amqp_handler.
+                                                    prepare_analyze_response_data),
+                   get_consumers_number("cluster"))))
+    return threads
+
+
+def close_process_resources():
+    """Flushes buffered data of the process, atexit handlers are not called,
+    when the process is stopped by a signal or a forked worker exits"""
+    stats_sink.close_sinks()
+    merge_scheduler.close_schedulers()
+    amqp.close_publishers()
+
+
+def run_worker(worker_id):
+    """Runs consumers of analysis queues in a forked worker process"""
+    logger.info("Worker %d has started pid(%d)", worker_id, os.getpid())
+    metrics.registry.reset()
+    signal(SIGTERM, lambda signal_received, frame: exit(0))
+    try:
+        while True:
+            try:
+                threads = init_analysis_amqp(analysis_services)
+                break
+            except Exception as err:
+                logger.error("Amqp connection was not established in the worker %d", worker_id)
+                logger.error(err)
+                time.sleep(10)
+        for thread in threads:
+            thread.join()
+    finally:
+        close_process_resources()
+
+
 def init_amqp(_amqp_client):
     """Initialize rabbitmq queues, exchange and stars threads for queue messages processing"""
     with _amqp_client.connection.channel() as channel:
@@ -127,30 +281,30 @@ def init_amqp(_amqp_client):
     threads = []
     es_client = EsClient(APP_CONFIG, SEARCH_CONFIG)
     if APP_CONFIG["instanceTaskType"] == "train":
+        # training modules are heavy, so they are imported only by the training instance
+        from service.retraining_service import RetrainingService
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "train_models", True, False,
                        lambda channel, method, props, body:
                        amqp_handler.handle_inner_amqp_request(channel, method, props, body,
                                                               RetrainingService(
                                                                   APP_CONFIG,
-                                                                  SEARCH_CONFIG).train_models))))
+                                                                  SEARCH_CONFIG).train_models),
+                       get_consumers_number("train_models"))))
     else:
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "index", True, False,
                        lambda channel, method, props, body:
                        amqp_handler.handle_amqp_request(channel, method, props, body,
                                                         es_client.index_logs,
+                                                        prepare_data_func=lambda body:
+                                                        amqp_handler.prepare_launches_stream(
+                                                            body, APP_CONFIG["trustedPayloads"],
+                                                            APP_CONFIG["launchStreamMinSize"]),
                                                         prepare_response_data=amqp_handler.
-                                                        prepare_index_response_data))))
-        threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
-                       (APP_CONFIG["exchangeName"], "analyze", True, False,
-                       lambda channel, method, props, body:
-                       amqp_handler.handle_amqp_request(channel, method, props, body,
-                                                        AutoAnalyzerService(
-                                                            APP_CONFIG,
-                                                            SEARCH_CONFIG).analyze_logs,
-                                                        prepare_response_data=amqp_handler.
-                                                        prepare_analyze_response_data))))
+                                                        prepare_index_response_data,
+                                                        decode_body=False),
+                       get_consumers_number("index"))))
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "delete", True, False,
                        lambda channel, method, props, body:
@@ -160,7 +314,8 @@ def init_amqp(_amqp_client):
                                                         prepare_data_func=amqp_handler.
                                                         prepare_delete_index,
                                                         prepare_response_data=amqp_handler.
-                                                        output_result))))
+                                                        output_result),
+                       get_consumers_number("delete"))))
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "clean", True, False,
                        lambda channel, method, props, body:
@@ -169,7 +324,8 @@ def init_amqp(_amqp_client):
                                                         prepare_data_func=amqp_handler.
                                                         prepare_clean_index,
                                                         prepare_response_data=amqp_handler.
-                                                        output_result))))
+                                                        output_result),
+                       get_consumers_number("clean"))))
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "search", True, False,
                        lambda channel, method, props, body:
@@ -178,39 +334,25 @@ def init_amqp(_amqp_client):
                                                         prepare_data_func=amqp_handler.
                                                         prepare_search_logs,
                                                         prepare_response_data=amqp_handler.
-                                                        prepare_analyze_response_data))))
-        threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
-                       (APP_CONFIG["exchangeName"], "suggest", True, False,
-                       lambda channel, method, props, body:
-                       amqp_handler.handle_amqp_request(channel, method, props, body,
-                                                        SuggestService(
-                                                            APP_CONFIG, SEARCH_CONFIG).suggest_items,
-                                                        prepare_data_func=amqp_handler.
-                                                        prepare_test_item_info,
-                                                        prepare_response_data=amqp_handler.
-                                                        prepare_analyze_response_data))))
-        threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
-                       (APP_CONFIG["exchangeName"], "cluster", True, False,
-                       lambda channel, method, props, body:
-                       amqp_handler.handle_amqp_request(channel, method, props, body,
-                                                        ClusterService(
-                                                            APP_CONFIG, SEARCH_CONFIG).find_clusters,
-                                                        prepare_data_func=amqp_handler.
-                                                        prepare_launch_info,
-                                                        prepare_response_data=amqp_handler.
-                                                        prepare_analyze_response_data))))
+                                                        prepare_analyze_response_data),
+                       get_consumers_number("search"))))
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "stats_info", True, False,
                        lambda channel, method, props, body:
                        amqp_handler.handle_inner_amqp_request(channel, method, props, body,
-                                                              es_client.send_stats_info))))
+                                                              es_client.send_stats_info),
+                       get_consumers_number("stats_info"))))
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "namespace_finder", True, False,
                        lambda channel, method, props, body:
                        amqp_handler.handle_amqp_request(channel, method, props, body,
                                                         NamespaceFinderService(
                                                             APP_CONFIG,
-                                                            SEARCH_CONFIG).update_chosen_namespaces))))
+                                                            SEARCH_CONFIG).update_chosen_namespaces,
+                                                        prepare_data_func=lambda launches:
+                                                        amqp_handler.prepare_launches(
+                                                            launches, APP_CONFIG["trustedPayloads"])),
+                       get_consumers_number("namespace_finder"))))
         threads.append(create_thread(AmqpClient(APP_CONFIG["amqpUrl"]).receive,
                        (APP_CONFIG["exchangeName"], "suggest_patterns", True, False,
                        lambda channel, method, props, body:
@@ -221,7 +363,10 @@ def init_amqp(_amqp_client):
                                                         prepare_data_func=amqp_handler.
                                                         prepare_delete_index,
                                                         prepare_response_data=amqp_handler.
-                                                        prepare_index_response_data))))
+                                                        prepare_index_response_data),
+                       get_consumers_number("suggest_patterns"))))
+        if not analysis_in_worker_processes:
+            threads.extend(init_analysis_amqp({}))
 
     return threads
 
@@ -254,6 +399,7 @@ else:
     logging.disable(logging.INFO)
 logger = logging.getLogger("analyzerApp")
 APP_CONFIG["appVersion"] = read_version()
+metrics.registry.set_multiprocess_dir(APP_CONFIG["metricsDir"])
 es_client = EsClient(APP_CONFIG, SEARCH_CONFIG)
 read_model_settings()
 
@@ -273,7 +419,32 @@ def get_health_status():
     return jsonify({"status": "healthy"})
 
 
+@application.route('/ready', methods=['GET'])
+def get_ready_status():
+    if not analyzer_ready.is_set():
+        return Response(json.dumps({"status": "starting"}), status=503, mimetype='application/json')
+    return jsonify({"status": "ready"})
+
+
+@application.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(), status=200, mimetype='text/plain; version=0.0.4')
+
+
+def is_supervising_process():
+    """Checks, whether the process starts worker processes, under uWSGI only the first worker
+    starts them, so the number of worker processes doesn't depend on the number of uWSGI workers"""
+    try:
+        import uwsgi
+    except ImportError:
+        return True
+    return uwsgi.worker_id() == 1
+
+
 def handler(signal_received, frame):
+    if worker_supervisor is not None:
+        worker_supervisor.stop()
+    close_process_resources()
     print('The analyzer has stopped')
     exit(0)
 
@@ -284,26 +455,73 @@ def start_http_server():
     application.run(host='0.0.0.0', port=5001, use_reloader=False)
 
 
-signal(SIGINT, handler)
-threads = []
-logger.info("The analyzer has started")
-while True:
+def warm_up_analyzer(analyzer_service):
+    """Runs a synthetic analysis, so the first analyze request is not slow"""
+    t_start = time.time()
     try:
-        logger.info("Starting waiting for AMQP connection")
+        analyzer_service.warm_up()
+    except Exception as err:
+        logger.error("Failed to warm up the analyzer")
+        logger.error(err)
+    startup_stages.append(("warm-up", time.time() - t_start))
+
+
+def start_analyzer():
+    """Loads models and starts consuming amqp queues, after that the analyzer is ready"""
+    global threads
+    if not analysis_in_worker_processes and APP_CONFIG["instanceTaskType"] != "train":
+        t_start = time.time()
+        model_registry.load_models(SEARCH_CONFIG)
+        startup_stages.append(("models loading", time.time() - t_start))
+        warm_up_analyzer(AutoAnalyzerService(APP_CONFIG, SEARCH_CONFIG))
+    t_start = time.time()
+    while True:
         try:
-            amqp_client = AmqpClient(APP_CONFIG["amqpUrl"])
+            logger.info("Starting waiting for AMQP connection")
+            try:
+                amqp_client = AmqpClient(APP_CONFIG["amqpUrl"])
+            except Exception as err:
+                logger.error("Amqp connection was not established")
+                logger.error(err)
+                time.sleep(10)
+                continue
+            threads = init_amqp(amqp_client)
+            logger.info("Analyzer has started")
+            break
         except Exception as err:
-            logger.error("Amqp connection was not established")
+            logger.error("The analyzer has failed")
             logger.error(err)
-            time.sleep(10)
-            continue
-        threads = init_amqp(amqp_client)
-        logger.info("Analyzer has started")
-        break
-    except Exception as err:
-        logger.error("The analyzer has failed")
-        logger.error(err)
+    startup_stages.append(("amqp connection", time.time() - t_start))
+    analyzer_ready.set()
+    logger.info("The analyzer is ready. Startup time: %s", ", ".join(
+        "%s %.2f sec" % startup_stage for startup_stage in startup_stages))
+
 
+signal(SIGINT, handler)
+signal(SIGTERM, handler)
+threads = []
+analysis_services = {}
+worker_supervisor = None
+analyzer_ready = threading.Event()
+startup_stages = []
+process_uptime = utils.get_process_uptime()
+if process_uptime is not None:
+    startup_stages.append(("imports and configuration", process_uptime))
+analysis_in_worker_processes = APP_CONFIG["workerProcesses"] > 0 and\
+    APP_CONFIG["instanceTaskType"] != "train"
+if analysis_in_worker_processes and is_supervising_process():
+    # the supervisor process is forked before other threads are started
+    t_start_models = time.time()
+    analysis_services = preload_analysis_services()
+    startup_stages.append(("models loading", time.time() - t_start_models))
+    logger.info("Loaded models: %s", model_registry.get_models_info())
+    warm_up_analyzer(analysis_services["analyze"])
+    worker_supervisor = WorkerSupervisor(APP_CONFIG["workerProcesses"], run_worker)
+    worker_supervisor.start()
+logger.info("The analyzer has started")
+startup_thread = threading.Thread(target=start_analyzer)
+startup_thread.daemon = True
+startup_thread.start()
 
 if __name__ == '__main__':
     logger.info("Program started")
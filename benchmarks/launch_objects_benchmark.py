@@ -0,0 +1,82 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import argparse
+import json
+from time import time
+from amqp import amqp_handler
+
+# This file compares decoding cost of launches with validated and trusted objects,
+# run it from the project folder: python -m benchmarks.launch_objects_benchmark
+
+
+def generate_launches(logs_number, logs_per_test_item=10):
+    test_items = []
+    for i in range(logs_number // logs_per_test_item):
+        test_items.append({
+            "testItemId": i,
+            "uniqueId": "auto:%d" % i,
+            "isAutoAnalyzed": False,
+            "issueType": "ti001",
+            "originalIssueType": "ti001",
+            "logs": [{"logId": i * logs_per_test_item + j,
+                      "logLevel": 40000 if j % 2 == 0 else 20000,
+                      "message": "java.lang.AssertionError: expected [%d] but found [%d]\n"
+                                 "\tat org.testng.Assert.fail(Assert.java:94)" % (i, j)}
+                     for j in range(logs_per_test_item)]})
+    return [{"launchId": 1, "project": 1, "launchName": "Launch",
+             "analyzerConfig": {"numberOfLogLines": -1}, "testItems": test_items}]
+
+
+def decode_whole(body, trusted):
+    for launch in amqp_handler.prepare_launches(json.loads(body, strict=False), trusted=trusted):
+        for test_item in launch.testItems:
+            pass
+
+
+def decode_stream(body, trusted):
+    for launch in amqp_handler.prepare_launches_stream(body, trusted=trusted, min_stream_size=1):
+        for test_item in launch.testItems:
+            pass
+
+
+def measure(func, body, trusted, repeats):
+    best_time = None
+    for _ in range(repeats):
+        t_start = time()
+        func(body, trusted)
+        time_spent = time() - t_start
+        best_time = time_spent if best_time is None else min(best_time, time_spent)
+    return best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares decoding cost of launches")
+    parser.add_argument("--logs", type=int, default=100000, help="number of logs in the payload")
+    parser.add_argument("--repeats", type=int, default=5, help="number of runs, the best one is taken")
+    args = parser.parse_args()
+
+    body = json.dumps(generate_launches(args.logs)).encode("utf-8")
+    print("Payload: %d logs, %.2f MB" % (args.logs, len(body) / (1024 * 1024)))
+    for name, func in [("json.loads + objects", decode_whole), ("stream", decode_stream)]:
+        for trusted in [False, True]:
+            time_spent = measure(func, body, trusted, args.repeats)
+            print("%-22s %-9s %.4f sec per 10k logs" % (
+                name, "trusted" if trusted else "validated", time_spent * 10000 / args.logs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+from time import time, sleep
+from types import SimpleNamespace
+import pika
+from elasticsearch.serializer import JSONSerializer
+from amqp import amqp_handler
+from commons import metrics
+from commons import merge_scheduler
+from commons.esclient import EsClient
+from service.auto_analyzer_service import AutoAnalyzerService
+from service.suggest_service import SuggestService
+from service.search_service import SearchService
+from utils import utils
+
+# This file replays recorded amqp requests through amqp handlers with a fake channel
+# and a fake Elasticsearch client, which serves recorded responses, so no services are needed.
+# Run it from the project folder: python -m benchmarks.replay_benchmark
+#
+# --requests is a file with json lines like {"routing_key": "analyze", "body": [...]},
+# supported routing keys are "analyze", "suggest", "index", "clean" and "search".
+# --responses is a json file like {"search": {...}, "msearch": {...}, "scan": {...}}, where
+# "msearch" is the response for each query of msearch requests and "scan" is the response
+# for scrolled searches. Without these files requests and responses are made from fixtures.
+# The replay fails, if a handler logs an error or doesn't process a request.
+
+STAGE_METRICS = [
+    ("msearch", metrics.ES_MSEARCH_DURATION),
+    ("featurization", metrics.FEATURIZATION_DURATION),
+    ("model predict", metrics.MODEL_PREDICT_DURATION),
+    ("bulk indexing", metrics.ES_BULK_DURATION),
+]
+EMPTY_SEARCH_RESPONSE = {"took": 1, "timed_out": False, "hits": {"total": 0, "max_score": None, "hits": []}}
+
+
+class FakeChannel:
+    """FakeChannel keeps published replies in memory"""
+
+    def __init__(self):
+        self.published = 0
+
+    def basic_publish(self, **kwargs):
+        self.published += 1
+
+
+class ErrorRecorder(logging.Handler):
+    """ErrorRecorder keeps errors logged by handlers, so a replay with errors fails"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+    def check(self, description):
+        if self.messages:
+            messages, self.messages = self.messages, []
+            raise RuntimeError("Errors were logged by %s: %s" % (description, "; ".join(messages)))
+
+
+class FakeIndices:
+
+    def exists(self, index, **kwargs):
+        return True
+
+    def get(self, index, **kwargs):
+        return {str(index): {}}
+
+    def create(self, index, **kwargs):
+        return {"acknowledged": True, "index": str(index)}
+
+    def put_mapping(self, **kwargs):
+        return {"acknowledged": True}
+
+    def put_settings(self, **kwargs):
+        return {"acknowledged": True}
+
+    def delete(self, index, **kwargs):
+        return {"acknowledged": True}
+
+
+class FakeCluster:
+
+    def health(self, **kwargs):
+        return {"status": "green"}
+
+
+class FakeCat:
+
+    def indices(self, **kwargs):
+        return []
+
+
+class FakeTasks:
+
+    def get(self, task_id=None, **kwargs):
+        return {"completed": True, "task": {"id": task_id}, "response": {"deleted": 0, "failures": []}}
+
+
+class FakeElasticsearch:
+    """FakeElasticsearch serves recorded responses with an optional latency"""
+
+    def __init__(self, responses, latency=0.0):
+        self.responses = responses
+        self.latency = latency
+        self.indices = FakeIndices()
+        self.cluster = FakeCluster()
+        self.cat = FakeCat()
+        self.tasks = FakeTasks()
+        # bulk helpers serialize actions with the serializer of the client transport
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+
+    def wait(self):
+        if self.latency > 0:
+            sleep(self.latency)
+
+    def search(self, index=None, body=None, **kwargs):
+        self.wait()
+        if "scroll" in kwargs:
+            return dict(self.responses.get("scan", EMPTY_SEARCH_RESPONSE), _scroll_id="benchmark")
+        if body is not None and "aggs" in body:
+            return dict(EMPTY_SEARCH_RESPONSE, aggregations=get_terms_aggregations(body))
+        return self.responses.get("search", EMPTY_SEARCH_RESPONSE)
+
+    def msearch(self, body, **kwargs):
+        self.wait()
+        queries_number = len([line for line in body.split("\n") if line.strip()]) // 2
+        return {"responses": [self.responses.get("msearch", EMPTY_SEARCH_RESPONSE)] * queries_number}
+
+    def scroll(self, **kwargs):
+        return {"_scroll_id": "benchmark", "hits": {"hits": []}}
+
+    def clear_scroll(self, **kwargs):
+        return {}
+
+    def bulk(self, body, **kwargs):
+        self.wait()
+        items = []
+        lines = iter(line for line in body.split("\n") if line.strip())
+        for line in lines:
+            op_type, meta = list(json.loads(line).items())[0]
+            if op_type != "delete":
+                next(lines, None)
+            items.append({op_type: {"status": 200, "_id": str(meta.get("_id", len(items)))}})
+        return {"took": 1, "errors": False, "items": items}
+
+    def delete_by_query(self, index, body, **kwargs):
+        self.wait()
+        if kwargs.get("wait_for_completion") is False:
+            return {"task": "benchmark:%d" % len(json.dumps(body))}
+        return {"took": 1, "deleted": 0, "version_conflicts": 0, "failures": []}
+
+    def update_by_query(self, index, body, **kwargs):
+        self.wait()
+        return {"took": 1, "updated": 0, "version_conflicts": 0, "failures": []}
+
+    def delete(self, index, id, **kwargs):
+        return {"result": "deleted", "_id": id}
+
+
+def get_terms_aggregations(body):
+    """Makes buckets of terms aggregations from values of terms filters on the same fields"""
+    filters = body.get("query", {}).get("bool", {}).get("filter", [])
+    terms = {}
+    for query_filter in filters if isinstance(filters, list) else [filters]:
+        terms.update(query_filter.get("terms", {}))
+    aggregations = {}
+    for name, aggregation in body["aggs"].items():
+        values = terms.get(aggregation.get("terms", {}).get("field"), [])
+        aggregations[name] = {"buckets": [{"key": value, "doc_count": 1} for value in values]}
+    return aggregations
+
+
+def create_configs(storage_folder):
+    model_settings = utils.read_json_file("", "model_settings.json", to_json=True)
+    app_config = {
+        "esHost": "http://localhost:9200",
+        "esVerifyCerts": False,
+        "esUseSsl": False,
+        "esSslShowWarn": False,
+        "esCAcert": "",
+        "esClientCert": "",
+        "esClientKey": "",
+        "appVersion": "benchmark",
+        "minioRegion": "",
+        "minioBucketPrefix": "",
+        "binaryStoreType": "filesystem",
+        "filesystemDefaultPath": storage_folder,
+        "amqpUrl": "",
+        "esAsyncClean": True,
+    }
+    search_config = {
+        "MinShouldMatch": "80%",
+        "BoostAA": -8.0,
+        "BoostLaunch": 4.0,
+        "BoostUniqueID": 8.0,
+        "MaxQueryTerms": 50,
+        "SearchLogsMinShouldMatch": "98%",
+        "SearchLogsMinSimilarity": 0.9,
+        "MinWordLength": 2,
+        "BoostModelFolder": model_settings["BOOST_MODEL_FOLDER"],
+        "SimilarityWeightsFolder": model_settings["SIMILARITY_WEIGHTS_FOLDER"],
+        "SuggestBoostModelFolder": model_settings["SUGGEST_BOOST_MODEL_FOLDER"],
+        "GlobalDefectTypeModelFolder": model_settings["GLOBAL_DEFECT_TYPE_MODEL_FOLDER"],
+    }
+    return app_config, search_config
+
+
+def create_handlers(app_config, search_config, fake_es):
+    """Creates amqp handlers like the analyzer does, services use the fake Elasticsearch"""
+    analyzer_service = AutoAnalyzerService(app_config, search_config)
+    suggest_service = SuggestService(app_config, search_config)
+    search_service = SearchService(app_config, search_config)
+    es_client = EsClient(app_config, search_config)
+    for service in [analyzer_service, suggest_service, search_service]:
+        service.es_client.es_client = fake_es
+    es_client.es_client = fake_es
+    return {
+        "analyze": lambda channel, method, props, body: amqp_handler.handle_amqp_request(
+            channel, method, props, body, analyzer_service.analyze_logs,
+            prepare_data_func=amqp_handler.prepare_launches_stream,
+            prepare_response_data=amqp_handler.prepare_analyze_response_data,
+            decode_body=False),
+        "suggest": lambda channel, method, props, body: amqp_handler.handle_amqp_request(
+            channel, method, props, body, suggest_service.suggest_items,
+            prepare_data_func=amqp_handler.prepare_test_item_info,
+            prepare_response_data=amqp_handler.prepare_analyze_response_data),
+        "index": lambda channel, method, props, body: amqp_handler.handle_amqp_request(
+            channel, method, props, body, es_client.index_logs,
+            prepare_data_func=amqp_handler.prepare_launches_stream,
+            prepare_response_data=amqp_handler.prepare_index_response_data,
+            decode_body=False),
+        "clean": lambda channel, method, props, body: amqp_handler.handle_amqp_request(
+            channel, method, props, body, es_client.delete_logs,
+            prepare_data_func=amqp_handler.prepare_clean_index,
+            prepare_response_data=amqp_handler.output_result),
+        "search": lambda channel, method, props, body: amqp_handler.handle_amqp_request(
+            channel, method, props, body, search_service.search_logs,
+            prepare_data_func=amqp_handler.prepare_search_logs,
+            prepare_response_data=amqp_handler.prepare_analyze_response_data),
+    }
+
+
+def get_default_requests():
+    launches = utils.get_fixture("launch_w_test_items_w_logs.json", to_json=True)
+    test_item = launches[0]["testItems"][0]
+    test_item_info = {
+        "testItemId": test_item["testItemId"], "uniqueId": test_item["uniqueId"], "testCaseHash": 1,
+        "launchId": launches[0]["launchId"], "launchName": launches[0]["launchName"],
+        "project": launches[0]["project"], "logs": test_item["logs"]}
+    clean_index = {"ids": [log["logId"] for log in test_item["logs"]], "project": launches[0]["project"]}
+    return [{"routing_key": "analyze", "body": launches},
+            {"routing_key": "suggest", "body": test_item_info},
+            {"routing_key": "index", "body": launches},
+            {"routing_key": "clean", "body": clean_index}]
+
+
+def get_default_responses():
+    search_response = utils.get_fixture("two_hits_search_rs.json", to_json=True)
+    return {"search": search_response, "msearch": search_response}
+
+
+def read_requests(file_name):
+    requests = []
+    with open(file_name, "r") as file:
+        for line in file:
+            if line.strip():
+                requests.append(json.loads(line))
+    return requests
+
+
+def percentile(values, percent):
+    """Gets the percentile by the nearest rank method"""
+    sorted_values = sorted(values)
+    rank = max(int(round(percent / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def get_stage_totals():
+    totals = {}
+    for stage, histogram in STAGE_METRICS:
+        with histogram.lock:
+            totals[stage] = (sum(value["sum"] for value in histogram.values.values()),
+                             sum(value["count"] for value in histogram.values.values()))
+    return totals
+
+
+def replay(handlers, requests, iterations, error_recorder):
+    latencies = {}
+    total_times = {}
+    channel = FakeChannel()
+    for iteration in range(iterations):
+        for i, request in enumerate(requests):
+            routing_key = request["routing_key"]
+            if routing_key not in handlers:
+                continue
+            body = request["body"]
+            if not isinstance(body, str):
+                body = json.dumps(body)
+            props = pika.BasicProperties(reply_to="benchmark", correlation_id="%d-%d" % (iteration, i),
+                                         content_type=amqp_handler.JSON_CONTENT_TYPE)
+            t_start = time()
+            processed = handlers[routing_key](channel, SimpleNamespace(routing_key=routing_key), props,
+                                              body.encode("utf-8"))
+            time_spent = time() - t_start
+            error_recorder.check("the %s request %d" % (routing_key, i))
+            if processed is False:
+                raise RuntimeError("The %s request %d wasn't processed" % (routing_key, i))
+            latencies.setdefault(routing_key, []).append(time_spent)
+            total_times[routing_key] = total_times.get(routing_key, 0.0) + time_spent
+    return latencies, total_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays amqp requests with a fake Elasticsearch")
+    parser.add_argument("--requests", help="file with recorded requests in json lines")
+    parser.add_argument("--responses", help="json file with recorded Elasticsearch responses")
+    parser.add_argument("--iterations", type=int, default=20, help="number of times requests are replayed")
+    parser.add_argument("--es-latency", type=float, default=0.0,
+                        help="simulated latency of Elasticsearch requests in seconds")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    error_recorder = ErrorRecorder()
+    logging.getLogger().addHandler(error_recorder)
+
+    requests = read_requests(args.requests) if args.requests else get_default_requests()
+    responses = utils.read_json_file("", args.responses, to_json=True)\
+        if args.responses else get_default_responses()
+    with tempfile.TemporaryDirectory() as storage_folder:
+        app_config, search_config = create_configs(storage_folder)
+        handlers = create_handlers(app_config, search_config, FakeElasticsearch(responses, args.es_latency))
+        # the first replay loads lazily imported modules, so it is not measured
+        replay(handlers, requests, 1, error_recorder)
+        stage_totals_before = get_stage_totals()
+        latencies, total_times = replay(handlers, requests, args.iterations, error_recorder)
+        stage_totals_after = get_stage_totals()
+        # logs of cleaned test items are merged in the background
+        merge_scheduler.close_schedulers()
+        error_recorder.check("merging logs after clean requests")
+
+    print("%-10s %8s %10s %10s %10s %10s" % ("key", "requests", "rps", "p50 ms", "p95 ms", "p99 ms"))
+    for routing_key in sorted(latencies):
+        values = latencies[routing_key]
+        requests_per_second = len(values) / total_times[routing_key] if total_times[routing_key] else 0
+        print("%-10s %8d %10.1f %10.2f %10.2f %10.2f" % (
+            routing_key, len(values), requests_per_second,
+            percentile(values, 50) * 1000, percentile(values, 95) * 1000, percentile(values, 99) * 1000))
+    print()
+    print("%-14s %10s %10s %12s" % ("stage", "calls", "total s", "mean ms"))
+    for stage, _ in STAGE_METRICS:
+        stage_time = stage_totals_after[stage][0] - stage_totals_before[stage][0]
+        stage_calls = stage_totals_after[stage][1] - stage_totals_before[stage][1]
+        print("%-14s %10d %10.3f %12.3f" % (
+            stage, stage_calls, stage_time, stage_time / stage_calls * 1000 if stage_calls else 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,8 +14,6 @@
 * limitations under the License.
 """
 
-from xgboost import XGBClassifier
-from sklearn.metrics import classification_report, confusion_matrix
 import os
 import pickle
 import logging
@@ -35,6 +33,7 @@ class BoostingDecisionMaker:
             monotonous_features)
         self.is_global = is_global
         if not folder.strip():
+            from xgboost import XGBClassifier
             self.xg_boost = XGBClassifier(n_estimators=n_estimators,
                                           max_depth=max_depth,
                                           random_state=43)
@@ -77,6 +76,7 @@ class BoostingDecisionMaker:
         mon_features = [
             (1 if feature in self.monotonous_features else 0) for feature in self.get_feature_ids()]
         mon_features_prepared = "(" + ",".join([str(f) for f in mon_features]) + ")"
+        from xgboost import XGBClassifier
         self.xg_boost = XGBClassifier(n_estimators=self.n_estimators,
                                       max_depth=self.max_depth, random_state=43,
                                       monotone_constraints=mon_features_prepared)
@@ -85,6 +85,7 @@ class BoostingDecisionMaker:
         logger.info("Feature importances: ", self.xg_boost.feature_importances_)
 
     def validate_model(self, valid_test_set, valid_test_labels):
+        from sklearn.metrics import classification_report, confusion_matrix
         res, res_prob = self.predict(valid_test_set)
         logger.info("Valid dataset F1 score: ",
                     self.xg_boost.score(valid_test_set, valid_test_labels))
@@ -14,12 +14,7 @@
 * limitations under the License.
 """
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import f1_score, accuracy_score
-from sklearn.metrics import classification_report, confusion_matrix
 from utils import utils
-import pandas as pd
 import os
 import pickle
 from collections import Counter
@@ -56,6 +51,9 @@ class DefectTypeModel:
         pickle.dump(self.models, open(os.path.join(folder, "models.pickle"), "wb"))
 
     def train_model(self, name, train_data_x, labels):
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.ensemble import RandomForestClassifier
         self.count_vectorizer_models[name] = TfidfVectorizer(
             binary=True, stop_words="english", min_df=5,
             token_pattern=r"[\w\._]+", analyzer=utils.preprocess_words)
@@ -74,6 +72,8 @@ class DefectTypeModel:
             self.train_model(name, train_data_x, labels)
 
     def validate_model(self, name, test_data_x, labels):
+        from sklearn.metrics import f1_score, accuracy_score
+        from sklearn.metrics import classification_report, confusion_matrix
         assert name in self.models
         print("Label distribution:", Counter(labels))
         print("Model name: %s" % name)
@@ -101,6 +101,7 @@ class DefectTypeModel:
         assert model_name in self.models
         if len(data) == 0:
             return [], []
+        import pandas as pd
         transformed_values = self.count_vectorizer_models[model_name].transform(data)
         x_test_values = pd.DataFrame(
             transformed_values.toarray(),
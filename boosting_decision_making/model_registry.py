@@ -0,0 +1,91 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import logging
+import threading
+from time import time
+from utils import utils
+from boosting_decision_making import boosting_decision_maker, defect_type_model
+from boosting_decision_making import weighted_similarity_calculator
+
+logger = logging.getLogger("analyzerApp.modelRegistry")
+
+
+class ModelRegistry:
+    """ModelRegistry loads each model folder once per process
+    and hands out the same instances, which should be used read-only"""
+
+    def __init__(self):
+        self.models = {}
+        self.models_info = {}
+        self.lock = threading.Lock()
+        self.loading_lock = threading.Lock()
+
+    def get_model(self, model_class, folder):
+        """Gets a loaded model, the model is loaded on the first call"""
+        key = (model_class.__name__, folder)
+        with self.lock:
+            if key in self.models:
+                return self.models[key]
+        # models are loaded one by one, so the memory difference belongs to the loaded model
+        with self.loading_lock:
+            with self.lock:
+                if key in self.models:
+                    return self.models[key]
+            t_start = time()
+            memory_before = utils.get_process_memory()
+            model = model_class(folder=folder)
+            model_info = {
+                "model_class": model_class.__name__,
+                "folder": folder,
+                "load_time": round(time() - t_start, 3),
+                "memory_mb": round(
+                    max(0, utils.get_process_memory() - memory_before) / (1024 * 1024), 2)}
+            with self.lock:
+                self.models[key] = model
+                self.models_info[key] = model_info
+        logger.info("Loaded %s from '%s'. It took %.2f sec and %.2f MB",
+                    model_info["model_class"], folder,
+                    model_info["load_time"], model_info["memory_mb"])
+        return model
+
+    def get_boosting_decision_maker(self, folder):
+        return self.get_model(boosting_decision_maker.BoostingDecisionMaker, folder)
+
+    def get_weighted_similarity_calculator(self, folder):
+        return self.get_model(weighted_similarity_calculator.WeightedSimilarityCalculator, folder)
+
+    def get_defect_type_model(self, folder):
+        return self.get_model(defect_type_model.DefectTypeModel, folder)
+
+    def load_models(self, search_cfg):
+        """Loads all models from the model settings"""
+        if search_cfg["BoostModelFolder"].strip():
+            self.get_boosting_decision_maker(search_cfg["BoostModelFolder"])
+        if search_cfg["SuggestBoostModelFolder"].strip():
+            self.get_boosting_decision_maker(search_cfg["SuggestBoostModelFolder"])
+        if search_cfg["SimilarityWeightsFolder"].strip():
+            self.get_weighted_similarity_calculator(search_cfg["SimilarityWeightsFolder"])
+        if search_cfg["GlobalDefectTypeModelFolder"].strip():
+            self.get_defect_type_model(search_cfg["GlobalDefectTypeModelFolder"])
+
+    def get_models_info(self):
+        """Gets load time and memory of each loaded model"""
+        with self.lock:
+            return [dict(info) for info in self.models_info.values()]
+
+
+model_registry = ModelRegistry()
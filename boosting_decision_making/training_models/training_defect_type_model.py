@@ -14,7 +14,8 @@
 * limitations under the License.
 """
 
-from boosting_decision_making import defect_type_model, custom_defect_type_model
+from boosting_decision_making import custom_defect_type_model
+from boosting_decision_making.model_registry import model_registry
 from sklearn.model_selection import train_test_split
 from commons.esclient import EsClient
 from utils import utils
@@ -37,8 +38,8 @@ class DefectTypeModelTraining:
         self.search_cfg = search_cfg
         self.label2inds = {"ab": 0, "pb": 1, "si": 2}
         self.es_client = EsClient(app_config=app_config, search_cfg=search_cfg)
-        self.baseline_model = defect_type_model.DefectTypeModel(
-            folder=search_cfg["GlobalDefectTypeModelFolder"])
+        self.baseline_model = model_registry.get_defect_type_model(
+            search_cfg["GlobalDefectTypeModelFolder"])
 
     def return_similar_objects_into_sample(self, x_train_ind, y_train, data, additional_logs, label):
         x_train = []
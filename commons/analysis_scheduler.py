@@ -0,0 +1,212 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import logging
+import threading
+from collections import deque
+from commons.request_context import RequestContext
+
+logger = logging.getLogger("analyzerApp.analysisScheduler")
+
+
+class AnalysisRequest:
+    """AnalysisRequest gathers results of chunks of one analyze request,
+    the state is shared by the chunks of the request"""
+
+    def __init__(self, context, state=None):
+        self.context = context
+        self.state = state
+        self.results = []
+        self.chunks_left = 0
+        self.queued_chunks = 0
+        self.all_chunks_added = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def add_chunk(self):
+        with self.lock:
+            self.chunks_left += 1
+
+    def finish_adding_chunks(self):
+        with self.lock:
+            self.all_chunks_added = True
+            if self.chunks_left <= 0:
+                self.done.set()
+
+    def add_results(self, results):
+        with self.lock:
+            self.results.extend(results)
+            self.chunks_left -= 1
+            if self.all_chunks_added and self.chunks_left <= 0:
+                self.done.set()
+
+
+class AnalysisScheduler:
+    """AnalysisScheduler splits analyze requests into chunks of test items and runs them
+    in worker threads. Chunks are taken from projects in turn, a project with a bigger weight
+    gets chunks more often, and a project can't have more than its concurrency limit
+    of chunks running at once. Launches are split lazily, a request has not more than
+    two chunks per worker waiting in the queue.
+    analyze_func is called with the launches of a chunk, the request context and the request
+    state created by state_factory, finish_func is called with the state after all chunks
+    of the request are analyzed"""
+
+    def __init__(self, analyze_func, workers_number=1, chunk_size=100,
+                 project_weights={}, max_project_concurrency=1, project_concurrency={},
+                 timeout=300, max_test_items=4000, state_factory=None, finish_func=None):
+        self.analyze_func = analyze_func
+        self.state_factory = state_factory
+        self.finish_func = finish_func
+        self.max_queued_chunks = 2 * max(1, workers_number)
+        self.chunk_size = max(1, chunk_size)
+        self.project_weights = {str(project): weight for project, weight in project_weights.items()}
+        self.max_project_concurrency = max(1, max_project_concurrency)
+        self.project_concurrency = {
+            str(project): concurrency for project, concurrency in project_concurrency.items()}
+        self.timeout = timeout
+        self.max_test_items = max_test_items
+        self.pending = {}
+        self.running = {}
+        self.virtual_time = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.workers = []
+        for i in range(max(1, workers_number)):
+            worker = threading.Thread(target=self.run, name="analysis-scheduler-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def get_weight(self, project):
+        return max(self.project_weights.get(project, 1), 0.001)
+
+    def get_max_concurrency(self, project):
+        return self.project_concurrency.get(project, self.max_project_concurrency)
+
+    def split_into_chunks(self, launches):
+        """Yields copies of launches with chunks of their test items"""
+        test_items_number = 0
+        for launch in launches:
+            chunk = []
+            for test_item in launch.testItems:
+                if test_items_number >= self.max_test_items:
+                    logger.info("Only first %d test items were taken", self.max_test_items)
+                    break
+                chunk.append(test_item)
+                test_items_number += 1
+                if len(chunk) >= self.chunk_size:
+                    yield launch.copy(update={"testItems": chunk})
+                    chunk = []
+            if chunk:
+                yield launch.copy(update={"testItems": chunk})
+            if test_items_number >= self.max_test_items:
+                break
+
+    def add_chunk(self, project, request, launch):
+        if project not in self.pending:
+            # a project, which starts getting work, shouldn't take turns of projects,
+            # which have been waiting, so it starts from the least virtual time of them
+            active_times = [self.virtual_time[active_project] for active_project in self.virtual_time]
+            self.pending[project] = deque()
+            self.running[project] = 0
+            self.virtual_time[project] = min(active_times) if active_times else 0.0
+        self.pending[project].append((request, launch))
+
+    def take_chunk(self):
+        """Takes a chunk of the project with the least virtual time among projects,
+        which have pending chunks and haven't reached their concurrency limit"""
+        chosen_project = None
+        for project, chunks in self.pending.items():
+            if not chunks or self.running[project] >= self.get_max_concurrency(project):
+                continue
+            if chosen_project is None or self.virtual_time[project] < self.virtual_time[chosen_project]:
+                chosen_project = project
+        if chosen_project is None:
+            return None, None
+        self.virtual_time[chosen_project] += 1.0 / self.get_weight(chosen_project)
+        self.running[chosen_project] += 1
+        chunk = self.pending[chosen_project].popleft()
+        chunk[0].queued_chunks -= 1
+        return chosen_project, chunk
+
+    def finish_chunk(self, project):
+        self.running[project] -= 1
+        if not self.pending[project] and self.running[project] <= 0:
+            del self.pending[project]
+            del self.running[project]
+            del self.virtual_time[project]
+
+    def run(self):
+        while True:
+            with self.condition:
+                project, chunk = self.take_chunk()
+                while chunk is None and not self.stopped:
+                    self.condition.wait()
+                    project, chunk = self.take_chunk()
+                if chunk is None:
+                    return
+                # the request can add the next chunk
+                self.condition.notify_all()
+            request, launch = chunk
+            results = []
+            try:
+                if not request.context.should_stop(time_reserve=5):
+                    results = self.analyze_func([launch], request.context, request.state)
+            except Exception as err:
+                logger.error("Failed to analyze a chunk of project %s", project)
+                logger.error(err)
+            finally:
+                with self.condition:
+                    self.finish_chunk(project)
+                    self.condition.notify_all()
+                request.add_results(results)
+
+    def analyze_logs(self, launches):
+        """Splits launches into chunks, waits until all chunks are analyzed and returns
+        their results. Chunks, which are not started before the deadline, are skipped"""
+        request = AnalysisRequest(RequestContext(self.timeout),
+                                  self.state_factory() if self.state_factory else None)
+        chunks_number = 0
+        for launch in self.split_into_chunks(launches):
+            with self.condition:
+                while request.queued_chunks >= self.max_queued_chunks and\
+                        not request.context.should_stop(time_reserve=5):
+                    self.condition.wait(1)
+                if request.context.should_stop(time_reserve=5):
+                    logger.info("Next chunks were not queued before the deadline")
+                    break
+                request.add_chunk()
+                request.queued_chunks += 1
+                self.add_chunk(str(launch.project), request, launch)
+                self.condition.notify_all()
+            chunks_number += 1
+        request.finish_adding_chunks()
+        logger.info("Analysis request was split into %d chunks", chunks_number)
+        if not request.done.wait(max(0, request.context.time_left())):
+            request.context.cancel()
+            request.done.wait()
+        if chunks_number and self.finish_func is not None:
+            try:
+                self.finish_func(request.state)
+            except Exception as err:
+                logger.error("Failed to finish an analyze request")
+                logger.error(err)
+        return request.results
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
@@ -0,0 +1,113 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import logging
+import threading
+from commons import metrics
+
+logger = logging.getLogger("analyzerApp.batchSizeController")
+
+
+def is_rejection(err):
+    """Checks whether Elasticsearch rejected a request, because its queues are full"""
+    return getattr(err, "status_code", None) == 429 or "es_rejected_execution" in str(err)
+
+
+def is_rejected_response(response):
+    """Checks whether a query of the msearch request was rejected by Elasticsearch"""
+    return response.get("status") == 429 or\
+        "es_rejected_execution" in str(response.get("error", ""))
+
+
+class BatchSizeController:
+    """BatchSizeController chooses the number of queries or documents in one Elasticsearch
+    request: the size grows by increase_step after each full batch processed faster than
+    target_latency, and is cut by decrease_factor after slow batches and rejections.
+    The size is also limited, so a batch is not bigger than max_payload_bytes"""
+
+    def __init__(self, name, min_size=1, max_size=1, initial_size=None, target_latency=1.0,
+                 increase_step=None, decrease_factor=0.5, max_payload_bytes=0):
+        self.name = name
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = self.min_size if initial_size is None else\
+            min(self.max_size, max(self.min_size, initial_size))
+        self.target_latency = target_latency
+        self.increase_step = self.min_size if increase_step is None else increase_step
+        self.decrease_factor = decrease_factor
+        self.max_payload_bytes = max_payload_bytes
+        self.bytes_per_item = 0.0
+        self.lock = threading.Lock()
+        metrics.ES_BATCH_SIZE.set(self.size, controller=self.name)
+
+    @property
+    def batch_size(self):
+        return self.size
+
+    def limit_by_payload(self, size):
+        if not self.max_payload_bytes or not self.bytes_per_item:
+            return size
+        return min(size, max(self.min_size, int(self.max_payload_bytes / self.bytes_per_item)))
+
+    def set_size(self, size, decision):
+        old_size = self.size
+        self.size = self.limit_by_payload(min(self.max_size, max(self.min_size, int(size))))
+        metrics.ES_BATCH_SIZE.set(self.size, controller=self.name)
+        metrics.ES_BATCH_SIZE_DECISIONS.inc(controller=self.name, decision=decision)
+        if old_size != self.size:
+            logger.debug("Batch size of %s changed from %d to %d after %s",
+                         self.name, old_size, self.size, decision)
+
+    def observe(self, latency, size, payload_bytes=0):
+        """Adapts the batch size after a processed batch with size items"""
+        with self.lock:
+            if payload_bytes and size:
+                item_bytes = payload_bytes / size
+                self.bytes_per_item = item_bytes if not self.bytes_per_item else\
+                    0.8 * self.bytes_per_item + 0.2 * item_bytes
+            if latency > self.target_latency:
+                self.set_size(self.size * self.decrease_factor, "decrease")
+            elif size >= self.size:
+                self.set_size(self.size + self.increase_step, "increase")
+            else:
+                self.set_size(self.size, "keep")
+
+    def on_rejection(self):
+        """Cuts the batch size after Elasticsearch rejected a batch"""
+        with self.lock:
+            self.set_size(self.size * self.decrease_factor, "rejection")
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_batch_size_controller(name, app_config, min_size_key, max_size_key,
+                              default_min_size, default_max_size, initial_size=None):
+    """Gets the process-wide controller, so batch sizes learnt by one request are used by next ones"""
+    min_size = app_config[min_size_key] if min_size_key in app_config else default_min_size
+    max_size = app_config[max_size_key] if max_size_key in app_config else default_max_size
+    target_latency = app_config["esBatchTargetLatency"]\
+        if "esBatchTargetLatency" in app_config else 1.0
+    max_payload_bytes = app_config["esBatchMaxPayloadBytes"]\
+        if "esBatchMaxPayloadBytes" in app_config else 0
+    key = (name, min_size, max_size, target_latency, max_payload_bytes)
+    with _controllers_lock:
+        if key not in _controllers:
+            _controllers[key] = BatchSizeController(
+                name, min_size=min_size, max_size=max_size, initial_size=initial_size,
+                target_latency=target_latency, max_payload_bytes=max_payload_bytes)
+        return _controllers[key]
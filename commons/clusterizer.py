@@ -17,8 +17,6 @@ import logging
 import hashlib
 import heapq
 import numpy as np
-from sklearn.feature_extraction.text import HashingVectorizer
-from scipy import spatial
 from time import time
 from utils import utils
 
@@ -47,6 +45,8 @@ class Clusterizer:
         global_group_map = {}
         group_id = 0
         start_time = time()
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from scipy import spatial
         count_vectorizer = HashingVectorizer(binary=True, analyzer="word", token_pattern="[^ ]+")
         transformed_logs = count_vectorizer.fit_transform(messages)
         for key_word in groups_to_check:
@@ -15,21 +15,118 @@
 """
 
 import json
+from collections import OrderedDict, deque
 import logging
+import os
+import threading
 import requests
 import elasticsearch
 import elasticsearch.helpers
 import commons.launch_objects
 from elasticsearch import RequestsHttpConnection
 import utils.utils as utils
-from time import time
+from time import time, sleep
 from commons.log_merger import LogMerger
-from queue import Queue
 from commons.log_preparation import LogPreparation
-from amqp.amqp import AmqpClient
+from commons import stats_sink
+from commons import merge_scheduler
+from commons import metrics
+from commons import batch_size_controller
+from amqp import amqp
 
 logger = logging.getLogger("analyzerApp.esclient")
 
+BULK_REJECTION_RETRIES = 3
+BULK_REJECTION_BACKOFF = 0.5
+REFRESH_POLICIES = {"true": True, "false": False, "wait_for": "wait_for"}
+
+
+class IndexExistenceCache:
+    """Process-wide cache of indices, which are known to exist. Only found indices
+    are cached, so a created index is noticed right away"""
+
+    def __init__(self):
+        self.indices = {}
+        self.lock = threading.Lock()
+
+    def exists(self, host, index_name, ttl):
+        with self.lock:
+            cached_time = self.indices.get((host, index_name))
+        return cached_time is not None and time() - cached_time < ttl
+
+    def add(self, host, index_name):
+        with self.lock:
+            self.indices[(host, index_name)] = time()
+
+    def invalidate(self, host, index_name):
+        with self.lock:
+            self.indices.pop((host, index_name), None)
+
+
+index_existence_cache = IndexExistenceCache()
+
+
+def get_refresh_policy(app_config, routing_key):
+    """Gets the refresh parameter for writes of requests with the routing key:
+    True forces a refresh, "wait_for" waits for the next refresh, False doesn't wait"""
+    refresh_policies = app_config["esRefreshPolicies"] if "esRefreshPolicies" in app_config else {}
+    refresh_policy = str(refresh_policies.get(routing_key, "true")).lower()
+    if refresh_policy not in REFRESH_POLICIES:
+        logger.error("Unknown refresh policy '%s' for '%s' requests", refresh_policy, routing_key)
+        return True
+    return REFRESH_POLICIES[refresh_policy]
+
+
+def hold_back_tail(actions, tail, tail_size):
+    """Yields actions except the last tail_size ones, which are added to the tail list"""
+    held_actions = deque()
+    for action in actions:
+        held_actions.append(action)
+        if len(held_actions) > tail_size:
+            yield held_actions.popleft()
+    tail.extend(held_actions)
+
+
+def is_merged_log(action):
+    """Checks whether a bulk action indexes a merged log, bulk responses count only other documents"""
+    return action is not None and action.get("_source", {}).get("is_merged") is True
+
+
+def get_connection_params(app_config, pooled=True):
+    """Gets parameters of Elasticsearch connections, the pool size and compression
+    are set only for urllib3 connections, which have a pool"""
+    params = {
+        "timeout": 30,
+        "max_retries": 5,
+        "retry_on_timeout": True,
+        "use_ssl": app_config["esUseSsl"],
+        "verify_certs": app_config["esVerifyCerts"],
+        "ssl_show_warn": app_config["esSslShowWarn"],
+        "ca_certs": app_config["esCAcert"],
+        "client_cert": app_config["esClientCert"],
+        "client_key": app_config["esClientKey"]}
+    if pooled:
+        if "esConnectionPoolSize" in app_config:
+            params["maxsize"] = app_config["esConnectionPoolSize"]
+        if "esHttpCompress" in app_config:
+            params["http_compress"] = app_config["esHttpCompress"]
+    return params
+
+
+_shared_es_clients = {}
+_shared_es_clients_lock = threading.Lock()
+
+
+def get_shared_es_client(app_config):
+    """Gets the Elasticsearch client of the current process, so all services send requests
+    through one connection pool, a forked process creates its own client"""
+    key = (app_config["esHost"], os.getpid())
+    with _shared_es_clients_lock:
+        if key not in _shared_es_clients:
+            _shared_es_clients[key] = elasticsearch.Elasticsearch(
+                [app_config["esHost"]], **get_connection_params(app_config))
+        return _shared_es_clients[key]
+
 
 class EsClient:
     """Elasticsearch client implementation"""
@@ -37,37 +134,19 @@ class EsClient:
         self.app_config = app_config
         self.host = app_config["esHost"]
         self.search_cfg = search_cfg
-        self.es_client = elasticsearch.Elasticsearch([self.host], timeout=30,
-                                                     max_retries=5, retry_on_timeout=True,
-                                                     use_ssl=app_config["esUseSsl"],
-                                                     verify_certs=app_config["esVerifyCerts"],
-                                                     ssl_show_warn=app_config["esSslShowWarn"],
-                                                     ca_certs=app_config["esCAcert"],
-                                                     client_cert=app_config["esClientCert"],
-                                                     client_key=app_config["esClientKey"])
+        if "esSharedClient" in app_config and app_config["esSharedClient"]:
+            self.es_client = get_shared_es_client(app_config)
+        else:
+            self.es_client = elasticsearch.Elasticsearch([self.host], **get_connection_params(app_config))
         self.log_preparation = LogPreparation()
+        self.index_cache_ttl = app_config["esIndexCacheTtl"] if "esIndexCacheTtl" in app_config else 0
 
     def create_es_client(self, app_config):
         if app_config["turnOffSslVerification"]:
             return elasticsearch.Elasticsearch(
-                [self.host], timeout=30,
-                max_retries=5, retry_on_timeout=True,
-                use_ssl=app_config["esUseSsl"],
-                verify_certs=app_config["esVerifyCerts"],
-                ssl_show_warn=app_config["esSslShowWarn"],
-                ca_certs=app_config["esCAcert"],
-                client_cert=app_config["esClientCert"],
-                client_key=app_config["esClientKey"],
-                connection_class=RequestsHttpConnection)
-        return elasticsearch.Elasticsearch(
-            [self.host], timeout=30,
-            max_retries=5, retry_on_timeout=True,
-            use_ssl=app_config["esUseSsl"],
-            verify_certs=app_config["esVerifyCerts"],
-            ssl_show_warn=app_config["esSslShowWarn"],
-            ca_certs=app_config["esCAcert"],
-            client_cert=app_config["esClientCert"],
-            client_key=app_config["esClientKey"])
+                [self.host], connection_class=RequestsHttpConnection,
+                **get_connection_params(app_config, pooled=False))
+        return elasticsearch.Elasticsearch([self.host], **get_connection_params(app_config))
 
     def get_test_item_query(self, test_item_ids, is_merged, full_log):
         """Build test item query"""
@@ -117,8 +196,7 @@ class EsClient:
     def is_healthy(self, es_host_name):
         """Check whether elasticsearch is healthy"""
         try:
-            url = utils.build_url(self.host, ["_cluster/health"])
-            res = utils.send_request(url, "GET")
+            res = self.es_client.cluster.health(request_timeout=5)
             return res["status"] in ["green", "yellow"]
         except Exception as err:
             logger.error("Elasticsearch is not healthy")
@@ -142,6 +220,7 @@ class EsClient:
         """Create index in elasticsearch"""
         logger.debug("Creating '%s' Elasticsearch index", str(index_name))
         logger.info("ES Url %s", utils.remove_credentials_from_url(self.host))
+        index_existence_cache.invalidate(self.host, str(index_name))
         try:
             response = self.es_client.indices.create(index=str(index_name), body={
                 'settings': utils.read_json_file("", "index_settings.json", to_json=True),
@@ -157,15 +236,28 @@ class EsClient:
 
     def list_indices(self):
         """Get all indices from elasticsearch"""
-        url = utils.build_url(self.host, ["_cat", "indices?format=json"])
-        res = utils.send_request(url, "GET")
-        return res
+        try:
+            return self.es_client.cat.indices(format="json")
+        except Exception as err:
+            logger.error("Couldn't get indices")
+            logger.error("ES Url %s", utils.remove_credentials_from_url(self.host))
+            logger.error(err)
+            return []
 
     def index_exists(self, index_name, print_error=True):
-        """Checks whether index exists"""
+        """Checks whether index exists, found indices are cached for esIndexCacheTtl seconds"""
+        if self.index_cache_ttl > 0 and\
+                index_existence_cache.exists(self.host, str(index_name), self.index_cache_ttl):
+            return True
         try:
-            index = self.es_client.indices.get(index=str(index_name))
-            return index is not None
+            exists = self.es_client.indices.exists(index=str(index_name))
+            if exists:
+                if self.index_cache_ttl > 0:
+                    index_existence_cache.add(self.host, str(index_name))
+            elif print_error:
+                logger.error("Index %s was not found", str(index_name))
+                logger.error("ES Url %s", self.host)
+            return exists
         except Exception as err:
             if print_error:
                 logger.error("Index %s was not found", str(index_name))
@@ -175,6 +267,7 @@ class EsClient:
 
     def delete_index(self, index_name):
         """Delete the whole index"""
+        index_existence_cache.invalidate(self.host, str(index_name))
         try:
             self.es_client.indices.delete(index=str(index_name))
             logger.info("ES Url %s", utils.remove_credentials_from_url(self.host))
@@ -193,42 +286,78 @@ class EsClient:
         return True
 
     def index_logs(self, launches):
-        """Index launches to the index with project name"""
-        cnt_launches = len(launches)
-        logger.info("Indexing logs for %d launches", cnt_launches)
+        """Index launches to the index with project name,
+        launches and their test items can be decoded on iteration"""
+        logger.info("Started indexing logs")
         logger.info("ES Url %s", utils.remove_credentials_from_url(self.host))
         t_start = time()
-        bodies = []
-        test_item_ids = []
-        project = None
-        test_item_queue = Queue()
-        for launch in launches:
-            project = str(launch.project)
-            test_items = launch.testItems
-            launch.testItems = []
-            self.create_index_if_not_exists(str(launch.project))
-            for test_item in test_items:
-                test_item_queue.put((launch, test_item))
-        del launches
-        while not test_item_queue.empty():
-            launch, test_item = test_item_queue.get()
-            logs_added = False
-            for log in test_item.logs:
-                if log.logLevel < utils.ERROR_LOGGING_LEVEL or not log.message.strip():
-                    continue
+        indexed_log_ids = {}
+        num_defect_types = {}
+        new_projects = set()
+        logs_with_exceptions = []
+        projects = []
+
+        def prepare_logs():
+            for launch in launches:
+                project = str(launch.project)
+                projects.append(project)
+                if not self.index_exists(project, print_error=False):
+                    self.create_index(project)
+                    new_projects.add(project)
+                for test_item in launch.testItems:
+                    prepared_logs = []
+                    for log in test_item.logs:
+                        if log.logLevel < utils.ERROR_LOGGING_LEVEL or not log.message.strip():
+                            continue
 
-                bodies.append(self.log_preparation._prepare_log(launch, test_item, log))
-                logs_added = True
-            if logs_added:
-                test_item_ids.append(str(test_item.testItemId))
+                        prepared_logs.append(self.log_preparation._prepare_log(launch, test_item, log))
+                    if not prepared_logs:
+                        continue
+                    logs_with_exceptions.extend(utils.extract_all_exceptions(prepared_logs))
+                    test_item_id = str(test_item.testItemId)
+                    logs_to_index = {log["_id"]: log for log in prepared_logs}
+                    project_defect_types = num_defect_types.setdefault(project, {})
+                    for log in LogMerger.decompose_logs_merged_and_without_duplicates(prepared_logs):
+                        logs_to_index[log["_id"]] = log
+                        log_issue_type = log["_source"]["issue_type"]
+                        if log_issue_type.strip() and not log_issue_type.lower().startswith("ti"):
+                            project_defect_types[test_item_id] = project_defect_types.get(test_item_id, 0) + 1
+                    indexed_log_ids.setdefault(project, {}).setdefault(test_item_id, []).extend(logs_to_index)
+                    yield from logs_to_index.values()
+                launch.testItems = []
 
-        logs_with_exceptions = utils.extract_all_exceptions(bodies)
-        result = self._bulk_index(bodies)
+        # chunks are indexed without refreshes, only the last chunk refreshes the index
+        refresh = get_refresh_policy(self.app_config, "index")
+        chunk_size = self.app_config["esBulkChunkSize"] if "esBulkChunkSize" in self.app_config else 1000
+        last_chunk = []
+        result = self._stream_bulk_index(hold_back_tail(prepare_logs(), last_chunk, chunk_size),
+                                         refresh=False)
+        cnt_launches = len(projects)
+        project = projects[-1] if projects else None
+        # merged logs of test items, which have logs indexed by previous requests,
+        # are rebuilt from all their logs, which are read back, so they should be searchable
+        test_items_to_merge = {
+            items_project: self._find_test_items_with_other_logs(items_project, log_ids)
+            for items_project, log_ids in indexed_log_ids.items() if items_project not in new_projects}
+        last_chunk_result = self._bulk_index(
+            last_chunk, refresh=True if any(test_items_to_merge.values()) else refresh)
+        num_logs_with_defect_types = 0
+        for merged_project, test_item_ids in test_items_to_merge.items():
+            if not test_item_ids:
+                continue
+            _, num_merged_logs_with_defect_types = self._merge_logs(
+                test_item_ids, merged_project, refresh=refresh)
+            num_logs_with_defect_types += num_merged_logs_with_defect_types
+            for test_item_id in test_item_ids:
+                num_defect_types[merged_project].pop(test_item_id, None)
+        num_logs_with_defect_types += sum(
+            sum(project_defect_types.values()) for project_defect_types in num_defect_types.values())
+        result = commons.launch_objects.BulkResponse(
+            took=result.took + last_chunk_result.took, errors=result.errors or last_chunk_result.errors)
         result.logResults = logs_with_exceptions
-        _, num_logs_with_defect_types = self._merge_logs(test_item_ids, project)
         try:
             if "amqpUrl" in self.app_config and self.app_config["amqpUrl"].strip():
-                AmqpClient(self.app_config["amqpUrl"]).send_to_inner_queue(
+                amqp.get_publisher(self.app_config).send_to_inner_queue(
                     self.app_config["exchangeName"], "train_models", json.dumps({
                         "model_type": "defect_type",
                         "project_id": project,
@@ -240,10 +369,38 @@ class EsClient:
                     cnt_launches, time() - t_start)
         return result
 
-    def _merge_logs(self, test_item_ids, project):
-        bodies = []
+    def _find_test_items_with_other_logs(self, project, log_ids_by_test_item):
+        """Finds test items, which have logs or merged logs in the index besides the logs
+        of the request, log_ids_by_test_item are ids of the request logs by test items.
+        If the search fails, all test items are returned, so their merged logs are rebuilt"""
+        batch_size = 1000
+        test_item_ids = list(log_ids_by_test_item)
+        found_test_item_ids = []
+        for i in range(0, len(test_item_ids), batch_size):
+            batch_test_item_ids = test_item_ids[i: i + batch_size]
+            query = {
+                "size": 0,
+                "query": {"bool": {
+                    "filter": [{"terms": {"test_item": batch_test_item_ids}}],
+                    "must_not": [{"ids": {"values": [
+                        log_id for test_item_id in batch_test_item_ids
+                        for log_id in log_ids_by_test_item[test_item_id]]}}]}},
+                "aggs": {"test_items": {"terms": {"field": "test_item", "size": len(batch_test_item_ids)}}}}
+            try:
+                res = self.es_client.search(index=project, body=query, request_timeout=30)
+                found_test_item_ids.extend(
+                    str(bucket["key"]) for bucket in res["aggregations"]["test_items"]["buckets"])
+            except Exception as err:
+                logger.error("Couldn't find indexed logs of test items for the project %s", project)
+                logger.error(err)
+                found_test_item_ids.extend(batch_test_item_ids)
+        return found_test_item_ids
+
+    def _merge_logs(self, test_item_ids, project, refresh=True):
+        """Rebuilds merged logs of test items from their logs in Elasticsearch, old merged logs
+        are deleted in the same bulk request"""
+        bodies = self._get_merged_logs_to_delete(test_item_ids, project)
         batch_size = 1000
-        self._delete_merged_logs(test_item_ids, project)
         num_logs_with_defect_types = 0
         for i in range(int(len(test_item_ids) / batch_size) + 1):
             test_items = test_item_ids[i * batch_size: (i + 1) * batch_size]
@@ -274,9 +431,17 @@ class EsClient:
                     log_issue_type = log["_source"]["issue_type"]
                     if log_issue_type.strip() and not log_issue_type.lower().startswith("ti"):
                         num_logs_with_defect_types += 1
-        return self._bulk_index(bodies), num_logs_with_defect_types
+        return self._bulk_index(bodies, refresh=refresh), num_logs_with_defect_types
+
+    def delete_task_result(self, task_id):
+        """Deletes the result of a completed task, which Elasticsearch keeps in the .tasks index"""
+        try:
+            self.es_client.delete(index=".tasks", id=task_id, ignore=404, request_timeout=30)
+        except Exception as err:
+            logger.error("Couldn't delete the result of the task %s", task_id)
+            logger.error(err)
 
-    def _delete_merged_logs(self, test_items_to_delete, project):
+    def _get_merged_logs_to_delete(self, test_items_to_delete, project):
         logger.debug("Delete merged logs for %d test items", len(test_items_to_delete))
         bodies = []
         batch_size = 1000
@@ -293,8 +458,112 @@ class EsClient:
                     "_id": log["_id"],
                     "_index": project
                 })
-        if bodies:
-            self._bulk_index(bodies)
+        return bodies
+
+    def get_bulk_batch_size_controller(self):
+        return batch_size_controller.get_batch_size_controller(
+            "bulk", self.app_config, "esBulkMinBatchSize", "esBulkMaxBatchSize",
+            default_min_size=1000, default_max_size=1000, initial_size=1000)
+
+    def _bulk_chunk(self, chunk, host, es_client, refresh, attempt=0):
+        """Indexes a chunk with one bulk request, a rejected chunk is sent again after a backoff
+        in batches of the decreased size"""
+        controller = self.get_bulk_batch_size_controller()
+        t_start = time()
+        try:
+            result = elasticsearch.helpers.bulk(es_client,
+                                                chunk,
+                                                chunk_size=len(chunk),
+                                                request_timeout=30,
+                                                refresh=refresh)
+        except Exception as err:
+            logger.error(err)
+            if batch_size_controller.is_rejection(err) and attempt < BULK_REJECTION_RETRIES:
+                controller.on_rejection()
+                sleep(BULK_REJECTION_BACKOFF * 2 ** attempt)
+                batch_size = controller.batch_size
+                success_count, errors = 0, []
+                for start in range(0, len(chunk), batch_size):
+                    batch_success_count, batch_errors = self._bulk_chunk(
+                        chunk[start:start + batch_size], host, es_client, refresh, attempt=attempt + 1)
+                    success_count += batch_success_count
+                    errors.extend(batch_errors)
+                return success_count, errors
+            self.update_settings_after_read_only(host)
+            return elasticsearch.helpers.bulk(es_client,
+                                              chunk,
+                                              chunk_size=len(chunk),
+                                              request_timeout=30,
+                                              refresh=refresh)
+        controller.observe(time() - t_start, len(chunk))
+        return result
+
+    def _stream_bulk_index(self, actions, host=None, es_client=None, refresh=True):
+        """Indexes documents from the actions iterator with streaming_bulk or, if there are
+        several bulk threads, with parallel_bulk, so documents are prepared while previous chunks
+        are indexed. Documents failed because of the read only mode are indexed once again"""
+        if host is None:
+            host = self.host
+        if es_client is None:
+            es_client = self.es_client
+        chunk_size = self.app_config["esBulkChunkSize"] if "esBulkChunkSize" in self.app_config else 1000
+        threads = self.app_config["esBulkThreads"] if "esBulkThreads" in self.app_config else 1
+        # failed documents are found among the recent ones, which can be in not processed chunks
+        recent_actions = OrderedDict()
+        max_recent_actions = chunk_size * (2 * max(1, threads) + 1)
+
+        def remember_actions():
+            for action in actions:
+                # Elasticsearch returns ids of failed documents as strings
+                recent_actions[str(action["_id"])] = action
+                if len(recent_actions) > max_recent_actions:
+                    recent_actions.popitem(last=False)
+                yield action
+
+        t_start = time()
+        if threads > 1:
+            results = elasticsearch.helpers.parallel_bulk(
+                es_client, remember_actions(), thread_count=threads, queue_size=threads,
+                chunk_size=chunk_size, raise_on_error=False, raise_on_exception=False,
+                request_timeout=30, refresh=refresh)
+        else:
+            results = elasticsearch.helpers.streaming_bulk(
+                es_client, remember_actions(), chunk_size=chunk_size, max_retries=3,
+                raise_on_error=False, raise_on_exception=False, request_timeout=30, refresh=refresh)
+        success_count = 0
+        merged_logs_count = 0
+        errors = []
+        actions_to_retry = []
+        try:
+            for ok, info in results:
+                if ok:
+                    success_count += 1
+                    if is_merged_log(recent_actions.get(str(list(info.values())[0].get("_id")))):
+                        merged_logs_count += 1
+                    continue
+                error = list(info.values())[0]
+                errors.append(error)
+                if str(error.get("_id")) in recent_actions:
+                    actions_to_retry.append(recent_actions[str(error["_id"])])
+        except Exception as err:
+            logger.error("Error in bulk")
+            logger.error("ES Url %s", utils.remove_credentials_from_url(host))
+            logger.error(err)
+            errors.append(str(err))
+        metrics.ES_BULK_DURATION.observe(time() - t_start)
+        metrics.ES_BULK_DOCUMENTS.inc(success_count, status="success")
+        logger.debug("Processed %d logs", success_count)
+        if errors:
+            logger.debug("Occured errors %s", errors)
+            logger.error("%d logs failed to be indexed, %d of them will be indexed again",
+                         len(errors), len(actions_to_retry))
+            metrics.ES_BULK_DOCUMENTS.inc(len(errors) - len(actions_to_retry), status="error")
+            self.update_settings_after_read_only(host)
+            retry_result = self._bulk_index(actions_to_retry, host=host, es_client=es_client, refresh=refresh)
+            return commons.launch_objects.BulkResponse(
+                took=success_count - merged_logs_count + retry_result.took,
+                errors=len(errors) > len(actions_to_retry) or retry_result.errors)
+        return commons.launch_objects.BulkResponse(took=success_count - merged_logs_count, errors=False)
 
     def _bulk_index(self, bodies, host=None, es_client=None, refresh=True):
         if host is None:
@@ -304,31 +573,41 @@ class EsClient:
         if not bodies:
             return commons.launch_objects.BulkResponse(took=0, errors=False)
         logger.debug("Indexing %d logs...", len(bodies))
+        t_start = time()
         try:
-            try:
-                success_count, errors = elasticsearch.helpers.bulk(es_client,
-                                                                   bodies,
-                                                                   chunk_size=1000,
-                                                                   request_timeout=30,
-                                                                   refresh=refresh)
-            except Exception as err:
-                logger.error(err)
-                self.update_settings_after_read_only(host)
-                success_count, errors = elasticsearch.helpers.bulk(es_client,
-                                                                   bodies,
-                                                                   chunk_size=1000,
-                                                                   request_timeout=30,
-                                                                   refresh=refresh)
+            success_count, merged_logs_count, errors = 0, 0, []
+            start = 0
+            while start < len(bodies):
+                chunk = bodies[start:start + self.get_bulk_batch_size_controller().batch_size]
+                chunk_success_count, chunk_errors = self._bulk_chunk(chunk, host, es_client, refresh)
+                success_count += chunk_success_count
+                failed_ids = {str(list(error.values())[0].get("_id")) for error in chunk_errors}
+                merged_logs_count += len([
+                    action for action in chunk
+                    if is_merged_log(action) and str(action.get("_id")) not in failed_ids])
+                errors.extend(chunk_errors)
+                start += len(chunk)
             logger.debug("Processed %d logs", success_count)
             if errors:
                 logger.debug("Occured errors %s", errors)
-            return commons.launch_objects.BulkResponse(took=success_count, errors=len(errors) > 0)
+            metrics.ES_BULK_DURATION.observe(time() - t_start)
+            metrics.ES_BULK_DOCUMENTS.inc(success_count, status="success")
+            metrics.ES_BULK_DOCUMENTS.inc(len(errors), status="error")
+            return commons.launch_objects.BulkResponse(
+                took=success_count - merged_logs_count, errors=len(errors) > 0)
         except Exception as err:
             logger.error("Error in bulk")
             logger.error("ES Url %s", utils.remove_credentials_from_url(host))
             logger.error(err)
+            metrics.ES_BULK_DURATION.observe(time() - t_start)
+            metrics.ES_BULK_DOCUMENTS.inc(len(bodies), status="error")
             return commons.launch_objects.BulkResponse(took=0, errors=True)
 
+    def merge_logs_after_clean(self, test_item_ids, project):
+        """Rebuilds merged logs of test items, which logs were deleted"""
+        return self._merge_logs(test_item_ids, project,
+                                refresh=get_refresh_policy(self.app_config, "clean"))
+
     def delete_logs(self, clean_index):
         """Delete logs from elasticsearch"""
         logger.info("Delete logs %s for the project %s",
@@ -337,6 +616,8 @@ class EsClient:
         t_start = time()
         if not self.index_exists(clean_index.project):
             return 0
+        if "esAsyncClean" in self.app_config and self.app_config["esAsyncClean"]:
+            return self._delete_logs_async(clean_index, t_start)
         test_item_ids = set()
         try:
             search_query = self.build_search_test_item_ids_query(
@@ -357,12 +638,48 @@ class EsClient:
                 "_id":      _id,
                 "_index":   clean_index.project,
             })
-        result = self._bulk_index(bodies)
-        self._merge_logs(list(test_item_ids), clean_index.project)
+        # deleted logs shouldn't be found, when merged logs are rebuilt
+        result = self._bulk_index(bodies, refresh=True)
+        self.merge_logs_after_clean(list(test_item_ids), clean_index.project)
         logger.info("Finished deleting logs %s for the project %s. It took %.2f sec",
                     clean_index.ids, clean_index.project, time() - t_start)
         return result.took
 
+    def _delete_logs_async(self, clean_index, t_start):
+        """Starts delete_by_query tasks for the logs and schedules merging logs of their test items,
+        returns the number of logs accepted for deletion"""
+        batch_size = 10000
+        log_ids = [str(log_id) for log_id in clean_index.ids]
+        test_item_ids = set()
+        task_ids = []
+        num_accepted_logs = 0
+        for i in range(0, len(log_ids), batch_size):
+            batch_log_ids = log_ids[i: i + batch_size]
+            try:
+                res = self.es_client.search(
+                    index=clean_index.project,
+                    body=self.build_search_test_item_ids_query(batch_log_ids))
+                test_item_ids.update(hit["_source"]["test_item"] for hit in res["hits"]["hits"])
+            except Exception as err:
+                logger.error("Couldn't find test items for logs")
+                logger.error(err)
+            try:
+                res = self.es_client.delete_by_query(
+                    index=clean_index.project, body={"query": {"ids": {"values": batch_log_ids}}},
+                    conflicts="proceed", refresh=True, slices="auto", wait_for_completion=False,
+                    request_timeout=30)
+                task_ids.append(res["task"])
+                num_accepted_logs += len(batch_log_ids)
+            except Exception as err:
+                logger.error("Couldn't start deleting logs")
+                logger.error(err)
+                break
+        merge_scheduler.get_merge_scheduler(self, self.app_config).schedule(
+            clean_index.project, [str(test_item_id) for test_item_id in test_item_ids], task_ids)
+        logger.info("Started tasks %s deleting logs for the project %s. It took %.2f sec",
+                    task_ids, clean_index.project, time() - t_start)
+        return num_accepted_logs
+
     def create_index_for_stats_info(self, es_client, rp_aa_stats_index):
         index = None
         try:
@@ -371,14 +688,14 @@ class EsClient:
             pass
         if index is None:
             es_client.indices.create(index=rp_aa_stats_index, body={
-                'settings': utils.read_json_file("", "index_settings.json", to_json=True),
-                'mappings': utils.read_json_file(
-                    "", "%s_mappings.json" % rp_aa_stats_index, to_json=True)
+                'settings': utils.read_json_file_cached("", "index_settings.json"),
+                'mappings': utils.read_json_file_cached(
+                    "", "%s_mappings.json" % rp_aa_stats_index)
             })
         else:
             es_client.indices.put_mapping(
                 index=rp_aa_stats_index,
-                body=utils.read_json_file("", "%s_mappings.json" % rp_aa_stats_index, to_json=True))
+                body=utils.read_json_file_cached("", "%s_mappings.json" % rp_aa_stats_index))
 
     @utils.ignore_warnings
     def send_stats_info(self, stats_info):
@@ -390,10 +707,9 @@ class EsClient:
             rp_aa_stats_index = "rp_aa_stats"
             if "method" in obj_info and obj_info["method"] == "training":
                 rp_aa_stats_index = "rp_model_train_stats"
-            self.create_index_for_stats_info(self.es_client, rp_aa_stats_index)
             stat_info_array.append({
                 "_index": rp_aa_stats_index,
                 "_source": obj_info
             })
-        self._bulk_index(stat_info_array)
+        stats_sink.get_stats_sink(self, self.app_config).add(stat_info_array)
         logger.info("Finished sending stats about analysis")
@@ -14,10 +14,16 @@
 * limitations under the License.
 """
 
+import copy
 from typing import List
 from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+from pydantic.validators import str_validator, int_validator, float_validator, bool_validator
 from datetime import datetime
 
+SCALAR_VALIDATORS = {str: str_validator, int: int_validator,
+                     float: float_validator, bool: bool_validator}
+
 
 class AnalyzerConf(BaseModel):
     """Analyzer config object"""
@@ -166,3 +172,68 @@ class SuggestPattern(BaseModel):
     """Suggest pattern object with 2 lists of suggestions"""
     suggestions_with_labels: List[SuggestPatternLabel] = []
     suggestions_without_labels: List[SuggestPatternLabel] = []
+
+
+def coerce_scalar(model_class, name, field, value):
+    """Coerces a value of a str, int, float or bool field as the validation does,
+    values of the field type are returned as they are"""
+    if type(value) is field.type_ or field.shape != SHAPE_SINGLETON or\
+            field.type_ not in SCALAR_VALIDATORS or (value is None and field.allow_none):
+        return value
+    try:
+        return SCALAR_VALIDATORS[field.type_](value)
+    except (TypeError, ValueError) as err:
+        raise ValueError("%s.%s: %s" % (model_class.__name__, name, err))
+
+
+def construct_trusted(model_class, values, **nested_values):
+    """Creates a model object from trusted values without validation, only values of scalar fields
+    are coerced to the field types, so values of lists and nested objects should have right types.
+    Missing fields get default values, unknown fields are ignored"""
+    fields_values = {}
+    fields_set = set()
+    for name, field in model_class.__fields__.items():
+        if name in nested_values:
+            fields_values[name] = nested_values[name]
+            fields_set.add(name)
+        elif name in values:
+            fields_values[name] = coerce_scalar(model_class, name, field, values[name])
+            fields_set.add(name)
+        elif field.required:
+            raise ValueError("%s.%s field required" % (model_class.__name__, name))
+        else:
+            fields_values[name] = copy.copy(field.default)
+    model = model_class.__new__(model_class)
+    object.__setattr__(model, "__dict__", fields_values)
+    object.__setattr__(model, "__fields_set__", fields_set)
+    return model
+
+
+def construct_analyzer_conf(values):
+    return construct_trusted(AnalyzerConf, values)
+
+
+def construct_log(values):
+    return construct_trusted(Log, values)
+
+
+def construct_test_item(values):
+    return construct_trusted(
+        TestItem, values, logs=[construct_log(log) for log in values.get("logs", [])])
+
+
+def construct_launch(values, test_items=None):
+    """Creates a launch from trusted values, test_items can be passed already created"""
+    if test_items is None:
+        test_items = [construct_test_item(test_item) for test_item in values.get("testItems", [])]
+    nested_values = {"testItems": test_items}
+    if "analyzerConfig" in values:
+        nested_values["analyzerConfig"] = construct_analyzer_conf(values["analyzerConfig"])
+    return construct_trusted(Launch, values, **nested_values)
+
+
+def construct_test_item_info(values):
+    nested_values = {"logs": [construct_log(log) for log in values.get("logs", [])]}
+    if "analyzerConfig" in values:
+        nested_values["analyzerConfig"] = construct_analyzer_conf(values["analyzerConfig"])
+    return construct_trusted(TestItemInfo, values, **nested_values)
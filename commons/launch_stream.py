@@ -0,0 +1,137 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import re
+import json
+from json.decoder import scanstring
+import commons.launch_objects as launch_objects
+from utils import utils
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+STRUCTURAL_CHAR = re.compile(r'["\[\]{}]')
+STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+
+
+class LaunchStream:
+    """LaunchStream decodes launches from a json array on iteration. Test items of a launch
+    are decoded one by one while launch.testItems is iterated, so it can be iterated once,
+    and logs below the error logging level are dropped. Brackets of the body are checked
+    on creation and launches are validated by decoding them once without keeping them,
+    so a wrong body fails before it is handled. Trusted payloads are not validated"""
+
+    def __init__(self, body, trusted=False):
+        self.trusted = trusted
+        self.body = body.decode("utf-8") if isinstance(body, bytes) else body
+        self.decoder = json.JSONDecoder(strict=False)
+        _, self.start = self.expect(0, "[")
+        self.start -= 1
+        if self.skip_whitespace(self.skip_value(self.start)) != len(self.body):
+            raise ValueError("Extra data after the array of launches")
+        if not trusted:
+            self.validate()
+
+    def __iter__(self):
+        return self.decode_array(self.start, self.decode_launch)
+
+    def validate(self):
+        for launch in self:
+            for _ in launch.testItems:
+                pass
+
+    def skip_whitespace(self, idx):
+        return WHITESPACE.match(self.body, idx).end()
+
+    def expect(self, idx, chars):
+        """Checks that the next not whitespace char is one of chars and returns it"""
+        idx = self.skip_whitespace(idx)
+        if idx >= len(self.body) or self.body[idx] not in chars:
+            raise ValueError("Expecting one of '%s' at char %d" % (chars, idx))
+        return self.body[idx], idx + 1
+
+    def decode_value(self, idx):
+        return self.decoder.raw_decode(self.body, self.skip_whitespace(idx))
+
+    def decode_array(self, idx, decode_element):
+        """Yields decoded elements of the json array, which starts at idx"""
+        _, idx = self.expect(idx, "[")
+        if self.body.startswith("]", self.skip_whitespace(idx)):
+            return
+        while True:
+            element, idx = decode_element(idx)
+            yield element
+            char, idx = self.expect(idx, ",]")
+            if char == "]":
+                return
+
+    def skip_value(self, idx):
+        """Returns the end of the json array or object, which starts at idx,
+        strings are skipped without decoding"""
+        depth = 0
+        while True:
+            match = STRUCTURAL_CHAR.search(self.body, idx)
+            if match is None:
+                raise ValueError("Unterminated json array or object at char %d" % idx)
+            char, idx = match.group(), match.end()
+            if char == '"':
+                string_end = STRING_END.match(self.body, idx)
+                if string_end is None:
+                    raise ValueError("Unterminated string at char %d" % idx)
+                idx = string_end.end()
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return idx
+
+    def decode_launch(self, idx):
+        """Decodes launch fields, test items are decoded later on iteration"""
+        _, idx = self.expect(idx, "{")
+        fields = {}
+        test_items_start = None
+        if self.body.startswith("}", self.skip_whitespace(idx)):
+            idx = self.skip_whitespace(idx) + 1
+        else:
+            while True:
+                _, idx = self.expect(idx, '"')
+                key, idx = scanstring(self.body, idx, False)
+                _, idx = self.expect(idx, ":")
+                idx = self.skip_whitespace(idx)
+                if key == "testItems" and self.body.startswith("[", idx):
+                    test_items_start = idx
+                    idx = self.skip_value(idx)
+                else:
+                    fields[key], idx = self.decode_value(idx)
+                char, idx = self.expect(idx, ",}")
+                if char == "}":
+                    break
+        test_items = []
+        if test_items_start is not None:
+            test_items = self.decode_array(test_items_start, self.decode_test_item)
+        if self.trusted:
+            return launch_objects.construct_launch(fields, test_items=test_items), idx
+        launch = launch_objects.Launch(**fields)
+        launch.testItems = test_items
+        return launch, idx
+
+    def decode_test_item(self, idx):
+        test_item, idx = self.decode_value(idx)
+        test_item["logs"] = [
+            log for log in test_item.get("logs", [])
+            if int(log.get("logLevel", 0)) >= utils.ERROR_LOGGING_LEVEL]
+        if self.trusted:
+            return launch_objects.construct_test_item(test_item), idx
+        return launch_objects.TestItem(**test_item), idx
@@ -0,0 +1,170 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from time import time
+
+logger = logging.getLogger("analyzerApp.mergeScheduler")
+
+MERGE_RESCHEDULE_ATTEMPTS = 3
+MERGE_RESCHEDULE_DELAY = 30
+
+
+class MergeScheduler:
+    """MergeScheduler rebuilds merged logs of test items in the background after their logs
+    were deleted by Elasticsearch tasks. Test items of one project are gathered, until there are
+    no new clean requests for debounce_interval seconds, but not longer than max_delay seconds,
+    then the scheduler waits for the delete tasks and merges logs of all gathered test items.
+    If statuses of some tasks are unknown, merging is rescheduled, deleted logs could be merged otherwise"""
+
+    def __init__(self, es_client, debounce_interval=0, max_delay=0, task_timeout=300):
+        self.es_client = es_client
+        self.debounce_interval = debounce_interval
+        self.max_delay = max(debounce_interval, max_delay)
+        self.task_timeout = task_timeout
+        self.pending_test_items = {}
+        self.pending_tasks = {}
+        self.first_scheduled = {}
+        self.deadlines = {}
+        self.attempts = {}
+        self.condition = threading.Condition()
+        self.merge_lock = threading.Lock()
+        self.thread = None
+        self.stopped = False
+
+    def schedule(self, project, test_item_ids, task_ids=(), attempt=0):
+        """Schedules merging logs of test items after the delete tasks are completed,
+        a rescheduled merge is delayed by MERGE_RESCHEDULE_DELAY seconds"""
+        with self.condition:
+            now = time()
+            self.pending_test_items.setdefault(project, set()).update(test_item_ids)
+            self.pending_tasks.setdefault(project, []).extend(task_ids)
+            self.first_scheduled.setdefault(project, now)
+            self.attempts[project] = max(self.attempts.get(project, 0), attempt)
+            self.deadlines[project] = min(now + self.debounce_interval,
+                                          self.first_scheduled[project] + self.max_delay)
+            if attempt > 0:
+                self.deadlines[project] = max(self.deadlines[project], now + MERGE_RESCHEDULE_DELAY)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def pop_projects(self, due_only=True):
+        with self.condition:
+            now = time()
+            projects = [project for project, deadline in self.deadlines.items()
+                        if not due_only or deadline <= now]
+            scheduled = []
+            for project in projects:
+                del self.deadlines[project]
+                del self.first_scheduled[project]
+                scheduled.append((project, self.pending_test_items.pop(project),
+                                  self.pending_tasks.pop(project), self.attempts.pop(project)))
+            return scheduled
+
+    def wait_for_task(self, task_id):
+        while True:
+            res = self.es_client.es_client.tasks.get(
+                task_id=task_id, wait_for_completion=True, timeout="%ds" % self.task_timeout,
+                request_timeout=self.task_timeout + 30)
+            if res.get("completed", True):
+                failures = res.get("response", {}).get("failures", [])
+                if failures:
+                    logger.error("Task %s failed to delete logs: %s", task_id, failures)
+                self.es_client.delete_task_result(task_id)
+                return
+
+    def merge(self, project, test_item_ids, task_ids, attempt=0):
+        unknown_task_ids = []
+        for task_id in task_ids:
+            try:
+                self.wait_for_task(task_id)
+            except Exception as err:
+                logger.error("Couldn't get the status of the task %s", task_id)
+                logger.error(err)
+                unknown_task_ids.append(task_id)
+        if unknown_task_ids:
+            if attempt < MERGE_RESCHEDULE_ATTEMPTS and not self.stopped:
+                logger.info("Merging logs of %d test items for the project %s is rescheduled",
+                            len(test_item_ids), project)
+                self.schedule(project, test_item_ids, unknown_task_ids, attempt=attempt + 1)
+            else:
+                logger.error("Logs of %d test items for the project %s are not merged, "
+                             "statuses of the tasks %s are unknown", len(test_item_ids), project,
+                             unknown_task_ids)
+            return
+        try:
+            self.es_client.merge_logs_after_clean(sorted(test_item_ids), project)
+        except Exception as err:
+            logger.error("Couldn't merge logs of %d test items for the project %s",
+                         len(test_item_ids), project)
+            logger.error(err)
+
+    def flush(self, due_only=False):
+        """Merges logs of scheduled test items, the ones with passed deadlines if due_only is set"""
+        with self.merge_lock:
+            for project, test_item_ids, task_ids, attempt in self.pop_projects(due_only):
+                self.merge(project, test_item_ids, task_ids, attempt)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.deadlines and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                timeout = min(self.deadlines.values()) - time()
+                if timeout > 0:
+                    self.condition.wait(timeout)
+                    continue
+            self.flush(due_only=True)
+
+    def close(self):
+        """Stops the background thread and merges logs of all scheduled test items"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.flush()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_merge_scheduler(es_client, app_config):
+    """Gets the merge scheduler of the current process, a forked process creates its own scheduler"""
+    key = (app_config["esHost"], os.getpid())
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = MergeScheduler(
+                es_client,
+                debounce_interval=app_config["cleanMergeDebounceInterval"]
+                if "cleanMergeDebounceInterval" in app_config else 0,
+                max_delay=app_config["cleanMergeMaxDelay"]
+                if "cleanMergeMaxDelay" in app_config else 0)
+        return _schedulers[key]
+
+
+@atexit.register
+def close_schedulers():
+    for key in list(_schedulers):
+        if key[1] == os.getpid():
+            _schedulers[key].close()
@@ -0,0 +1,366 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import json
+import logging
+import os
+import threading
+from functools import wraps
+from time import time, sleep
+
+logger = logging.getLogger("analyzerApp.metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 100, 200, 500, 1000)
+METRICS_FILE_PREFIX = "metrics_"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """Metric keeps values for each combination of label values"""
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, labels):
+        return tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+
+    def format_labels(self, key, extra_labels=()):
+        labels = list(zip(self.label_names, key)) + list(extra_labels)
+        if not labels:
+            return ""
+        return "{%s}" % ",".join(
+            '%s="%s"' % (label_name, escape_label_value(value)) for label_name, value in labels)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+    def aggregate(self, snapshots):
+        """Sums values of processes, snapshots are tuples of a pid, whether the process
+        is alive and values of the metric in the process"""
+        values = {}
+        for _, _, process_values in snapshots:
+            for key, value in process_values:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+    def render_samples(self, values):
+        return ["%s%s %s" % (self.name, self.format_labels(key), format_value(value))
+                for key, value in sorted(values.items())]
+
+    def render(self, values=None):
+        if values is None:
+            values = dict((tuple(key), value) for key, value in self.snapshot())
+        return ["# HELP %s %s" % (self.name, self.documentation),
+                "# TYPE %s %s" % (self.name, self.metric_type)] + self.render_samples(values)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """Gauge values of several processes are summed, if multiprocess_mode is "sum",
+    otherwise they are rendered with the "pid" label. Values of exited processes are dropped"""
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), multiprocess_mode="all"):
+        super(Gauge, self).__init__(name, documentation, label_names=label_names)
+        self.multiprocess_mode = multiprocess_mode
+
+    def aggregate(self, snapshots):
+        live_snapshots = [snapshot for snapshot in snapshots if snapshot[1]]
+        if self.multiprocess_mode == "sum":
+            return super(Gauge, self).aggregate(live_snapshots)
+        return {tuple(key) + (str(pid),): value
+                for pid, _, process_values in live_snapshots for key, value in process_values}
+
+    def format_labels(self, key, extra_labels=()):
+        if len(key) > len(self.label_names):
+            return super(Gauge, self).format_labels(key[:-1], [("pid", key[-1])] + list(extra_labels))
+        return super(Gauge, self).format_labels(key, extra_labels)
+
+    def inc(self, value=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+    def set(self, value, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, label_names=label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            histogram = self.values[key]
+            for i, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    histogram["buckets"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), {"buckets": list(histogram["buckets"]), "sum": histogram["sum"],
+                                 "count": histogram["count"]}]
+                    for key, histogram in self.values.items()]
+
+    def aggregate(self, snapshots):
+        values = {}
+        for _, _, process_values in snapshots:
+            for key, histogram in process_values:
+                key = tuple(key)
+                if key not in values:
+                    values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                values[key]["buckets"] = [
+                    count + process_count
+                    for count, process_count in zip(values[key]["buckets"], histogram["buckets"])]
+                values[key]["sum"] += histogram["sum"]
+                values[key]["count"] += histogram["count"]
+        return values
+
+    def render_samples(self, values):
+        samples = []
+        for key, histogram in sorted(values.items()):
+            cumulative_count = 0
+            for bucket, bucket_count in zip(self.buckets, histogram["buckets"]):
+                cumulative_count += bucket_count
+                samples.append("%s_bucket%s %s" % (
+                    self.name, self.format_labels(key, [("le", format_value(bucket))]),
+                    format_value(cumulative_count)))
+            samples.append("%s_sum%s %s" % (
+                self.name, self.format_labels(key), format_value(histogram["sum"])))
+            samples.append("%s_count%s %s" % (
+                self.name, self.format_labels(key), format_value(histogram["count"])))
+        return samples
+
+
+class MetricsRegistry:
+    """MetricsRegistry renders metrics in the Prometheus text format. If the multiprocess
+    directory is set, each process dumps its values to a file in the directory
+    every dump_interval seconds, and values of all processes are aggregated on rendering"""
+
+    def __init__(self):
+        self.metrics = []
+        self.multiprocess_dir = None
+        self.dump_interval = 5
+        self.dumping_pid = None
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def set_multiprocess_dir(self, directory, dump_interval=5):
+        """Sets the directory and removes files of exited processes. The dumping thread is started
+        by the first tracked request, so it isn't started before worker processes are forked"""
+        self.multiprocess_dir = directory or None
+        self.dump_interval = dump_interval
+        if self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+            self.remove_files_of_exited_processes()
+
+    def reset(self):
+        """Clears values, a forked process shouldn't report values of its parent once more"""
+        for metric in self.metrics:
+            metric.reset()
+
+    def recreate_locks(self):
+        """Creates new locks in a forked process, locks held by threads of the parent
+        at the moment of fork would never be released"""
+        self.lock = threading.Lock()
+        for metric in self.metrics:
+            metric.lock = threading.Lock()
+
+    def remove_files_of_exited_processes(self):
+        for file_name in os.listdir(self.multiprocess_dir):
+            pid = get_pid_from_file_name(file_name)
+            if pid is None or is_process_alive(pid):
+                continue
+            try:
+                os.remove(os.path.join(self.multiprocess_dir, file_name))
+            except FileNotFoundError:
+                pass
+            except Exception as err:
+                logger.error("Couldn't remove metrics of the exited process %d", pid)
+                logger.error(err)
+
+    def get_file_name(self, pid):
+        return os.path.join(self.multiprocess_dir, "%s%d.json" % (METRICS_FILE_PREFIX, pid))
+
+    def start_dumping(self):
+        """Starts the thread dumping values of the current process, a forked process starts its own"""
+        if not self.multiprocess_dir or self.dumping_pid == os.getpid():
+            return
+        with self.lock:
+            if self.dumping_pid == os.getpid():
+                return
+            self.dumping_pid = os.getpid()
+        thread = threading.Thread(target=self.run_dumping, args=(self.dumping_pid,))
+        thread.daemon = True
+        thread.start()
+
+    def run_dumping(self, pid):
+        while os.getpid() == pid:
+            sleep(self.dump_interval)
+            self.dump()
+
+    def dump(self):
+        pid = os.getpid()
+        file_name = self.get_file_name(pid)
+        try:
+            with open(file_name + ".tmp", "w") as file:
+                json.dump({metric.name: metric.snapshot() for metric in self.metrics}, file)
+            os.replace(file_name + ".tmp", file_name)
+        except Exception as err:
+            logger.error("Couldn't dump metrics to %s", file_name)
+            logger.error(err)
+
+    def load_snapshots(self):
+        snapshots = []
+        for file_name in sorted(os.listdir(self.multiprocess_dir)):
+            pid = get_pid_from_file_name(file_name)
+            if pid is None:
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, file_name), "r") as file:
+                    snapshots.append((pid, is_process_alive(pid), json.load(file)))
+            except Exception as err:
+                logger.error("Couldn't load metrics from %s", file_name)
+                logger.error(err)
+        return snapshots
+
+    def render(self):
+        lines = []
+        snapshots = None
+        if self.multiprocess_dir:
+            self.dump()
+            snapshots = self.load_snapshots()
+        for metric in self.metrics:
+            if snapshots is None:
+                lines.extend(metric.render())
+            else:
+                lines.extend(metric.render(metric.aggregate([
+                    (pid, alive, values.get(metric.name, [])) for pid, alive, values in snapshots])))
+        return "\n".join(lines) + "\n"
+
+
+def get_pid_from_file_name(file_name):
+    """Gets the pid from the name of a metrics file, None is returned for other files"""
+    pid = file_name[len(METRICS_FILE_PREFIX):-len(".json")]
+    if not file_name.startswith(METRICS_FILE_PREFIX) or not file_name.endswith(".json") or\
+            not pid.isdigit():
+        return None
+    return int(pid)
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = MetricsRegistry()
+os.register_at_fork(after_in_child=registry.recreate_locks)
+
+AMQP_REQUESTS = registry.register(Counter(
+    "analyzer_amqp_requests_total", "Processed AMQP requests", ["routing_key", "status"]))
+AMQP_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "analyzer_amqp_requests_in_flight", "AMQP requests, which are being processed", ["routing_key"],
+    multiprocess_mode="sum"))
+AMQP_REQUEST_DURATION = registry.register(Histogram(
+    "analyzer_amqp_request_duration_seconds", "Time of processing AMQP requests", ["routing_key"]))
+ES_MSEARCH_DURATION = registry.register(Histogram(
+    "analyzer_es_msearch_duration_seconds", "Time of Elasticsearch msearch requests", ["service"]))
+ES_MSEARCH_BATCH_SIZE = registry.register(Histogram(
+    "analyzer_es_msearch_batch_size", "Number of queries in Elasticsearch msearch requests", ["service"],
+    buckets=BATCH_SIZE_BUCKETS))
+FEATURIZATION_DURATION = registry.register(Histogram(
+    "analyzer_featurization_duration_seconds", "Time of gathering features for a test item", ["service"]))
+MODEL_PREDICT_DURATION = registry.register(Histogram(
+    "analyzer_model_predict_duration_seconds", "Time of model predictions for a test item", ["service"]))
+ES_BULK_DOCUMENTS = registry.register(Counter(
+    "analyzer_es_bulk_documents_total", "Documents sent to Elasticsearch bulk requests", ["status"]))
+ES_BULK_DURATION = registry.register(Histogram(
+    "analyzer_es_bulk_duration_seconds", "Time of indexing documents with Elasticsearch bulk requests"))
+ES_BATCH_SIZE = registry.register(Gauge(
+    "analyzer_es_batch_size", "Batch size chosen by the adaptive controller", ["controller"]))
+ES_BATCH_SIZE_DECISIONS = registry.register(Counter(
+    "analyzer_es_batch_size_decisions_total", "Decisions of the adaptive batch size controller",
+    ["controller", "decision"]))
+
+
+def track_amqp_request(func):
+    """Decorator for amqp request handlers, which counts requests by routing keys,
+    requests in flight and their processing time"""
+    @wraps(func)
+    def wrapper(channel, method, props, body, *args, **kwargs):
+        routing_key = getattr(method, "routing_key", "")
+        registry.start_dumping()
+        AMQP_REQUESTS_IN_FLIGHT.inc(routing_key=routing_key)
+        t_start = time()
+        processed = False
+        try:
+            processed = func(channel, method, props, body, *args, **kwargs)
+            return processed
+        finally:
+            AMQP_REQUESTS_IN_FLIGHT.dec(routing_key=routing_key)
+            AMQP_REQUEST_DURATION.observe(time() - t_start, routing_key=routing_key)
+            AMQP_REQUESTS.inc(routing_key=routing_key, status="success" if processed else "error")
+    return wrapper
@@ -16,7 +16,6 @@
 
 import logging
 from commons.object_saving.object_saver import ObjectSaver
-from gensim.models.phrases import Phrases
 
 logger = logging.getLogger("analyzerApp.namespace_finder")
 
@@ -41,6 +40,7 @@ class NamespaceFinder:
             all_words[word] = 1
         self.object_saver.put_project_object(
             all_words, project_id, "project_log_unique_words", using_json=True)
+        from gensim.models.phrases import Phrases
         phrases = Phrases([w.split(".") for w in all_words], min_count=1, threshold=1)
         potential_project_namespaces = {}
         for word in all_words:
@@ -0,0 +1,42 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import threading
+from time import time
+
+
+class RequestContext:
+    """RequestContext carries the deadline and the cancellation flag of one request,
+    so concurrent requests in one process don't affect each other"""
+
+    def __init__(self, timeout=None):
+        self.deadline = time() + timeout if timeout is not None else None
+        self.cancelled = threading.Event()
+
+    def time_left(self):
+        if self.deadline is None:
+            return float("inf")
+        return self.deadline - time()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def should_stop(self, time_reserve=0):
+        """Checks whether the request is cancelled or has less than time_reserve seconds left"""
+        return self.is_cancelled() or self.time_left() <= time_reserve
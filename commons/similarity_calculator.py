@@ -15,9 +15,7 @@
 """
 
 from utils import utils
-from scipy import spatial
 import numpy as np
-from sklearn.feature_extraction.text import CountVectorizer
 
 
 class SimilarityCalculator:
@@ -104,6 +102,7 @@ class SimilarityCalculator:
             if all_messages:
                 needs_reweighting_wc = all_messages_needs_reweighting and\
                     sum(all_messages_needs_reweighting) == len(all_messages_needs_reweighting)
+                from sklearn.feature_extraction.text import CountVectorizer
                 vectorizer = CountVectorizer(
                     binary=not needs_reweighting_wc,
                     analyzer="word", token_pattern="[^ ]+")
@@ -134,6 +133,7 @@ class SimilarityCalculator:
 
     def _calculate_field_similarity(
             self, log, res, log_field_ids, count_vector_matrix, needs_reweighting_wc, field):
+        from scipy import spatial
         all_results_similarity = {}
         for obj in res["hits"]["hits"]:
             group_id = (obj["_id"], log["_id"])
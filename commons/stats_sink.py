@@ -0,0 +1,111 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger("analyzerApp.statsSink")
+
+
+class StatsSink:
+    """StatsSink buffers stats documents and indexes them in bulk, when the buffer
+    has buffer_size documents or every flush_interval seconds. Indices for stats
+    are created or updated once per process"""
+
+    def __init__(self, es_client, buffer_size=1, flush_interval=0):
+        self.es_client = es_client
+        self.buffer_size = max(1, buffer_size)
+        self.flush_interval = flush_interval
+        self.max_buffer_size = self.buffer_size * 10
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.prepared_indices = set()
+        self.stopped = threading.Event()
+        if self.buffer_size > 1 and self.flush_interval > 0:
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+
+    def prepare_index(self, index_name):
+        if index_name in self.prepared_indices:
+            return
+        self.es_client.create_index_for_stats_info(self.es_client.es_client, index_name)
+        self.prepared_indices.add(index_name)
+
+    def add(self, documents):
+        """Adds stats documents to the buffer"""
+        with self.lock:
+            self.buffer.extend(documents)
+            should_flush = len(self.buffer) >= self.buffer_size
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Indexes all buffered documents"""
+        with self.flush_lock:
+            with self.lock:
+                documents = self.buffer
+                self.buffer = []
+            if not documents:
+                return
+            try:
+                for index_name in set(document["_index"] for document in documents):
+                    self.prepare_index(index_name)
+            except Exception as err:
+                logger.error("Couldn't prepare indices for stats info")
+                logger.error(err)
+                with self.lock:
+                    self.buffer = (documents + self.buffer)[-self.max_buffer_size:]
+                return
+            self.es_client._bulk_index(documents, refresh=False)
+            logger.debug("Indexed %d stats documents", len(documents))
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Stops periodic flushing and indexes the remaining documents"""
+        self.stopped.set()
+        self.flush()
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_stats_sink(es_client, app_config):
+    """Gets the stats sink of the current process, a forked process creates its own sink"""
+    key = (app_config["esHost"], os.getpid())
+    with _sinks_lock:
+        if key not in _sinks:
+            _sinks[key] = StatsSink(
+                es_client,
+                buffer_size=app_config["statsBufferSize"]
+                if "statsBufferSize" in app_config else 1,
+                flush_interval=app_config["statsFlushInterval"]
+                if "statsFlushInterval" in app_config else 0)
+        return _sinks[key]
+
+
+@atexit.register
+def close_sinks():
+    for key in list(_sinks):
+        if key[1] == os.getpid():
+            _sinks[key].close()
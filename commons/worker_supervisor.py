@@ -0,0 +1,150 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import gc
+import os
+import logging
+from signal import signal, SIGINT, SIGKILL, SIGTERM, SIG_DFL, SIG_IGN
+from time import sleep, time
+
+logger = logging.getLogger("analyzerApp.workerSupervisor")
+
+
+class WorkerSupervisor:
+    """WorkerSupervisor forks a supervisor process after the models are loaded, it forks
+    worker processes, so workers share the models memory copy-on-write, and restarts crashed workers.
+    Workers are forked only by the main thread of the supervisor, so they don't inherit locks
+    held by threads of the application, start should be called before other threads are started"""
+
+    def __init__(self, workers_number, worker_func, restart_delay=1, poll_interval=0.5, stop_timeout=10):
+        self.workers_number = workers_number
+        self.worker_func = worker_func
+        self.restart_delay = restart_delay
+        self.poll_interval = poll_interval
+        self.stop_timeout = stop_timeout
+        self.workers = {}
+        self.stopped = False
+        self.pid = None
+
+    def start_worker(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            signal(SIGTERM, SIG_DFL)
+            signal(SIGINT, SIG_DFL)
+            self.workers = {}
+            exit_code = 0
+            try:
+                self.worker_func(worker_id)
+            except Exception as err:
+                logger.error("Worker %d failed pid(%d)", worker_id, os.getpid())
+                logger.error(err)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.workers[pid] = worker_id
+        logger.info("Started worker %d pid(%d)", worker_id, pid)
+
+    def start(self):
+        """Forks the supervisor process, returns its pid"""
+        if hasattr(gc, "freeze"):
+            # objects created before fork are moved to the permanent generation,
+            # so garbage collection in workers doesn't touch their pages
+            gc.freeze()
+        parent_pid = os.getpid()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                self.run(parent_pid)
+            except Exception as err:
+                logger.error("Worker supervisor failed pid(%d)", os.getpid())
+                logger.error(err)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.pid = pid
+        logger.info("Started worker supervisor pid(%d)", pid)
+        return pid
+
+    def handle_stop_signal(self, signal_received, frame):
+        self.stopped = True
+
+    def run(self, parent_pid):
+        """Forks workers, waits for them to exit and restarts them. Workers are stopped,
+        when the supervisor gets SIGTERM or its parent process exits"""
+        signal(SIGTERM, self.handle_stop_signal)
+        signal(SIGINT, SIG_IGN)
+        for worker_id in range(self.workers_number):
+            self.start_worker(worker_id)
+        while not self.stopped:
+            if os.getppid() != parent_pid:
+                logger.error("The parent process pid(%d) has exited, stopping workers", parent_pid)
+                break
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = 0, 0
+            if pid == 0:
+                sleep(self.poll_interval)
+                continue
+            if pid not in self.workers:
+                continue
+            worker_id = self.workers.pop(pid)
+            logger.error("Worker %d pid(%d) exited with status %d, restarting it",
+                         worker_id, pid, status)
+            sleep(self.restart_delay)
+            if not self.stopped:
+                self.start_worker(worker_id)
+        self.stop_workers()
+
+    def stop_workers(self):
+        """Stops workers with SIGTERM, workers, which don't exit in stop_timeout seconds, are killed"""
+        self.send_signal(SIGTERM)
+        deadline = time() + self.stop_timeout
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid != 0:
+                self.workers.pop(pid, None)
+            elif time() < deadline:
+                sleep(0.1)
+            else:
+                logger.error("Workers %s haven't stopped, killing them", list(self.workers))
+                self.send_signal(SIGKILL)
+                deadline = float("inf")
+        self.workers = {}
+
+    def send_signal(self, signal_number):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal_number)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+            except Exception as err:
+                logger.error(err)
+
+    def stop(self):
+        """Stops the supervisor process, which stops all workers"""
+        if self.pid is None:
+            return
+        try:
+            os.kill(self.pid, SIGTERM)
+            os.waitpid(self.pid, 0)
+        except Exception as err:
+            logger.error(err)
+        self.pid = None
@@ -16,8 +16,8 @@
 from commons.esclient import EsClient
 from utils import utils
 from commons.log_preparation import LogPreparation
-from boosting_decision_making import defect_type_model, custom_defect_type_model
-from boosting_decision_making import weighted_similarity_calculator
+from boosting_decision_making import custom_defect_type_model
+from boosting_decision_making.model_registry import model_registry
 from commons import namespace_finder
 from commons.object_saving.object_saver import ObjectSaver
 import logging
@@ -41,11 +41,11 @@ class AnalyzerService:
 
     def initialize_common_models(self):
         if self.search_cfg["SimilarityWeightsFolder"].strip():
-            self.weighted_log_similarity_calculator = weighted_similarity_calculator.\
-                WeightedSimilarityCalculator(folder=self.search_cfg["SimilarityWeightsFolder"])
+            self.weighted_log_similarity_calculator = model_registry.get_weighted_similarity_calculator(
+                self.search_cfg["SimilarityWeightsFolder"])
         if self.search_cfg["GlobalDefectTypeModelFolder"].strip():
-            self.global_defect_type_model = defect_type_model.\
-                DefectTypeModel(folder=self.search_cfg["GlobalDefectTypeModelFolder"])
+            self.global_defect_type_model = model_registry.get_defect_type_model(
+                self.search_cfg["GlobalDefectTypeModelFolder"])
 
     def find_min_should_match_threshold(self, analyzer_config):
         return analyzer_config.minShouldMatch if analyzer_config.minShouldMatch > 0 else\
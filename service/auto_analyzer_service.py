@@ -14,20 +14,57 @@
 * limitations under the License.
 """
 from utils import utils
-from commons.launch_objects import AnalysisResult
-from boosting_decision_making import boosting_decision_maker, boosting_featurizer
+from commons.launch_objects import AnalysisResult, Launch, TestItem, Log
+from boosting_decision_making import boosting_featurizer
+from boosting_decision_making.model_registry import model_registry
 from service.analyzer_service import AnalyzerService
-from amqp.amqp import AmqpClient
+from amqp import amqp
 from commons.log_merger import LogMerger
+from commons.request_context import RequestContext
+from commons import metrics
+from commons import batch_size_controller
 import json
 import logging
 from time import time, sleep
 from datetime import datetime
-from queue import Queue
-from threading import Thread
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger("analyzerApp.autoAnalyzerService")
-EARLY_FINISH = False
+MSEARCH_REJECTION_RETRIES = 3
+WARM_UP_MESSAGE = """java.lang.AssertionError: expected [true] but found [false]
+\tat org.testng.Assert.fail(Assert.java:94)
+\tat com.example.tests.WarmUpTest.warmUp(WarmUpTest.java:42)"""
+
+
+class AnalysisState:
+    """AnalysisState keeps models, namespaces and existing indices of projects and stats
+    of launches for chunks of one analyze request, so they are looked up and sent once"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.cache = {}
+        self.results_to_share = {}
+
+    def get(self, name, key, lookup):
+        with self.lock:
+            values = self.cache.setdefault(name, {})
+            if key not in values:
+                values[key] = lookup()
+            return values[key]
+
+    def add_stats(self, results_to_share):
+        with self.lock:
+            for launch_id, launch_stats in results_to_share.items():
+                if launch_id not in self.results_to_share:
+                    self.results_to_share[launch_id] = launch_stats
+                    continue
+                shared_stats = self.results_to_share[launch_id]
+                for field in ["not_found", "items_to_process", "processed_time"]:
+                    shared_stats[field] += launch_stats[field]
+                shared_stats["model_info"].update(launch_stats["model_info"])
 
 
 class AutoAnalyzerService(AnalyzerService):
@@ -35,8 +72,8 @@ class AutoAnalyzerService(AnalyzerService):
     def __init__(self, app_config={}, search_cfg={}):
         super(AutoAnalyzerService, self).__init__(app_config=app_config, search_cfg=search_cfg)
         if self.search_cfg["BoostModelFolder"].strip():
-            self.boosting_decision_maker = boosting_decision_maker.BoostingDecisionMaker(
-                folder=self.search_cfg["BoostModelFolder"])
+            self.boosting_decision_maker = model_registry.get_boosting_decision_maker(
+                self.search_cfg["BoostModelFolder"])
 
     def get_config_for_boosting(self, analyzer_config):
         min_should_match = self.find_min_should_match_threshold(analyzer_config) / 100
@@ -50,6 +87,28 @@ class AutoAnalyzerService(AnalyzerService):
             "filter_by_unique_id": True
         }
 
+    def warm_up(self):
+        """Runs featurization and prediction for a synthetic test item without Elasticsearch,
+        so lazily imported modules are loaded before the first analyze request"""
+        launch = Launch(launchId=0, project=0, testItems=[TestItem(
+            testItemId=0, uniqueId="warm-up", isAutoAnalyzed=False, issueType="pb001",
+            logs=[Log(logId=0, logLevel=utils.ERROR_LOGGING_LEVEL, message=WARM_UP_MESSAGE)])])
+        test_item = launch.testItems[0]
+        log = self.log_preparation._prepare_log(launch, test_item, test_item.logs[0])
+        log["_id"] = "0"
+        hit = {"_id": "1", "_index": "0", "_score": 1.0, "_source": dict(log["_source"])}
+        boosting_config = self.get_config_for_boosting(launch.analyzerConfig)
+        boosting_config["chosen_namespaces"] = {}
+        boosting_data_gatherer = boosting_featurizer.BoostingFeaturizer(
+            [(log, {"hits": {"hits": [hit], "max_score": 1.0}})],
+            boosting_config,
+            feature_ids=self.boosting_decision_maker.get_feature_ids(),
+            weighted_log_similarity_calculator=self.weighted_log_similarity_calculator)
+        boosting_data_gatherer.set_defect_type_model(self.global_defect_type_model)
+        feature_data, _ = boosting_data_gatherer.gather_features_info()
+        if len(feature_data) > 0:
+            self.boosting_decision_maker.predict(feature_data)
+
     def choose_fields_to_filter(self, log_lines):
         return [
             "detected_message", "stacktrace", "potential_status_codes"]\
@@ -148,10 +207,66 @@ class AutoAnalyzerService(AnalyzerService):
 
         return query
 
-    def _send_result_to_queue(self, test_item_dict, batches, batch_logs):
+    def get_msearch_batch_size_controller(self):
+        return batch_size_controller.get_batch_size_controller(
+            "analyze_msearch", self.app_config, "esMsearchMinBatchSize", "esMsearchMaxBatchSize",
+            default_min_size=5, default_max_size=30)
+
+    def _msearch_batch(self, batches):
+        """Sends queries with msearch, the queries rejected by Elasticsearch are sent again
+        a few times, the batch size controller learns from the latency and rejections"""
+        controller = self.get_msearch_batch_size_controller()
         t_start = time()
-        partial_res = self.es_client.es_client.msearch("\n".join(batches) + "\n")["responses"]
-        avg_time_processed = (time() - t_start) / (len(partial_res) if partial_res else 1)
+        partial_res = [None] * len(batches)
+        to_send = list(range(len(batches)))
+        payload_bytes = 0
+        for attempt in range(MSEARCH_REJECTION_RETRIES + 1):
+            body = "\n".join(batches[ind] for ind in to_send) + "\n"
+            payload_bytes += len(body)
+            try:
+                responses = self.es_client.es_client.msearch(body)["responses"]
+            except Exception as err:
+                if attempt == MSEARCH_REJECTION_RETRIES or not batch_size_controller.is_rejection(err):
+                    raise
+                responses = [{"status": 429, "error": str(err)}] * len(to_send)
+            rejected = []
+            for ind, response in zip(to_send, responses):
+                partial_res[ind] = response
+                if batch_size_controller.is_rejected_response(response):
+                    rejected.append(ind)
+            if not rejected:
+                break
+            controller.on_rejection()
+            if attempt < MSEARCH_REJECTION_RETRIES:
+                logger.info("Elasticsearch rejected %d queries, they will be sent again", len(rejected))
+                to_send = rejected
+                sleep(0.1 * 2 ** attempt)
+            else:
+                logger.error("Elasticsearch rejected %d queries, they are analyzed without results",
+                             len(rejected))
+                for ind in rejected:
+                    partial_res[ind] = {"hits": {"hits": []}}
+        time_spent = time() - t_start
+        metrics.ES_MSEARCH_DURATION.observe(time_spent, service="analyze")
+        metrics.ES_MSEARCH_BATCH_SIZE.observe(len(batches), service="analyze")
+        if attempt == 0:
+            controller.observe(time_spent, len(batches), payload_bytes)
+        return partial_res, time_spent
+
+    def _put_result(self, results_queue, context, item):
+        """Puts an item to the bounded results queue, waiting for the free place
+        until the request context is cancelled"""
+        while not context.is_cancelled():
+            try:
+                results_queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _send_result_to_queue(self, results_queue, context, test_item_dict, batch_logs, msearch_future):
+        partial_res, time_spent = msearch_future.result()
+        avg_time_processed = time_spent / (len(partial_res) if partial_res else 1)
         for test_item_id in test_item_dict:
             new_result = []
             time_processed = 0.0
@@ -159,32 +274,40 @@ class AutoAnalyzerService(AnalyzerService):
                 all_info = batch_logs[ind]
                 new_result.append((all_info[2], partial_res[ind]))
                 time_processed += avg_time_processed
-            self.queue.put((all_info[0], all_info[1], new_result, time_processed))
+            result = (all_info[0], all_info[1], new_result, time_processed)
+            if not self._put_result(results_queue, context, result):
+                break
 
-    def _query_elasticsearch(self, launches, max_batch_size=30):
+    def _query_elasticsearch(self, launches, context, results_queue, finished_queue, state):
         t_start = time()
         batches = []
         batch_logs = []
         index_in_batch = 0
         test_item_dict = {}
-        batch_size = 5
-        n_first_blocks = 3
+        controller = self.get_msearch_batch_size_controller()
         test_items_number_to_process = 0
+        cnt_launches = 0
+        msearch_concurrency = max(1, self.app_config["esMsearchConcurrency"]
+                                  if "esMsearchConcurrency" in self.app_config else 1)
+        msearch_executor = ThreadPoolExecutor(max_workers=msearch_concurrency)
+        in_flight_batches = deque()
         try:
             for launch in launches:
-                if not self.es_client.index_exists(str(launch.project)):
+                cnt_launches += 1
+                if context.is_cancelled():
+                    logger.info("Early finish from analyzer before timeout")
+                    break
+                project = str(launch.project)
+                if not state.get("index_exists", project, lambda: self.es_client.index_exists(project)):
                     continue
                 if test_items_number_to_process >= 4000:
                     logger.info("Only first 4000 test items were taken")
                     break
-                if EARLY_FINISH:
-                    logger.info("Early finish from analyzer before timeout")
-                    break
                 for test_item in launch.testItems:
                     if test_items_number_to_process >= 4000:
                         logger.info("Only first 4000 test items were taken")
                         break
-                    if EARLY_FINISH:
+                    if context.is_cancelled():
                         logger.info("Early finish from analyzer before timeout")
                         break
                     unique_logs = utils.leave_only_unique_logs(test_item.logs)
@@ -208,35 +331,58 @@ class AutoAnalyzerService(AnalyzerService):
                             test_item_dict[test_item.testItemId] = []
                         test_item_dict[test_item.testItemId].append(index_in_batch)
                         index_in_batch += 1
-                    if n_first_blocks <= 0:
-                        batch_size = max_batch_size
-                    if len(batches) >= batch_size:
-                        n_first_blocks -= 1
-                        self._send_result_to_queue(test_item_dict, batches, batch_logs)
+                    if len(batches) >= controller.batch_size:
+                        if len(in_flight_batches) >= msearch_concurrency:
+                            self._send_result_to_queue(results_queue, context, *in_flight_batches.popleft())
+                        msearch_future = msearch_executor.submit(self._msearch_batch, batches)
+                        in_flight_batches.append((test_item_dict, batch_logs, msearch_future))
                         batches = []
                         batch_logs = []
                         test_item_dict = {}
                         index_in_batch = 0
                     test_items_number_to_process += 1
             if len(batches) > 0:
-                self._send_result_to_queue(test_item_dict, batches, batch_logs)
+                msearch_future = msearch_executor.submit(self._msearch_batch, batches)
+                in_flight_batches.append((test_item_dict, batch_logs, msearch_future))
+            while in_flight_batches:
+                self._send_result_to_queue(results_queue, context, *in_flight_batches.popleft())
 
         except Exception as err:
             logger.error("Error in ES query")
             logger.error(err)
-        self.finished_queue.put("Finished")
+        msearch_executor.shutdown(wait=False)
+        finished_queue.put(cnt_launches)
         logger.info("Es queries finished %.2f s.", time() - t_start)
 
+    def send_stats_info(self, state):
+        """Sends stats of launches gathered in the analysis state"""
+        if not state.results_to_share or\
+                "amqpUrl" not in self.app_config or not self.app_config["amqpUrl"].strip():
+            return
+        results_to_share = {}
+        for launch_id, launch_stats in state.results_to_share.items():
+            results_to_share[launch_id] = dict(launch_stats, model_info=list(launch_stats["model_info"]))
+        amqp.get_publisher(self.app_config).send_to_inner_queue(
+            self.app_config["exchangeName"], "stats_info", json.dumps(results_to_share))
+
     @utils.ignore_warnings
-    def analyze_logs(self, launches, timeout=300):
-        global EARLY_FINISH
-        cnt_launches = len(launches)
-        logger.info("Started analysis for %d launches", cnt_launches)
+    def analyze_logs(self, launches, timeout=300, context=None, state=None):
+        """Analyzes launches until the request context is cancelled or 5 seconds before
+        its deadline, by default the context has a deadline in timeout seconds.
+        If the analysis state of a request split into chunks is given, stats are added to it
+        and should be sent with send_stats_info after all chunks are analyzed"""
+        if context is None:
+            context = RequestContext(timeout)
+        send_stats = state is None
+        if state is None:
+            state = AnalysisState()
+        logger.info("Started analysis")
         logger.info("ES Url %s", utils.remove_credentials_from_url(self.es_client.host))
-        self.queue = Queue()
-        self.finished_queue = Queue()
-        defect_type_model_to_use = {}
-        es_query_thread = Thread(target=self._query_elasticsearch, args=(launches, ))
+        results_queue = Queue(maxsize=self.app_config["analyzeResultsQueueSize"]
+                              if "analyzeResultsQueueSize" in self.app_config else 0)
+        finished_queue = Queue()
+        es_query_thread = Thread(target=self._query_elasticsearch,
+                                 args=(launches, context, results_queue, finished_queue, state))
         es_query_thread.daemon = True
         es_query_thread.start()
         try:
@@ -246,16 +392,14 @@ class AutoAnalyzerService(AnalyzerService):
 
             cnt_items_to_process = 0
             results_to_share = {}
-            chosen_namespaces = {}
-            while self.finished_queue.empty() or not self.queue.empty():
-                if (timeout - (time() - t_start)) <= 5:  # check whether we are running out of time
-                    EARLY_FINISH = True
+            while finished_queue.empty() or not results_queue.empty():
+                if context.should_stop(time_reserve=5):  # check whether we are running out of time
+                    context.cancel()
                     break
-                if self.queue.empty():
-                    sleep(0.1)
+                try:
+                    item_to_process = results_queue.get(timeout=0.1)
+                except Empty:
                     continue
-                else:
-                    item_to_process = self.queue.get()
                 analyzer_config, test_item_id, searched_res, time_processed = item_to_process
                 launch_id = searched_res[0][0]["_source"]["launch_id"]
                 launch_name = searched_res[0][0]["_source"]["launch_name"]
@@ -277,32 +421,35 @@ class AutoAnalyzerService(AnalyzerService):
                 results_to_share[launch_id]["items_to_process"] += 1
                 results_to_share[launch_id]["processed_time"] += time_processed
                 boosting_config = self.get_config_for_boosting(analyzer_config)
-                if project_id not in chosen_namespaces:
-                    chosen_namespaces[project_id] = self.namespace_finder.get_chosen_namespaces(project_id)
-                boosting_config["chosen_namespaces"] = chosen_namespaces[project_id]
+                boosting_config["chosen_namespaces"] = state.get(
+                    "chosen_namespaces", project_id,
+                    lambda: self.namespace_finder.get_chosen_namespaces(project_id))
 
+                t_start_features = time()
                 boosting_data_gatherer = boosting_featurizer.BoostingFeaturizer(
                     searched_res,
                     boosting_config,
                     feature_ids=self.boosting_decision_maker.get_feature_ids(),
                     weighted_log_similarity_calculator=self.weighted_log_similarity_calculator)
-                if project_id not in defect_type_model_to_use:
-                    defect_type_model_to_use[project_id] = self.choose_model(
-                        project_id, "defect_type_model/")
-                if defect_type_model_to_use[project_id] is None:
+                defect_type_model = state.get(
+                    "defect_type_model", project_id,
+                    lambda: self.choose_model(project_id, "defect_type_model/"))
+                if defect_type_model is None:
                     boosting_data_gatherer.set_defect_type_model(self.global_defect_type_model)
                 else:
-                    boosting_data_gatherer.set_defect_type_model(
-                        defect_type_model_to_use[project_id])
+                    boosting_data_gatherer.set_defect_type_model(defect_type_model)
                 feature_data, issue_type_names = boosting_data_gatherer.gather_features_info()
+                metrics.FEATURIZATION_DURATION.observe(time() - t_start_features, service="analyze")
                 model_info_tags = boosting_data_gatherer.get_used_model_info() +\
                     self.boosting_decision_maker.get_model_info()
                 results_to_share[launch_id]["model_info"].update(model_info_tags)
 
                 if len(feature_data) > 0:
 
+                    t_start_predict = time()
                     predicted_labels, predicted_labels_probability =\
                         self.boosting_decision_maker.predict(feature_data)
+                    metrics.MODEL_PREDICT_DURATION.observe(time() - t_start_predict, service="analyze")
 
                     scores_by_issue_type = boosting_data_gatherer.scores_by_issue_type
 
@@ -338,18 +485,14 @@ class AutoAnalyzerService(AnalyzerService):
                     results_to_share[launch_id]["not_found"] += 1
                     logger.debug("There are no results for test item %s", test_item_id)
                 results_to_share[launch_id]["processed_time"] += (time() - t_start_item)
-            if "amqpUrl" in self.app_config and self.app_config["amqpUrl"].strip():
-                for launch_id in results_to_share:
-                    results_to_share[launch_id]["model_info"] = list(
-                        results_to_share[launch_id]["model_info"])
-                AmqpClient(self.app_config["amqpUrl"]).send_to_inner_queue(
-                    self.app_config["exchangeName"], "stats_info", json.dumps(results_to_share))
+            state.add_stats(results_to_share)
+            if send_stats:
+                self.send_stats_info(state)
         except Exception as err:
             logger.error(err)
+            context.cancel()
         es_query_thread.join()
-        EARLY_FINISH = False
-        self.queue = Queue()
-        self.finished_queue = Queue()
+        cnt_launches = finished_queue.get() if not finished_queue.empty() else 0
         logger.debug("Stats info %s", results_to_share)
         logger.info("Processed %d test items. It took %.2f sec.", cnt_items_to_process, time() - t_start)
         logger.info("Finished analysis for %d launches with %d results.", cnt_launches, len(results))
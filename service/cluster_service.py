@@ -14,11 +14,16 @@
 * limitations under the License.
 """
 from commons.esclient import EsClient
+from commons import esclient
 from commons import clusterizer
 from utils import utils
 from commons.launch_objects import ClusterResult
 from commons.log_preparation import LogPreparation
-from amqp.amqp import AmqpClient
+from amqp import amqp
+from commons import metrics
+from commons import batch_size_controller
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
 from time import time
@@ -26,6 +31,8 @@ from datetime import datetime
 import uuid
 
 logger = logging.getLogger("analyzerApp.clusterService")
+CLUSTER_UPDATE_CHUNK_SIZE = 1000
+CLUSTER_UPDATE_RETRIES = 2
 
 
 class ClusterService:
@@ -65,23 +72,57 @@ class ClusterService:
                         }}
                     ]}}}
 
-    def find_similar_items_from_es(
-            self, groups, log_dict, log_messages, log_ids, number_of_lines):
-        new_clusters = {}
-        _clusterizer = clusterizer.Clusterizer()
+    def _msearch_similar_items(self, queries):
+        t_start = time()
+        responses = self.es_client.es_client.msearch("\n".join(queries) + "\n")["responses"]
+        metrics.ES_MSEARCH_DURATION.observe(time() - t_start, service="cluster")
+        metrics.ES_MSEARCH_BATCH_SIZE.observe(len(queries), service="cluster")
+        batch_size_controller.get_batch_size_controller(
+            "cluster_msearch", self.app_config, "esMsearchMinBatchSize", "esMsearchMaxBatchSize",
+            default_min_size=5, default_max_size=30).observe(time() - t_start, len(queries))
+        return responses
+
+    def search_similar_items(self, groups, log_dict, log_messages):
+        """Searches similar items for all groups with msearch requests, several requests
+        are sent at once, responses are yielded in the order of groups"""
+        controller = batch_size_controller.get_batch_size_controller(
+            "cluster_msearch", self.app_config, "esMsearchMinBatchSize", "esMsearchMaxBatchSize",
+            default_min_size=5, default_max_size=30)
+        msearch_concurrency = max(1, self.app_config["esMsearchConcurrency"]
+                                  if "esMsearchConcurrency" in self.app_config else 1)
+        queries = []
         for global_group in groups:
             first_item_ind = groups[global_group][0]
             query = self.build_search_similar_items_query(
                 log_dict[first_item_ind]["_source"]["launch_id"],
                 log_dict[first_item_ind]["_source"]["test_item"],
                 log_messages[first_item_ind])
-            search_results = self.es_client.es_client.search(
-                index=log_dict[first_item_ind]["_index"],
-                body=query)
+            queries.append("{}\n{}".format(
+                json.dumps({"index": str(log_dict[first_item_ind]["_index"])}), json.dumps(query)))
+        with ThreadPoolExecutor(max_workers=msearch_concurrency) as executor:
+            in_flight_batches = deque()
+            start = 0
+            while start < len(queries) or in_flight_batches:
+                while start < len(queries) and len(in_flight_batches) < msearch_concurrency:
+                    batch = queries[start:start + controller.batch_size]
+                    in_flight_batches.append(executor.submit(self._msearch_similar_items, batch))
+                    start += len(batch)
+                for search_results in in_flight_batches.popleft().result():
+                    yield search_results
+
+    def find_similar_items_from_es(
+            self, groups, log_dict, log_messages, log_ids, number_of_lines):
+        new_clusters = {}
+        _clusterizer = clusterizer.Clusterizer()
+        for global_group, search_results in zip(
+                groups, self.search_similar_items(groups, log_dict, log_messages)):
+            first_item_ind = groups[global_group][0]
             log_messages_part = [log_messages[first_item_ind]]
             log_dict_part = {0: log_dict[first_item_ind]}
             ind = 1
-            for res in search_results["hits"]["hits"]:
+            if "error" in search_results:
+                logger.error("Error in searching similar items: %s", search_results["error"])
+            for res in search_results["hits"]["hits"] if "hits" in search_results else []:
                 if int(res["_id"]) in log_ids:
                     continue
                 log_dict_part[ind] = res
@@ -141,6 +182,58 @@ class ClusterService:
                 results_to_return.extend(additional_results[group])
         return results_to_return, cluster_num
 
+    def _update_cluster_ids_chunk(self, index_name, log_clusters, chunk_log_ids, refresh):
+        return self.es_client.es_client.update_by_query(
+            index=index_name,
+            body={
+                "query": {"ids": {"values": chunk_log_ids}},
+                "script": {
+                    "source": "ctx._source.cluster_id = params.log_clusters[ctx._id]",
+                    "lang": "painless",
+                    "params": {"log_clusters": {
+                        log_id: log_clusters[log_id] for log_id in chunk_log_ids}}}},
+            conflicts="proceed",
+            refresh=refresh,
+            request_timeout=30)
+
+    def update_cluster_ids(self, cluster_results):
+        """Updates cluster ids of logs with update_by_query requests, which find logs by ids
+        and take cluster ids from the log id to cluster id map in the script params.
+        The script sets the same values, so a chunk with version conflicts is updated again"""
+        log_clusters_by_index = {}
+        for result in cluster_results:
+            log_clusters = log_clusters_by_index.setdefault(str(result.project), {})
+            log_clusters[str(result.logId)] = result.clusterId
+        # update_by_query doesn't support "wait_for", the index is refreshed only after the last chunk
+        refresh = esclient.get_refresh_policy(self.app_config, "cluster") is not False
+        for index_name, log_clusters in log_clusters_by_index.items():
+            log_ids = list(log_clusters)
+            for start in range(0, len(log_ids), CLUSTER_UPDATE_CHUNK_SIZE):
+                chunk_log_ids = log_ids[start:start + CLUSTER_UPDATE_CHUNK_SIZE]
+                t_start = time()
+                try:
+                    for attempt in range(CLUSTER_UPDATE_RETRIES + 1):
+                        res = self._update_cluster_ids_chunk(
+                            index_name, log_clusters, chunk_log_ids,
+                            refresh and start + CLUSTER_UPDATE_CHUNK_SIZE >= len(log_ids))
+                        if res["failures"] or not res["version_conflicts"]:
+                            break
+                        logger.info("Cluster ids of %d logs in the index %s had version conflicts, "
+                                    "attempt %d", res["version_conflicts"], index_name, attempt + 1)
+                    if res["failures"]:
+                        logger.error("Failed to update cluster ids in the index %s: %s",
+                                     index_name, res["failures"])
+                    if res["version_conflicts"]:
+                        logger.error("Cluster ids of %d logs in the index %s weren't updated "
+                                     "because of version conflicts", res["version_conflicts"], index_name)
+                    metrics.ES_BULK_DOCUMENTS.inc(res["updated"], status="success")
+                    metrics.ES_BULK_DOCUMENTS.inc(len(chunk_log_ids) - res["updated"], status="error")
+                except Exception as err:
+                    logger.error("Error in updating cluster ids")
+                    logger.error(err)
+                    metrics.ES_BULK_DOCUMENTS.inc(len(chunk_log_ids), status="error")
+                metrics.ES_BULK_DURATION.observe(time() - t_start)
+
     @utils.ignore_warnings
     def find_clusters(self, launch_info):
         logger.info("Started clusterizing logs")
@@ -162,14 +255,7 @@ class ClusterService:
         results_to_return, cluster_num = self.gather_cluster_results(
             groups, additional_results, log_dict)
         if results_to_return:
-            bodies = []
-            for result in results_to_return:
-                bodies.append({
-                    "_op_type": "update",
-                    "_id": result.logId,
-                    "_index": result.project,
-                    "doc": {"cluster_id": result.clusterId}})
-            self.es_client._bulk_index(bodies)
+            self.update_cluster_ids(results_to_return)
 
         results_to_share = {launch_info.launch.launchId: {
             "not_found": int(cluster_num == 0), "items_to_process": len(log_ids),
@@ -181,7 +267,7 @@ class ClusterService:
             "module_version": [self.app_config["appVersion"]],
             "model_info": []}}
         if "amqpUrl" in self.app_config and self.app_config["amqpUrl"].strip():
-            AmqpClient(self.app_config["amqpUrl"]).send_to_inner_queue(
+            amqp.get_publisher(self.app_config).send_to_inner_queue(
                 self.app_config["exchangeName"], "stats_info", json.dumps(results_to_share))
 
         logger.debug("Stats info %s", results_to_share)
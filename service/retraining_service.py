@@ -22,7 +22,7 @@ from commons import namespace_finder
 from commons.esclient import EsClient
 from commons.triggering_training.retraining_defect_type_triggering import RetrainingDefectTypeTriggering
 from boosting_decision_making.training_models import training_defect_type_model
-from amqp.amqp import AmqpClient
+from amqp import amqp
 
 logger = logging.getLogger("analyzerApp.retrainingService")
 
@@ -54,7 +54,7 @@ class RetrainingService:
                 _retraining_triggering.clean_defect_type_triggering_info(
                     train_info, gathered_data)
                 if "amqpUrl" in self.app_config and self.app_config["amqpUrl"].strip():
-                    AmqpClient(self.app_config["amqpUrl"]).send_to_inner_queue(
+                    amqp.get_publisher(self.app_config).send_to_inner_queue(
                         self.app_config["exchangeName"], "stats_info", json.dumps(training_log_info))
             except Exception as err:
                 logger.error("Training finished with errors")
@@ -18,12 +18,17 @@ from commons.esclient import EsClient
 from utils import utils
 from commons.launch_objects import SearchLogInfo, Log
 from commons.log_preparation import LogPreparation
-from boosting_decision_making import weighted_similarity_calculator
+from boosting_decision_making.model_registry import model_registry
 from commons import similarity_calculator
+from commons import metrics
+import json
 import logging
 from time import time
 
 logger = logging.getLogger("analyzerApp.searchService")
+SEARCH_LOGS_MAX_HITS = 10000
+SEARCH_LOGS_FILTER_PATH = ["responses.status", "responses.error", "responses.hits.hits._id",
+                           "responses.hits.hits._source", "responses.hits.hits.sort"]
 
 
 class SearchService:
@@ -35,14 +40,16 @@ class SearchService:
         self.log_preparation = LogPreparation()
         self.weighted_log_similarity_calculator = None
         if self.search_cfg["SimilarityWeightsFolder"].strip():
-            self.weighted_log_similarity_calculator = weighted_similarity_calculator.\
-                WeightedSimilarityCalculator(folder=self.search_cfg["SimilarityWeightsFolder"])
+            self.weighted_log_similarity_calculator = model_registry.get_weighted_similarity_calculator(
+                self.search_cfg["SimilarityWeightsFolder"])
 
-    def build_search_query(self, search_req, message):
-        """Build search query"""
-        return {
+    def build_search_query(self, search_req, message, size=SEARCH_LOGS_MAX_HITS, search_after=None):
+        """Build search query, hits are sorted by score and the index order,
+        so the next page can be requested with search_after"""
+        query = {
             "_source": ["message", "test_item", "detected_message", "stacktrace"],
-            "size": 10000,
+            "size": size,
+            "sort": [{"_score": {"order": "desc"}}, {"_doc": {"order": "asc"}}],
             "query": {
                 "bool": {
                     "filter": [
@@ -76,6 +83,41 @@ class SearchService:
                     "should": [
                         {"term": {"is_auto_analyzed": {"value": "false", "boost": 1.0}}},
                     ]}}}
+        if search_after is not None:
+            query["search_after"] = search_after
+        return query
+
+    def search_similar_logs(self, search_req, messages):
+        """Searches logs similar to all messages with msearch requests, the next pages
+        of hits are requested only for messages, which got the full page"""
+        page_size = min(SEARCH_LOGS_MAX_HITS, self.app_config["searchLogsPageSize"]
+                        if "searchLogsPageSize" in self.app_config else SEARCH_LOGS_MAX_HITS)
+        results = [{"hits": {"hits": []}} for _ in messages]
+        search_after = [None] * len(messages)
+        messages_to_search = list(range(len(messages)))
+        while messages_to_search:
+            queries = []
+            for idx in messages_to_search:
+                query = self.build_search_query(
+                    search_req, messages[idx], size=page_size, search_after=search_after[idx])
+                queries.append("{}\n{}".format(
+                    json.dumps({"index": str(search_req.projectId)}), json.dumps(query)))
+            t_start = time()
+            responses = self.es_client.es_client.msearch(
+                "\n".join(queries) + "\n", filter_path=SEARCH_LOGS_FILTER_PATH)["responses"]
+            metrics.ES_MSEARCH_DURATION.observe(time() - t_start, service="search")
+            metrics.ES_MSEARCH_BATCH_SIZE.observe(len(queries), service="search")
+            next_messages_to_search = []
+            for idx, res in zip(messages_to_search, responses):
+                if "error" in res:
+                    logger.error("Error in searching logs: %s", res["error"])
+                hits = res["hits"]["hits"] if "hits" in res else []
+                results[idx]["hits"]["hits"].extend(hits)
+                if len(hits) == page_size and len(results[idx]["hits"]["hits"]) < SEARCH_LOGS_MAX_HITS:
+                    search_after[idx] = hits[-1]["sort"]
+                    next_messages_to_search.append(idx)
+            messages_to_search = next_messages_to_search
+        return results
 
     def search_logs(self, search_req):
         """Get all logs similar to given logs"""
@@ -86,6 +128,7 @@ class SearchService:
         if not self.es_client.index_exists(str(search_req.projectId)):
             return []
         searched_logs = set()
+        queried_logs = []
         test_item_info = {}
 
         for message in search_req.logMessages:
@@ -102,11 +145,21 @@ class SearchService:
             if not msg_words.strip() or msg_words in searched_logs:
                 continue
             searched_logs.add(msg_words)
-            query = self.build_search_query(search_req, queried_log["_source"]["message"])
-            res = self.es_client.es_client.search(index=str(search_req.projectId), body=query)
+            queried_log["_id"] = "queried_log_%d" % len(queried_logs)
+            queried_logs.append(queried_log)
+        if not queried_logs:
+            return []
+
+        searched_res = self.search_similar_logs(
+            search_req, [queried_log["_source"]["message"] for queried_log in queried_logs])
+        for res in searched_res:
             for es_res in res["hits"]["hits"]:
                 test_item_info[es_res["_id"]] = es_res["_source"]["test_item"]
 
+        # similarity is calculated for each message, so the term matrix has only hits of one message
+        for queried_log, res in zip(queried_logs, searched_res):
+            if not res["hits"]["hits"]:
+                continue
             _similarity_calculator = similarity_calculator.SimilarityCalculator(
                 {
                     "max_query_terms": self.search_cfg["MaxQueryTerms"],
@@ -120,8 +173,8 @@ class SearchService:
             for group_id, similarity_obj in _similarity_calculator.similarity_dict["message"].items():
                 log_id, _ = group_id
                 similarity_percent = similarity_obj["similarity"]
-                logger.debug("Log with id %s has %.3f similarity with the queried log '%s'",
-                             log_id, similarity_percent, queried_log["_source"]["message"])
+                logger.debug("Log with id %s has %.3f similarity with the queried log %s",
+                             log_id, similarity_percent, group_id[1])
                 if similarity_percent >= self.search_cfg["SearchLogsMinSimilarity"]:
                     similar_log_ids.add((utils.extract_real_id(log_id), int(test_item_info[log_id])))
 
@@ -15,18 +15,23 @@
 """
 from utils import utils
 from commons.launch_objects import SuggestAnalysisResult
-from boosting_decision_making import boosting_decision_maker
+from boosting_decision_making.model_registry import model_registry
 from boosting_decision_making.suggest_boosting_featurizer import SuggestBoostingFeaturizer
-from amqp.amqp import AmqpClient
+from amqp import amqp
 from commons.log_merger import LogMerger
 from service.analyzer_service import AnalyzerService
 from commons import similarity_calculator
+from commons import metrics
 import json
 import logging
 from time import time
 from datetime import datetime
 
 logger = logging.getLogger("analyzerApp.suggestService")
+SUGGEST_QUERY_FIELDS = [
+    ("message_extended", "detected_message_extended"),
+    ("message_without_params_extended", "detected_message_without_params_extended"),
+    ("message_without_params_and_brackets", "detected_message_without_params_and_brackets")]
 
 
 class SuggestService(AnalyzerService):
@@ -35,8 +40,8 @@ class SuggestService(AnalyzerService):
         super(SuggestService, self).__init__(app_config=app_config, search_cfg=search_cfg)
         self.suggest_threshold = 0.4
         if self.search_cfg["SuggestBoostModelFolder"].strip():
-            self.suggest_decision_maker = boosting_decision_maker.BoostingDecisionMaker(
-                folder=self.search_cfg["SuggestBoostModelFolder"])
+            self.suggest_decision_maker = model_registry.get_boosting_decision_maker(
+                self.search_cfg["SuggestBoostModelFolder"])
 
     def get_config_for_boosting_suggests(self, analyzerConfig):
         return {
@@ -172,8 +177,10 @@ class SuggestService(AnalyzerService):
         return query
 
     def query_es_for_suggested_items(self, test_item_info, logs):
-        full_results = []
-
+        """Searches similar logs with all query variants in one msearch request,
+        results are returned in the order of logs and query variants"""
+        queries = []
+        searched_logs = []
         for log in logs:
             message = log["_source"]["message"].strip()
             merged_small_logs = log["_source"]["merged_small_logs"].strip()
@@ -181,30 +188,22 @@ class SuggestService(AnalyzerService):
                     (not message and not merged_small_logs):
                 continue
 
-            query = self.build_suggest_query(
-                test_item_info, log,
-                message_field="message_extended",
-                det_mes_field="detected_message_extended",
-                stacktrace_field="stacktrace_extended")
-            es_res = self.es_client.es_client.search(index=str(test_item_info.project), body=query)
-            full_results.append((log, es_res))
-
-            query = self.build_suggest_query(
-                test_item_info, log,
-                message_field="message_without_params_extended",
-                det_mes_field="detected_message_without_params_extended",
-                stacktrace_field="stacktrace_extended")
-            es_res = self.es_client.es_client.search(index=str(test_item_info.project), body=query)
-            full_results.append((log, es_res))
-
-            query = self.build_suggest_query(
-                test_item_info, log,
-                message_field="message_without_params_and_brackets",
-                det_mes_field="detected_message_without_params_and_brackets",
-                stacktrace_field="stacktrace_extended")
-            es_res = self.es_client.es_client.search(index=str(test_item_info.project), body=query)
-            full_results.append((log, es_res))
-        return full_results
+            for message_field, det_mes_field in SUGGEST_QUERY_FIELDS:
+                query = self.build_suggest_query(
+                    test_item_info, log,
+                    message_field=message_field,
+                    det_mes_field=det_mes_field,
+                    stacktrace_field="stacktrace_extended")
+                queries.append("{}\n{}".format(
+                    json.dumps({"index": str(test_item_info.project)}), json.dumps(query)))
+                searched_logs.append(log)
+        if not queries:
+            return []
+        t_start = time()
+        partial_res = self.es_client.es_client.msearch("\n".join(queries) + "\n")["responses"]
+        metrics.ES_MSEARCH_DURATION.observe(time() - t_start, service="suggest")
+        metrics.ES_MSEARCH_BATCH_SIZE.observe(len(queries), service="suggest")
+        return list(zip(searched_logs, partial_res))
 
     def deduplicate_results(self, gathered_results, scores_by_test_items, test_item_ids):
         _similarity_calculator = similarity_calculator.SimilarityCalculator(
@@ -286,6 +285,7 @@ class SuggestService(AnalyzerService):
         boosting_config["chosen_namespaces"] = self.namespace_finder.get_chosen_namespaces(
             test_item_info.project)
 
+        t_start_features = time()
         _boosting_data_gatherer = SuggestBoostingFeaturizer(
             searched_res,
             boosting_config,
@@ -298,12 +298,15 @@ class SuggestService(AnalyzerService):
         else:
             _boosting_data_gatherer.set_defect_type_model(defect_type_model_to_use)
         feature_data, test_item_ids = _boosting_data_gatherer.gather_features_info()
+        metrics.FEATURIZATION_DURATION.observe(time() - t_start_features, service="suggest")
         scores_by_test_items = _boosting_data_gatherer.scores_by_issue_type
         model_info_tags = _boosting_data_gatherer.get_used_model_info() +\
             self.suggest_decision_maker.get_model_info()
 
         if feature_data:
+            t_start_predict = time()
             predicted_labels, predicted_labels_probability = self.suggest_decision_maker.predict(feature_data)
+            metrics.MODEL_PREDICT_DURATION.observe(time() - t_start_predict, service="suggest")
             sorted_results = self.sort_results(
                 scores_by_test_items, test_item_ids, predicted_labels_probability)
 
@@ -358,7 +361,7 @@ class SuggestService(AnalyzerService):
             "min_should_match": self.find_min_should_match_threshold(
                 test_item_info.analyzerConfig)}}
         if "amqpUrl" in self.app_config and self.app_config["amqpUrl"].strip():
-            AmqpClient(self.app_config["amqpUrl"]).send_to_inner_queue(
+            amqp.get_publisher(self.app_config).send_to_inner_queue(
                 self.app_config["exchangeName"], "stats_info", json.dumps(results_to_share))
 
         logger.debug("Stats info %s", results_to_share)
@@ -0,0 +1,141 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+import threading
+from queue import Queue, Empty
+from types import SimpleNamespace
+from unittest.mock import patch
+import sure # noqa
+from amqp.amqp import AmqpClient
+from utils import utils
+
+
+class FakeChannel:
+
+    def __init__(self, connection, messages):
+        self.connection = connection
+        self.messages = messages
+        self.prefetch_count = None
+        self.auto_ack = None
+        self.on_message_callback = None
+        self.acked = []
+        self.published = []
+        self.connection_thread_calls = []
+
+    def queue_declare(self, queue, **kwargs):
+        return SimpleNamespace(method=SimpleNamespace(queue=queue))
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def basic_qos(self, prefetch_count, prefetch_size):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, auto_ack, exclusive, on_message_callback):
+        self.auto_ack = auto_ack
+        self.on_message_callback = on_message_callback
+
+    def basic_ack(self, delivery_tag):
+        self.connection_thread_calls.append(threading.current_thread() == self.connection.thread)
+        self.acked.append(delivery_tag)
+
+    def basic_publish(self, **kwargs):
+        self.connection_thread_calls.append(threading.current_thread() == self.connection.thread)
+        self.published.append(kwargs["body"])
+
+    def start_consuming(self):
+        """Delivers messages and runs callbacks added by other threads, as the pika I/O loop does"""
+        self.connection.thread = threading.current_thread()
+        for delivery_tag, body in enumerate(self.messages):
+            self.on_message_callback(self, SimpleNamespace(delivery_tag=delivery_tag), None, body)
+        while self.auto_ack is False and len(self.acked) < len(self.messages):
+            try:
+                self.connection.callbacks.get(timeout=5)()
+            except Empty:
+                break
+
+
+class FakeConnection:
+
+    def __init__(self, messages):
+        self.callbacks = Queue()
+        self.thread = None
+        self.fake_channel = FakeChannel(self, messages)
+
+    def channel(self):
+        return self.fake_channel
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+
+class TestAmqpConsumer(unittest.TestCase):
+    """Tests processing messages by a pool of consumers"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def receive(self, messages, msg_callback, consumers_number):
+        connection = FakeConnection(messages)
+        with patch("amqp.amqp.AmqpClient.create_ampq_connection", return_value=connection):
+            AmqpClient("amqp://localhost").receive(
+                "analyzer", "analyze", True, False, msg_callback, consumers_number)
+        return connection.fake_channel
+
+    @utils.ignore_warnings
+    def test_messages_are_processed_by_pool(self):
+        all_messages_started = threading.Barrier(3, timeout=5)
+        worker_threads = set()
+
+        def msg_callback(channel, method, props, body):
+            worker_threads.add(threading.current_thread())
+            all_messages_started.wait()
+            if body == "wrong":
+                raise ValueError("Failed to process the message")
+            channel.basic_publish(exchange="", routing_key="reply", body=body)
+
+        channel = self.receive(["first", "wrong", "second"], msg_callback, 3)
+
+        channel.prefetch_count.should.equal(3)
+        channel.auto_ack.should.be.false
+        sorted(channel.acked).should.equal([0, 1, 2])
+        sorted(channel.published).should.equal(["first", "second"])
+        channel.connection_thread_calls.should.have.length_of(5)
+        all(channel.connection_thread_calls).should.be.true
+        worker_threads.should.have.length_of(3)
+        channel.connection.thread.should_not.be.within(worker_threads)
+
+    @utils.ignore_warnings
+    def test_messages_are_processed_by_connection_thread(self):
+        worker_threads = []
+
+        def msg_callback(channel, method, props, body):
+            worker_threads.append(threading.current_thread())
+            channel.basic_publish(exchange="", routing_key="reply", body=body)
+
+        channel = self.receive(["first", "second"], msg_callback, 1)
+
+        channel.prefetch_count.should.equal(1)
+        channel.auto_ack.should.be.true
+        channel.acked.should.be.empty
+        channel.published.should.equal(["first", "second"])
+        worker_threads.should.equal([channel.connection.thread] * 2)
@@ -0,0 +1,122 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import gzip
+import json
+import logging
+import pika
+import msgpack
+import sure # noqa
+from amqp import amqp_handler
+from commons import launch_objects
+from utils import utils
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.published = []
+
+    def basic_publish(self, **kwargs):
+        self.published.append(kwargs)
+
+
+class TestAmqpHandler(unittest.TestCase):
+    """Tests content type negotiation of amqp requests"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.launches = [{"launchId": 1, "project": 2, "testItems": [
+            {"testItemId": 3, "uniqueId": "unique", "isAutoAnalyzed": False,
+             "logs": [{"logId": 4, "logLevel": 40000, "message": "error"}]}]}]
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def analyze(self, launches):
+        return [launch_objects.AnalysisResult(
+            testItem=test_item.testItemId, issueType="pb001", relevantItem=launch.launchId)
+            for launch in launches for test_item in launch.testItems]
+
+    def handle_request(self, props, body, min_stream_size=0):
+        channel = FakeChannel()
+        amqp_handler.handle_amqp_request(
+            channel, None, props, body, self.analyze,
+            prepare_data_func=lambda body: amqp_handler.prepare_launches_stream(
+                body, min_stream_size=min_stream_size),
+            prepare_response_data=amqp_handler.prepare_analyze_response_data,
+            decode_body=False).should.be.true
+        channel.published.should.have.length_of(1)
+        return channel.published[0]
+
+    @utils.ignore_warnings
+    def test_json_is_default(self):
+        published = self.handle_request(
+            pika.BasicProperties(reply_to="reply", correlation_id="1"),
+            json.dumps(self.launches).encode("utf-8"))
+        published["properties"].content_type.should.equal(amqp_handler.JSON_CONTENT_TYPE)
+        published["properties"].content_encoding.should.be.none
+        json.loads(published["body"]).should.equal(
+            [{"testItem": 3, "issueType": "pb001", "relevantItem": 1}])
+
+    @utils.ignore_warnings
+    def test_msgpack_with_gzip(self):
+        published = self.handle_request(
+            pika.BasicProperties(reply_to="reply", correlation_id="1",
+                                 content_type=amqp_handler.MSGPACK_CONTENT_TYPE,
+                                 content_encoding=amqp_handler.GZIP_CONTENT_ENCODING),
+            gzip.compress(msgpack.packb(self.launches)))
+        published["properties"].content_type.should.equal(amqp_handler.MSGPACK_CONTENT_TYPE)
+        published["properties"].content_encoding.should.equal(amqp_handler.GZIP_CONTENT_ENCODING)
+        msgpack.unpackb(gzip.decompress(published["body"]), raw=False).should.equal(
+            [{"testItem": 3, "issueType": "pb001", "relevantItem": 1}])
+
+    @utils.ignore_warnings
+    def test_accept_headers(self):
+        published = self.handle_request(
+            pika.BasicProperties(reply_to="reply", correlation_id="1",
+                                 headers={"accept": amqp_handler.MSGPACK_CONTENT_TYPE,
+                                          "accept-encoding": "gzip"}),
+            json.dumps(self.launches))
+        published["properties"].content_type.should.equal(amqp_handler.MSGPACK_CONTENT_TYPE)
+        msgpack.unpackb(gzip.decompress(published["body"]), raw=False).should.have.length_of(1)
+
+    @utils.ignore_warnings
+    def test_streamed_launches(self):
+        published = self.handle_request(
+            pika.BasicProperties(reply_to="reply", correlation_id="1"),
+            json.dumps(self.launches).encode("utf-8"), min_stream_size=1)
+        json.loads(published["body"]).should.equal(
+            [{"testItem": 3, "issueType": "pb001", "relevantItem": 1}])
+
+    @utils.ignore_warnings
+    def test_malformed_test_item_is_not_handled(self):
+        handled = []
+        self.launches[0]["testItems"].append({"testItemId": "wrong", "logs": []})
+        channel = FakeChannel()
+        for min_stream_size in [0, 1]:
+            for body in [json.dumps(self.launches), json.dumps(self.launches)[:-3]]:
+                amqp_handler.handle_amqp_request(
+                    channel, None, pika.BasicProperties(reply_to="reply", correlation_id="1"),
+                    body, handled.append,
+                    prepare_data_func=lambda body: amqp_handler.prepare_launches_stream(
+                        body, min_stream_size=min_stream_size),
+                    prepare_response_data=amqp_handler.prepare_analyze_response_data,
+                    decode_body=False).should.be.false
+        handled.should.be.empty
+        channel.published.should.be.empty
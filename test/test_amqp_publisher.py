@@ -0,0 +1,119 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+from unittest.mock import patch
+import sure # noqa
+from amqp import amqp
+from amqp.amqp import AmqpPublisher
+from utils import utils
+
+
+class FakeChannel:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.published = []
+
+    def tx_select(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body):
+        self.published.append(body)
+
+    def tx_commit(self):
+        if self.connection.failed_commits > 0:
+            self.connection.failed_commits -= 1
+            raise Exception("Connection is closed")
+        self.connection.committed_batches.append(self.published)
+        self.published = []
+
+
+class FakeConnection:
+
+    def __init__(self, failed_commits=0):
+        self.is_open = True
+        self.failed_commits = failed_commits
+        self.committed_batches = []
+        self.connections_number = 0
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def process_data_events(self, time_limit=0):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class TestAmqpPublisher(unittest.TestCase):
+    """Tests publishing inner messages in batches"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def create_connection(self, connection):
+        def _create_connection(amqp_url):
+            connection.connections_number += 1
+            return connection
+        return _create_connection
+
+    @utils.ignore_warnings
+    def test_messages_are_committed_in_batches(self):
+        connection = FakeConnection()
+        with patch("amqp.amqp.AmqpClient.create_ampq_connection", self.create_connection(connection)):
+            publisher = AmqpPublisher("amqp://localhost", batch_size=2, batch_timeout=5)
+            for idx in range(3):
+                publisher.send_to_inner_queue("analyzer", "stats_info", str(idx))
+            publisher.close()
+        connection.committed_batches.should.equal([["0", "1"], ["2"]])
+        connection.connections_number.should.equal(1)
+
+    @utils.ignore_warnings
+    def test_batch_is_published_again_after_failed_commit(self):
+        connections = [FakeConnection(failed_commits=1), FakeConnection()]
+        with patch("amqp.amqp.AmqpClient.create_ampq_connection", side_effect=connections):
+            publisher = AmqpPublisher("amqp://localhost", batch_size=2, batch_timeout=5)
+            publisher.publish_batch([("analyzer", "stats_info", "0"), ("analyzer", "stats_info", "1")])\
+                .should.be.true
+            connections[0].is_open.should.be.false
+            publisher.close()
+        connections[0].committed_batches.should.be.empty
+        connections[1].committed_batches.should.equal([["0", "1"]])
+        connections[1].is_open.should.be.false
+
+    @utils.ignore_warnings
+    def test_publisher_per_process(self):
+        app_config = {"amqpUrl": "amqp://localhost", "amqpPublisherBatchSize": 3}
+        with patch("amqp.amqp.os.getpid", return_value=1):
+            publisher = amqp.get_publisher(app_config)
+            amqp.get_publisher(app_config).should.be(publisher)
+        with patch("amqp.amqp.os.getpid", return_value=2):
+            forked_publisher = amqp.get_publisher(app_config)
+        forked_publisher.should_not.be(publisher)
+        publisher.batch_size.should.equal(3)
+        publisher.batch_timeout.should.equal(0.5)
+        for _publisher in [publisher, forked_publisher]:
+            _publisher.close()
+        del amqp._publishers[("amqp://localhost", 1)]
+        del amqp._publishers[("amqp://localhost", 2)]
@@ -0,0 +1,121 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+import threading
+import sure # noqa
+from commons import launch_objects
+from commons.analysis_scheduler import AnalysisScheduler, AnalysisRequest
+from utils import utils
+
+
+class TestAnalysisScheduler(unittest.TestCase):
+    """Tests scheduling chunks of analyze requests by projects"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.analyzed_chunks = []
+        self.first_chunk_started = threading.Event()
+        self.release_first_chunk = threading.Event()
+        self.lock = threading.Lock()
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_launch(self, project, test_items_number):
+        return launch_objects.Launch(launchId=project, project=project, testItems=[
+            launch_objects.TestItem(testItemId=project * 100 + i, uniqueId=str(i), isAutoAnalyzed=False)
+            for i in range(test_items_number)])
+
+    def analyze(self, launches, context, state):
+        if not self.first_chunk_started.is_set():
+            self.first_chunk_started.set()
+            self.release_first_chunk.wait(5)
+        with self.lock:
+            self.analyzed_chunks.append(launches[0].project)
+        return [test_item.testItemId for launch in launches for test_item in launch.testItems]
+
+    def run_request(self, scheduler, launches, results, name):
+        results[name] = scheduler.analyze_logs(launches)
+
+    @utils.ignore_warnings
+    def test_projects_take_turns(self):
+        scheduler = AnalysisScheduler(self.analyze, workers_number=1, chunk_size=2)
+        results = {}
+        big_request = threading.Thread(
+            target=self.run_request, args=(scheduler, [self.get_launch(1, 8)], results, "big"))
+        big_request.start()
+        self.first_chunk_started.wait(5)
+        small_request = threading.Thread(
+            target=self.run_request, args=(scheduler, [self.get_launch(2, 4)], results, "small"))
+        small_request.start()
+        with scheduler.condition:
+            scheduler.condition.wait_for(lambda: "2" in scheduler.pending, timeout=5).should.be.true
+        self.release_first_chunk.set()
+        big_request.join(5)
+        small_request.join(5)
+        scheduler.stop()
+
+        self.analyzed_chunks.should.equal([1, 1, 2, 1, 2, 1])
+        sorted(results["big"]).should.equal([100 + i for i in range(8)])
+        sorted(results["small"]).should.equal([200 + i for i in range(4)])
+
+    @utils.ignore_warnings
+    def test_weights_and_concurrency(self):
+        scheduler = AnalysisScheduler(self.analyze, workers_number=2, project_weights={1: 2},
+                                      max_project_concurrency=1, project_concurrency={"2": 2})
+        scheduler.get_weight("1").should.equal(2)
+        scheduler.get_weight("2").should.equal(1)
+        scheduler.get_max_concurrency("1").should.equal(1)
+        scheduler.get_max_concurrency("2").should.equal(2)
+        with scheduler.condition:
+            request = AnalysisRequest(None)
+            for project in ["1", "1", "1", "2", "2"]:
+                scheduler.add_chunk(project, request, None)
+            scheduler.take_chunk()[0].should.equal("1")
+            scheduler.take_chunk()[0].should.equal("2")
+            scheduler.take_chunk()[0].should.equal("2")
+            scheduler.take_chunk()[0].should.be.none
+            scheduler.finish_chunk("1")
+            scheduler.take_chunk()[0].should.equal("1")
+        scheduler.stop()
+
+    @utils.ignore_warnings
+    def test_chunks_are_limited(self):
+        scheduler = AnalysisScheduler(self.analyze, chunk_size=3, max_test_items=7)
+        chunks = list(scheduler.split_into_chunks([self.get_launch(1, 5), self.get_launch(2, 5)]))
+        [len(chunk.testItems) for chunk in chunks].should.equal([3, 2, 2])
+        [chunk.project for chunk in chunks].should.equal([1, 1, 2])
+        scheduler.stop()
+
+    @utils.ignore_warnings
+    def test_request_state_is_shared(self):
+        finished_states = []
+
+        def analyze(launches, context, state):
+            state.append(launches[0].launchId)
+            return [test_item.testItemId for launch in launches for test_item in launch.testItems]
+        scheduler = AnalysisScheduler(analyze, workers_number=2, chunk_size=2, state_factory=list,
+                                      finish_func=finished_states.append)
+
+        results = scheduler.analyze_logs(iter([self.get_launch(1, 5), self.get_launch(2, 1)]))
+        scheduler.stop()
+
+        sorted(results).should.equal([100, 101, 102, 103, 104, 200])
+        finished_states.should.have.length_of(1)
+        sorted(finished_states[0]).should.equal([1, 1, 1, 2])
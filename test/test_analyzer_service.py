@@ -17,13 +17,14 @@
 import unittest
 from unittest.mock import MagicMock
 import json
+import time
 from http import HTTPStatus
 import sure # noqa
 import httpretty
 
 import commons.launch_objects as launch_objects
 from boosting_decision_making.boosting_decision_maker import BoostingDecisionMaker
-from service.auto_analyzer_service import AutoAnalyzerService
+from service.auto_analyzer_service import AutoAnalyzerService, AnalysisState
 from test.test_service import TestService
 from utils import utils
 
@@ -35,7 +36,7 @@ class TestAutoAnalyzerService(TestService):
         """Test analyzing logs"""
         tests = [
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/1",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -45,7 +46,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/1",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -56,7 +57,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -67,7 +68,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }, ],
@@ -79,7 +80,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.NOT_FOUND,
                                     }, ],
@@ -89,7 +90,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -101,7 +102,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([1], [[0.2, 0.8]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -113,7 +114,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([1, 0], [[0.2, 0.8], [0.7, 0.3]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -125,7 +126,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([1, 1], [[0.2, 0.8], [0.3, 0.7]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -137,7 +138,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([0, 1], [[0.8, 0.2], [0.3, 0.7]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -149,7 +150,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([1, 0], [[0.2, 0.8], [0.7, 0.3]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -161,7 +162,7 @@ class TestAutoAnalyzerService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     }],
@@ -204,6 +205,113 @@ class TestAutoAnalyzerService(TestService):
 
                 TestAutoAnalyzerService.shutdown_server(test["test_calls"])
 
+    @utils.ignore_warnings
+    def test_analyze_logs_concurrent_msearch(self):
+        """Test analyzing logs with several msearch requests in flight"""
+        test_calls = [{"method":         httpretty.HEAD,
+                       "uri":            "/2",
+                       "status":         HTTPStatus.OK,
+                       }]
+        self._start_server(test_calls)
+        app_config = dict(self.app_config, esMsearchConcurrency=3, analyzeResultsQueueSize=2)
+        analyzer_service = AutoAnalyzerService(app_config=app_config,
+                                               search_cfg=self.get_default_search_config())
+        _boosting_decision_maker = BoostingDecisionMaker()
+        _boosting_decision_maker.get_feature_ids = MagicMock(return_value=[0])
+        _boosting_decision_maker.predict = MagicMock(return_value=([1], [[0.2, 0.8]]))
+        analyzer_service.boosting_decision_maker = _boosting_decision_maker
+        search_rs = utils.get_fixture(self.two_hits_search_rs, to_json=True)
+        batch_sizes = []
+
+        def msearch(body):
+            queries_number = body.count("\n") // 2
+            batch_sizes.append(queries_number)
+            # the earlier batches are answered later
+            time.sleep(0.05 / len(batch_sizes))
+            return {"responses": [search_rs] * queries_number}
+        analyzer_service.es_client.es_client.msearch = msearch
+
+        launch = json.loads(utils.get_fixture(self.launch_w_test_items_w_logs))[0]
+        test_item = launch["testItems"][0]
+        launch["testItems"] = [dict(test_item, testItemId=idx) for idx in range(40)]
+        response = analyzer_service.analyze_logs([launch_objects.Launch(**launch)])
+
+        len(batch_sizes).should.be.greater_than(3)
+        [res.testItem for res in response].should.equal(list(range(40)))
+
+        TestAutoAnalyzerService.shutdown_server(test_calls)
+
+    @utils.ignore_warnings
+    def test_analyze_logs_chunks_share_state(self):
+        """Test looking up models and indices once for chunks of one request and sending stats once"""
+        analyzer_service = AutoAnalyzerService(app_config=self.app_config,
+                                               search_cfg=self.get_default_search_config())
+        _boosting_decision_maker = BoostingDecisionMaker()
+        _boosting_decision_maker.get_feature_ids = MagicMock(return_value=[0])
+        _boosting_decision_maker.predict = MagicMock(return_value=([1], [[0.2, 0.8]]))
+        analyzer_service.boosting_decision_maker = _boosting_decision_maker
+        search_rs = utils.get_fixture(self.two_hits_search_rs, to_json=True)
+        analyzer_service.es_client.es_client.msearch = MagicMock(
+            side_effect=lambda body: {"responses": [search_rs] * (body.count("\n") // 2)})
+        analyzer_service.es_client.index_exists = MagicMock(return_value=True)
+        analyzer_service.choose_model = MagicMock(return_value=None)
+        analyzer_service.send_stats_info = MagicMock()
+
+        launch = json.loads(utils.get_fixture(self.launch_w_test_items_w_logs))[0]
+        test_item = launch["testItems"][0]
+        state = AnalysisState()
+        for chunk in range(2):
+            launch["testItems"] = [dict(test_item, testItemId=chunk * 2 + idx) for idx in range(2)]
+            analyzer_service.analyze_logs([launch_objects.Launch(**launch)], state=state)
+
+        analyzer_service.es_client.index_exists.call_count.should.equal(1)
+        analyzer_service.choose_model.call_count.should.equal(1)
+        analyzer_service.send_stats_info.called.should.be.false
+        list(state.results_to_share.values())[0]["items_to_process"].should.equal(4)
+
+    @utils.ignore_warnings
+    def test_analyze_logs_rejected_queries(self):
+        """Test sending again queries rejected by Elasticsearch"""
+        test_calls = [{"method":         httpretty.HEAD,
+                       "uri":            "/2",
+                       "status":         HTTPStatus.OK,
+                       }]
+        self._start_server(test_calls)
+        analyzer_service = AutoAnalyzerService(app_config=self.app_config,
+                                               search_cfg=self.get_default_search_config())
+        _boosting_decision_maker = BoostingDecisionMaker()
+        _boosting_decision_maker.get_feature_ids = MagicMock(return_value=[0])
+        _boosting_decision_maker.predict = MagicMock(return_value=([1], [[0.2, 0.8]]))
+        analyzer_service.boosting_decision_maker = _boosting_decision_maker
+        search_rs = utils.get_fixture(self.two_hits_search_rs, to_json=True)
+        rejected_rs = {"status": 429, "error": {"type": "es_rejected_execution_exception"}}
+        analyzer_service.es_client.es_client.msearch = MagicMock(side_effect=[
+            {"responses": [rejected_rs, search_rs]}, {"responses": [search_rs]}])
+
+        launches = [launch_objects.Launch(**launch)
+                    for launch in json.loads(utils.get_fixture(self.launch_w_test_items_w_logs))]
+        response = analyzer_service.analyze_logs(launches)
+
+        response.should.have.length_of(1)
+        analyzer_service.es_client.es_client.msearch.call_count.should.equal(2)
+        analyzer_service.es_client.es_client.msearch.call_args[0][0].count("\n").should.equal(2)
+
+        TestAutoAnalyzerService.shutdown_server(test_calls)
+
+    @utils.ignore_warnings
+    def test_warm_up(self):
+        """Test warming up models without Elasticsearch"""
+        analyzer_service = AutoAnalyzerService(app_config=self.app_config,
+                                               search_cfg=self.get_default_search_config())
+        _boosting_decision_maker = analyzer_service.boosting_decision_maker
+        predict = MagicMock(side_effect=_boosting_decision_maker.predict)
+        _boosting_decision_maker.predict = predict
+        try:
+            analyzer_service.warm_up()
+        finally:
+            del _boosting_decision_maker.predict
+        predict.call_count.should.equal(1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import sure # noqa
+from elasticsearch import TransportError
+from commons import batch_size_controller
+from commons.batch_size_controller import BatchSizeController
+
+
+class TestBatchSizeController(unittest.TestCase):
+    """Tests adapting batch sizes to Elasticsearch latency and rejections"""
+
+    def test_additive_increase_multiplicative_decrease(self):
+        controller = BatchSizeController("test", min_size=5, max_size=30, target_latency=1.0)
+        controller.batch_size.should.equal(5)
+        controller.observe(0.1, 5)
+        controller.observe(0.1, 10)
+        controller.batch_size.should.equal(15)
+        controller.observe(0.1, 3)
+        controller.batch_size.should.equal(15)
+        controller.observe(2.0, 15)
+        controller.batch_size.should.equal(7)
+        controller.on_rejection()
+        controller.on_rejection()
+        controller.batch_size.should.equal(5)
+        for _ in range(10):
+            controller.observe(0.1, controller.batch_size)
+        controller.batch_size.should.equal(30)
+
+    def test_payload_limit(self):
+        controller = BatchSizeController("test", min_size=5, max_size=100, initial_size=50,
+                                         max_payload_bytes=10000)
+        controller.observe(0.1, 50, payload_bytes=50000)
+        controller.batch_size.should.equal(10)
+
+    def test_rejections(self):
+        batch_size_controller.is_rejection(
+            TransportError(429, "es_rejected_execution_exception")).should.be.true
+        batch_size_controller.is_rejection(TransportError(500, "error")).should.be.false
+        batch_size_controller.is_rejected_response(
+            {"status": 429, "error": {"type": "es_rejected_execution_exception"}}).should.be.true
+        batch_size_controller.is_rejected_response({"hits": {"hits": []}}).should.be.false
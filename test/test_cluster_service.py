@@ -16,23 +16,27 @@
 
 import unittest
 from http import HTTPStatus
+from unittest.mock import MagicMock
 import sure # noqa
 import httpretty
 
 import commons.launch_objects as launch_objects
 from utils import utils
+from service import cluster_service
 from service.cluster_service import ClusterService
 from test.test_service import TestService
 
 
 class TestClusterService(TestService):
 
+    update_cluster_ids_uri = "/2/_update_by_query?conflicts=proceed&refresh=true"
+
     @utils.ignore_warnings
     def test_find_clusters(self):
         """Test finding clusters"""
         tests = [
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/1",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -45,7 +49,7 @@ class TestClusterService(TestService):
                 "expected_result":     []
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/1",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -58,7 +62,7 @@ class TestClusterService(TestService):
                 "expected_result":     []
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -71,18 +75,18 @@ class TestClusterService(TestService):
                 "expected_result":     []
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          },
                                         {"method":         httpretty.POST,
-                                         "uri":            "/_bulk?refresh=true",
+                                         "uri":            self.update_cluster_ids_uri,
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
                                          "rq":             utils.get_fixture(
                                              self.cluster_update),
                                          "rs":             utils.get_fixture(
-                                             self.index_logs_rs),
+                                             self.update_by_query_rs),
                                          }],
                 "launch_info":            launch_objects.LaunchInfoForClustering(
                     launch=launch_objects.Launch(
@@ -111,18 +115,18 @@ class TestClusterService(TestService):
                         clusterId="")]
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          },
                                         {"method":         httpretty.POST,
-                                         "uri":            "/_bulk?refresh=true",
+                                         "uri":            self.update_cluster_ids_uri,
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
                                          "rq":             utils.get_fixture(
                                              self.cluster_update_all_the_same),
                                          "rs":             utils.get_fixture(
-                                             self.index_logs_rs),
+                                             self.update_by_query_rs),
                                          }],
                 "launch_info":            launch_objects.LaunchInfoForClustering(
                     launch=launch_objects.Launch(
@@ -151,36 +155,30 @@ class TestClusterService(TestService):
                         clusterId="1")]
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          },
                                         {"method":         httpretty.GET,
-                                         "uri":            "/2/_search",
+                                         "uri":            "/_msearch",
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
-                                         "rq":             utils.get_fixture(
-                                             self.search_logs_rq_first_group),
-                                         "rs":             utils.get_fixture(
-                                             self.no_hits_search_rs),
-                                         },
-                                        {"method":         httpretty.GET,
-                                         "uri":            "/2/_search",
-                                         "status":         HTTPStatus.OK,
-                                         "content_type":   "application/json",
-                                         "rq":             utils.get_fixture(
+                                         "rq":             self.get_msearch_rq(
+                                             "2",
+                                             self.search_logs_rq_first_group,
                                              self.search_logs_rq_second_group),
-                                         "rs":             utils.get_fixture(
+                                         "rs":             self.get_msearch_rs(
+                                             self.no_hits_search_rs,
                                              self.no_hits_search_rs),
                                          },
                                         {"method":         httpretty.POST,
-                                         "uri":            "/_bulk?refresh=true",
+                                         "uri":            self.update_cluster_ids_uri,
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
                                          "rq":             utils.get_fixture(
                                              self.cluster_update),
                                          "rs":             utils.get_fixture(
-                                             self.index_logs_rs),
+                                             self.update_by_query_rs),
                                          }],
                 "launch_info":            launch_objects.LaunchInfoForClustering(
                     launch=launch_objects.Launch(
@@ -209,36 +207,30 @@ class TestClusterService(TestService):
                         clusterId="")]
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          },
                                         {"method":         httpretty.GET,
-                                         "uri":            "/2/_search",
+                                         "uri":            "/_msearch",
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
-                                         "rq":             utils.get_fixture(
-                                             self.search_logs_rq_first_group),
-                                         "rs":             utils.get_fixture(
-                                             self.one_hit_search_rs_clustering),
-                                         },
-                                        {"method":         httpretty.GET,
-                                         "uri":            "/2/_search",
-                                         "status":         HTTPStatus.OK,
-                                         "content_type":   "application/json",
-                                         "rq":             utils.get_fixture(
+                                         "rq":             self.get_msearch_rq(
+                                             "2",
+                                             self.search_logs_rq_first_group,
                                              self.search_logs_rq_second_group),
-                                         "rs":             utils.get_fixture(
+                                         "rs":             self.get_msearch_rs(
+                                             self.one_hit_search_rs_clustering,
                                              self.one_hit_search_rs_clustering),
                                          },
                                         {"method":         httpretty.POST,
-                                         "uri":            "/_bulk?refresh=true",
+                                         "uri":            self.update_cluster_ids_uri,
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
                                          "rq":             utils.get_fixture(
                                              self.cluster_update_es_update),
                                          "rs":             utils.get_fixture(
-                                             self.index_logs_rs),
+                                             self.update_by_query_rs),
                                          }],
                 "launch_info":            launch_objects.LaunchInfoForClustering(
                     launch=launch_objects.Launch(
@@ -273,27 +265,28 @@ class TestClusterService(TestService):
                         clusterId="")]
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/2",
                                          "status":         HTTPStatus.OK,
                                          },
                                         {"method":         httpretty.GET,
-                                         "uri":            "/2/_search",
+                                         "uri":            "/_msearch",
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
-                                         "rq":             utils.get_fixture(
+                                         "rq":             self.get_msearch_rq(
+                                             "2",
                                              self.search_logs_rq_first_group_2lines),
-                                         "rs":             utils.get_fixture(
+                                         "rs":             self.get_msearch_rs(
                                              self.one_hit_search_rs_clustering),
                                          },
                                         {"method":         httpretty.POST,
-                                         "uri":            "/_bulk?refresh=true",
+                                         "uri":            self.update_cluster_ids_uri,
                                          "status":         HTTPStatus.OK,
                                          "content_type":   "application/json",
                                          "rq":             utils.get_fixture(
                                              self.cluster_update_all_the_same_es_update),
                                          "rs":             utils.get_fixture(
-                                             self.index_logs_rs),
+                                             self.update_by_query_rs),
                                          }],
                 "launch_info":            launch_objects.LaunchInfoForClustering(
                     launch=launch_objects.Launch(
@@ -353,11 +346,35 @@ class TestClusterService(TestService):
 
                 for cluster_id in cluster_ids_dict:
                     test["test_calls"][-1]["rq"] = test["test_calls"][-1]["rq"].replace(
-                        "\"cluster_id\":\"%s\"" % cluster_id,
-                        "\"cluster_id\":\"%s\"" % cluster_ids_dict[cluster_id])
+                        ":\"%s\"" % cluster_id,
+                        ":\"%s\"" % cluster_ids_dict[cluster_id])
 
                 TestClusterService.shutdown_server(test["test_calls"])
 
+    @utils.ignore_warnings
+    def test_update_cluster_ids_retries_conflicts(self):
+        """Test updating cluster ids of logs once again after version conflicts"""
+        _cluster_service = ClusterService(app_config=self.app_config,
+                                          search_cfg=self.get_default_search_config())
+        _cluster_service.es_client.es_client.update_by_query = MagicMock(side_effect=[
+            {"updated": 1, "version_conflicts": 1, "failures": []},
+            {"updated": 2, "version_conflicts": 0, "failures": []}])
+        _cluster_service.update_cluster_ids([
+            launch_objects.ClusterResult(logId=1, testItemId=3, project=2, launchId=1, clusterId="1"),
+            launch_objects.ClusterResult(logId=2, testItemId=3, project=2, launchId=1, clusterId="1")])
+
+        calls = _cluster_service.es_client.es_client.update_by_query.call_args_list
+        calls.should.have.length_of(2)
+        calls[0].should.equal(calls[1])
+        calls[1][1]["body"]["script"]["params"]["log_clusters"].should.equal({"1": "1", "2": "1"})
+
+        _cluster_service.es_client.es_client.update_by_query = MagicMock(
+            return_value={"updated": 1, "version_conflicts": 1, "failures": []})
+        _cluster_service.update_cluster_ids([
+            launch_objects.ClusterResult(logId=1, testItemId=3, project=2, launchId=1, clusterId="1")])
+        _cluster_service.es_client.es_client.update_by_query.call_count.should.equal(
+            cluster_service.CLUSTER_UPDATE_RETRIES + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
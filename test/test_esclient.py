@@ -15,11 +15,12 @@
 """
 
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import json
 from http import HTTPStatus
 import sure # noqa
 import httpretty
+from elasticsearch.exceptions import TransportError
 
 import commons.launch_objects as launch_objects
 from commons import esclient
@@ -37,6 +38,7 @@ class TestEsClient(TestService):
                 "test_calls": [{"method":         httpretty.GET,
                                 "uri":            "/_cat/indices?format=json",
                                 "status":         HTTPStatus.OK,
+                                "content_type":   "application/json",
                                 "rs":             "[]",
                                 }, ],
                 "expected_count": 0,
@@ -45,6 +47,7 @@ class TestEsClient(TestService):
                 "test_calls": [{"method":         httpretty.GET,
                                 "uri":            "/_cat/indices?format=json",
                                 "status":         HTTPStatus.OK,
+                                "content_type":   "application/json",
                                 "rs":             utils.get_fixture(self.two_indices_rs),
                                 }, ],
                 "expected_count": 2,
@@ -69,6 +72,29 @@ class TestEsClient(TestService):
 
                 TestEsClient.shutdown_server(test["test_calls"])
 
+    @utils.ignore_warnings
+    def test_shared_es_client(self):
+        """Test sharing one pooled Elasticsearch client by services"""
+        test_calls = [{"method":         httpretty.GET,
+                       "uri":            "/_cluster/health",
+                       "status":         HTTPStatus.OK,
+                       "content_type":   "application/json",
+                       "rs":             json.dumps({"status": "yellow"}),
+                       }, ]
+        self._start_server(test_calls)
+        app_config = dict(self.app_config, esSharedClient=True, esConnectionPoolSize=3, esHttpCompress=True)
+        es_client = esclient.EsClient(app_config=app_config, search_cfg=self.get_default_search_config())
+        other_es_client = esclient.EsClient(app_config=app_config,
+                                            search_cfg=self.get_default_search_config())
+
+        other_es_client.es_client.should.be(es_client.es_client)
+        connection = es_client.es_client.transport.connection_pool.connections[0]
+        connection.pool.pool.maxsize.should.equal(3)
+        connection.http_compress.should.be.true
+        es_client.is_healthy(self.app_config["esHost"]).should.be.true
+
+        TestEsClient.shutdown_server(test_calls)
+
     @utils.ignore_warnings
     def test_create_index(self):
         """Test creating index"""
@@ -112,7 +138,7 @@ class TestEsClient(TestService):
         """Test existance of a index"""
         tests = [
             {
-                "test_calls": [{"method":         httpretty.GET,
+                "test_calls": [{"method":         httpretty.HEAD,
                                 "uri":            "/idx0",
                                 "status":         HTTPStatus.OK,
                                 }, ],
@@ -120,7 +146,7 @@ class TestEsClient(TestService):
                 "index":      "idx0",
             },
             {
-                "test_calls": [{"method":         httpretty.GET,
+                "test_calls": [{"method":         httpretty.HEAD,
                                 "uri":            "/idx1",
                                 "status":         HTTPStatus.NOT_FOUND,
                                 }, ],
@@ -140,6 +166,35 @@ class TestEsClient(TestService):
 
                 TestEsClient.shutdown_server(test["test_calls"])
 
+    @utils.ignore_warnings
+    def test_exists_index_cache(self):
+        """Test caching existance of an index"""
+        test_calls = [{"method":         httpretty.HEAD,
+                       "uri":            "/1",
+                       "status":         HTTPStatus.OK,
+                       },
+                      {"method":         httpretty.DELETE,
+                       "uri":            "/1",
+                       "status":         HTTPStatus.OK,
+                       "content_type":   "application/json",
+                       "rs":             utils.get_fixture(self.index_deleted_rs),
+                       },
+                      {"method":         httpretty.HEAD,
+                       "uri":            "/1",
+                       "status":         HTTPStatus.OK,
+                       }, ]
+        self._start_server(test_calls)
+        app_config = dict(self.app_config, esIndexCacheTtl=60)
+        es_client = esclient.EsClient(app_config=app_config,
+                                      search_cfg=self.get_default_search_config())
+
+        es_client.index_exists(1).should.be.true
+        es_client.index_exists(1).should.be.true
+        es_client.delete_index(1).should.be.true
+        es_client.index_exists(1).should.be.true
+
+        TestEsClient.shutdown_server(test_calls)
+
     @utils.ignore_warnings
     def test_delete_index(self):
         """Test deleting an index"""
@@ -183,7 +238,7 @@ class TestEsClient(TestService):
         """Test cleaning index logs"""
         tests = [
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
@@ -211,12 +266,6 @@ class TestEsClient(TestService):
                                     "rs":             utils.get_fixture(
                                         self.one_hit_search_rs),
                                     },
-                                   {"method":         httpretty.POST,
-                                    "uri":            "/_bulk?refresh=true",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rs":             utils.get_fixture(self.delete_logs_rs),
-                                    },
                                    {"method":         httpretty.GET,
                                     "uri":            "/1/_search?scroll=5m&size=1000",
                                     "status":         HTTPStatus.OK,
@@ -229,14 +278,14 @@ class TestEsClient(TestService):
                                     "uri":            "/_bulk?refresh=true",
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(self.index_logs_rq),
+                                    "rq":             utils.get_fixture(self.delete_and_index_merged_logs_rq),
                                     "rs":             utils.get_fixture(self.index_logs_rs),
                                     }, ],
                 "rq":             launch_objects.CleanIndex(ids=[1], project=1),
                 "expected_count": 1
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.NOT_FOUND,
                                     }, ],
@@ -260,12 +309,179 @@ class TestEsClient(TestService):
 
                 TestEsClient.shutdown_server(test["test_calls"])
 
+    @utils.ignore_warnings
+    def test_clean_index_async(self):
+        """Test deleting logs with delete_by_query tasks and merging logs in the background"""
+        es_client = esclient.EsClient(app_config=dict(self.app_config, esAsyncClean=True),
+                                      search_cfg=self.get_default_search_config())
+        es_client.index_exists = MagicMock(return_value=True)
+        es_client.es_client.search = MagicMock(return_value={"hits": {"hits": [
+            {"_id": "1", "_source": {"test_item": 3}}]}})
+        es_client.es_client.delete_by_query = MagicMock(return_value={"task": "node:12"})
+        scheduler = MagicMock()
+        with patch("commons.merge_scheduler.get_merge_scheduler", return_value=scheduler):
+            response = es_client.delete_logs(launch_objects.CleanIndex(ids=[1, 2], project=1))
+
+        response.should.equal(2)
+        es_client.es_client.delete_by_query.call_args[1]["body"].should.equal(
+            {"query": {"ids": {"values": ["1", "2"]}}})
+        es_client.es_client.delete_by_query.call_args[1]["wait_for_completion"].should.be.false
+        scheduler.schedule.assert_called_once_with(1, ["3"], ["node:12"])
+
+    @utils.ignore_warnings
+    def test_stream_bulk_index(self):
+        """Test indexing documents in chunks and indexing failed documents again"""
+        bulk_bodies = []
+
+        def bulk(body, **kwargs):
+            actions = [json.loads(line) for line in body.splitlines()][::2]
+            bulk_bodies.append([action["index"]["_id"] for action in actions])
+            status = 403 if len(bulk_bodies) == 1 else 201
+            return {"took": 1, "errors": status != 201, "items": [
+                {"index": {"_id": action["index"]["_id"], "status": status}} for action in actions]}
+        es_client = esclient.EsClient(app_config=dict(self.app_config, esBulkChunkSize=2),
+                                      search_cfg=self.get_default_search_config())
+        es_client.es_client.bulk = bulk
+        es_client.update_settings_after_read_only = MagicMock()
+        documents = ({"_index": "1", "_id": str(idx), "_source": {"message": "error"}}
+                     for idx in range(5))
+
+        response = es_client._stream_bulk_index(documents)
+
+        response.should.equal(launch_objects.BulkResponse(took=5, errors=False))
+        bulk_bodies.should.equal([["0", "1"], ["2", "3"], ["4"], ["0", "1"]])
+        es_client.update_settings_after_read_only.call_count.should.equal(1)
+
+    def test_get_refresh_policy(self):
+        """Test choosing refresh policies for writes of requests"""
+        app_config = dict(self.app_config, esRefreshPolicies={"index": "wait_for", "cluster": "false",
+                                                              "clean": "unknown"})
+        esclient.get_refresh_policy(self.app_config, "index").should.be.true
+        esclient.get_refresh_policy(app_config, "index").should.equal("wait_for")
+        esclient.get_refresh_policy(app_config, "cluster").should.be.false
+        esclient.get_refresh_policy(app_config, "clean").should.be.true
+
+    def test_hold_back_tail(self):
+        """Test holding back the last actions"""
+        tail = []
+        list(esclient.hold_back_tail(iter(range(5)), tail, 2)).should.equal([0, 1, 2])
+        tail.should.equal([3, 4])
+
+    @utils.ignore_warnings
+    def test_stream_bulk_index_int_ids(self):
+        """Test indexing failed logs with int ids again"""
+        bulk_bodies = []
+
+        def bulk(body, **kwargs):
+            actions = [json.loads(line) for line in body.splitlines()][::2]
+            bulk_bodies.append([action["index"]["_id"] for action in actions])
+            status = 403 if len(bulk_bodies) == 1 else 201
+            return {"took": 1, "errors": status != 201, "items": [
+                {"index": {"_id": str(action["index"]["_id"]), "status": status}} for action in actions]}
+        es_client = esclient.EsClient(app_config=self.app_config,
+                                      search_cfg=self.get_default_search_config())
+        es_client.es_client.bulk = bulk
+        es_client.update_settings_after_read_only = MagicMock()
+        documents = [{"_index": "1", "_id": 4, "_source": {"message": "error"}},
+                     {"_index": "1", "_id": "4_m", "_source": {"message": "error"}}]
+
+        response = es_client._stream_bulk_index(iter(documents))
+
+        response.should.equal(launch_objects.BulkResponse(took=2, errors=False))
+        bulk_bodies.should.equal([[4, "4_m"], [4, "4_m"]])
+
+    @utils.ignore_warnings
+    def test_index_logs_merged_in_memory(self):
+        """Test indexing merged logs with the logs, merged logs are read back only for test items,
+        which have other logs in the index"""
+        indexed_ids = []
+
+        def bulk(body, **kwargs):
+            actions = [json.loads(line) for line in body.splitlines()][::2]
+            indexed_ids.extend(action["index"]["_id"] for action in actions)
+            return {"took": 1, "errors": False, "items": [
+                {"index": {"_id": action["index"]["_id"], "status": 201}} for action in actions]}
+        es_client = esclient.EsClient(app_config=self.app_config,
+                                      search_cfg=self.get_default_search_config())
+        es_client.es_client.bulk = bulk
+        es_client.index_exists = MagicMock(return_value=True)
+        es_client.es_client.search = MagicMock(
+            return_value={"aggregations": {"test_items": {"buckets": []}}})
+        es_client._merge_logs = MagicMock(return_value=(None, 0))
+        launch = launch_objects.Launch(launchId=1, project=2, testItems=[launch_objects.TestItem(
+            testItemId=3, uniqueId="unique", isAutoAnalyzed=False, issueType="ab001", logs=[
+                launch_objects.Log(logId=4, logLevel=40000, message="Connection refused"),
+                launch_objects.Log(logId=5, logLevel=40000, message="Timeout exceeded")])])
+
+        response = es_client.index_logs([launch.copy(deep=True)])
+
+        response.took.should.equal(2)
+        indexed_ids.should.equal([4, 5, "4_m"])
+        query = es_client.es_client.search.call_args[1]["body"]["query"]["bool"]
+        query["filter"].should.equal([{"terms": {"test_item": ["3"]}}])
+        query["must_not"][0]["ids"]["values"].should.equal([4, 5, "4_m"])
+        es_client._merge_logs.called.should.be.false
+
+        es_client.es_client.search = MagicMock(
+            return_value={"aggregations": {"test_items": {"buckets": [{"key": 3, "doc_count": 2}]}}})
+        es_client.index_logs([launch.copy(deep=True)])
+
+        es_client._merge_logs.assert_called_once_with(["3"], "2", refresh=True)
+
+        es_client._merge_logs.reset_mock()
+        es_client.es_client.search = MagicMock()
+        es_client.index_exists = MagicMock(return_value=False)
+        es_client.create_index = MagicMock()
+        es_client.index_logs([launch.copy(deep=True)])
+
+        es_client.es_client.search.called.should.be.false
+        es_client._merge_logs.called.should.be.false
+
+    @utils.ignore_warnings
+    def test_bulk_rejected_chunk_is_split(self):
+        """Test resending a rejected chunk after a backoff in batches of the decreased size"""
+        app_config = dict(self.app_config, esBulkMinBatchSize=1, esBulkMaxBatchSize=4)
+        es_client = esclient.EsClient(app_config=app_config,
+                                      search_cfg=self.get_default_search_config())
+        chunk_sizes = []
+
+        def bulk(client, chunk, **kwargs):
+            chunk_sizes.append(len(chunk))
+            if len(chunk_sizes) == 1:
+                raise TransportError(429, "es_rejected_execution_exception")
+            return len(chunk), []
+
+        with patch("commons.esclient.elasticsearch.helpers.bulk", side_effect=bulk),\
+                patch("commons.esclient.sleep") as sleep:
+            response = es_client._bulk_index([{"_id": i} for i in range(4)])
+
+        response.should.equal(launch_objects.BulkResponse(took=4, errors=False))
+        chunk_sizes.should.equal([4, 2, 2])
+        sleep.assert_called_once_with(esclient.BULK_REJECTION_BACKOFF)
+
+    @utils.ignore_warnings
+    def test_find_test_items_with_other_logs(self):
+        """Test finding test items with indexed logs by batches, a failed batch is returned as it is"""
+        es_client = esclient.EsClient(app_config=self.app_config,
+                                      search_cfg=self.get_default_search_config())
+        es_client.es_client.search = MagicMock(side_effect=[
+            {"aggregations": {"test_items": {"buckets": [{"key": 1, "doc_count": 1}]}}},
+            ConnectionError()])
+        log_ids = {str(i): [i] for i in range(1500)}
+
+        test_item_ids = es_client._find_test_items_with_other_logs("2", log_ids)
+
+        test_item_ids.should.equal(["1"] + [str(i) for i in range(1000, 1500)])
+        queries = [call[1]["body"]["query"]["bool"] for call in es_client.es_client.search.call_args_list]
+        [query["must_not"][0]["ids"]["values"] for query in queries].should.equal(
+            [list(range(1000)), list(range(1000, 1500))])
+
     @utils.ignore_warnings
     def test_index_logs(self):
         """Test indexing logs from launches"""
         tests = [
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
@@ -276,7 +492,7 @@ class TestEsClient(TestService):
                 "expected_log_exceptions": []
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
@@ -287,7 +503,7 @@ class TestEsClient(TestService):
                 "expected_log_exceptions": []
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
@@ -298,7 +514,7 @@ class TestEsClient(TestService):
                 "expected_log_exceptions": []
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.NOT_FOUND,
                                     },
@@ -316,40 +532,6 @@ class TestEsClient(TestService):
                                         self.index_logs_rq_big_messages),
                                     "rs":             utils.get_fixture(
                                         self.index_logs_rs),
-                                    },
-                                   {"method":         httpretty.GET,
-                                    "uri":            "/2/_search?scroll=5m&size=1000",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(
-                                        self.search_merged_logs),
-                                    "rs":             utils.get_fixture(
-                                        self.two_hits_search_with_big_messages_rs),
-                                    },
-                                   {"method":         httpretty.POST,
-                                    "uri":            "/_bulk?refresh=true",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rs":             utils.get_fixture(
-                                        self.delete_logs_rs),
-                                    },
-                                   {"method":         httpretty.GET,
-                                    "uri":            "/2/_search?scroll=5m&size=1000",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(
-                                        self.search_not_merged_logs),
-                                    "rs":             utils.get_fixture(
-                                        self.two_hits_search_with_big_messages_rs),
-                                    },
-                                   {"method":         httpretty.POST,
-                                    "uri":            "/_bulk?refresh=true",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(
-                                        self.index_logs_rq_merged_logs),
-                                    "rs":             utils.get_fixture(
-                                        self.index_logs_rs),
                                     }, ],
                 "index_rq":       utils.get_fixture(self.launch_w_test_items_w_logs),
                 "has_errors":     False,
@@ -361,7 +543,7 @@ class TestEsClient(TestService):
                         logId=2, foundExceptions=['java.lang.NoClassDefFoundError'])]
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.NOT_FOUND,
                                     },
@@ -379,37 +561,6 @@ class TestEsClient(TestService):
                                         self.index_logs_rq_different_log_level),
                                     "rs":             utils.get_fixture(
                                         self.index_logs_rs_different_log_level),
-                                    },
-                                   {"method":         httpretty.GET,
-                                    "uri":            "/2/_search?scroll=5m&size=1000",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(self.search_merged_logs),
-                                    "rs":             utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":         httpretty.POST,
-                                    "uri":            "/_bulk?refresh=true",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rs":             utils.get_fixture(self.delete_logs_rs),
-                                    },
-                                   {"method":         httpretty.GET,
-                                    "uri":            "/2/_search?scroll=5m&size=1000",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(self.search_not_merged_logs),
-                                    "rs":             utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":         httpretty.POST,
-                                    "uri":            "/_bulk?refresh=true",
-                                    "status":         HTTPStatus.OK,
-                                    "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(
-                                        self.index_logs_rq_different_log_level_merged),
-                                    "rs":             utils.get_fixture(
-                                        self.index_logs_rs_different_log_level),
                                     }, ],
                 "index_rq":       utils.get_fixture(
                     self.launch_w_test_items_w_logs_different_log_level),
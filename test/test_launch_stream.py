@@ -0,0 +1,116 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import json
+import logging
+import sure # noqa
+from commons.launch_stream import LaunchStream
+from amqp import amqp_handler
+from utils import utils
+
+
+class TestLaunchStream(unittest.TestCase):
+    """Tests decoding launches on iteration"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    def get_launches(self):
+        test_items = [
+            {"testItemId": 2, "uniqueId": "unique", "isAutoAnalyzed": False,
+             "logs": [{"logId": 3, "logLevel": 40000, "message": "error"},
+                      {"logId": 4, "logLevel": 20000, "message": "info"}]},
+            {"testItemId": 5, "uniqueId": "unique", "isAutoAnalyzed": True, "logs": []}]
+        return [
+            {"testItems": test_items, "launchId": 1, "project": 1,
+             "analyzerConfig": {"numberOfLogLines": 2}},
+            {"launchId": 6, "project": 1, "launchName": "Launch", "testItems": []},
+            {"launchId": 7, "project": 2}]
+
+    @utils.ignore_warnings
+    def test_launches_are_decoded_as_whole(self):
+        launches = self.get_launches()
+        expected_launches = amqp_handler.prepare_launches(json.loads(json.dumps(launches)))
+        for launch in expected_launches:
+            for test_item in launch.testItems:
+                test_item.logs = [log for log in test_item.logs
+                                  if log.logLevel >= utils.ERROR_LOGGING_LEVEL]
+        decoded_launches = []
+        for launch in LaunchStream(json.dumps(launches, indent=2).encode("utf-8")):
+            launch.testItems = list(launch.testItems)
+            decoded_launches.append(launch)
+        [launch.dict() for launch in decoded_launches].should.equal(
+            [launch.dict() for launch in expected_launches])
+
+    @utils.ignore_warnings
+    def test_wrong_body(self):
+        LaunchStream.when.called_with('{"launchId": 1}').should.throw(ValueError)
+        LaunchStream.when.called_with('[{"launchId": 1}]').should.throw(Exception)
+        list(LaunchStream(" [ ] ")).should.equal([])
+        LaunchStream.when.called_with('[{"launchId": 1, "testItems": [{"logs": "]"}]').should.throw(
+            ValueError)
+        LaunchStream.when.called_with('[{"launchId": 1}] []').should.throw(ValueError)
+
+        LaunchStream.when.called_with(
+            '[{"launchId": 1, "project": 2, "testItems": [{"testItemId": "]\\""}]}]').should.throw(Exception)
+
+    @utils.ignore_warnings
+    def test_trusted_launches_are_the_same_as_validated(self):
+        launches = self.get_launches()
+        expected_launches = [launch.dict() for launch in amqp_handler.prepare_launches(launches)]
+        [launch.dict() for launch in amqp_handler.prepare_launches(launches, trusted=True)].should.equal(
+            expected_launches)
+        for launch in expected_launches:
+            for test_item in launch["testItems"]:
+                test_item["logs"] = [log for log in test_item["logs"]
+                                     if log["logLevel"] >= utils.ERROR_LOGGING_LEVEL]
+        decoded_launches = []
+        for launch in LaunchStream(json.dumps(launches), trusted=True):
+            launch.testItems = list(launch.testItems)
+            decoded_launches.append(launch.dict())
+        decoded_launches.should.equal(expected_launches)
+
+        test_item_info = {"launchId": 1, "project": 2, "analyzerConfig": {"minShouldMatch": 80},
+                          "logs": [{"logId": 3, "message": "error"}]}
+        amqp_handler.prepare_test_item_info(test_item_info, trusted=True).dict().should.equal(
+            amqp_handler.prepare_test_item_info(test_item_info).dict())
+        amqp_handler.prepare_test_item_info.when.called_with(
+            {"launchId": 1}, trusted=True).should.throw(ValueError)
+
+    @utils.ignore_warnings
+    def test_trusted_scalar_fields_are_coerced(self):
+        for fixture in ["launch_w_test_items_w_logs.json", "launch_w_items_clustering.json",
+                        "launch_w_test_items_w_logs_to_be_merged.json"]:
+            launches = utils.get_fixture(fixture, to_json=True)
+            launches = launches if isinstance(launches, list) else [launches]
+            [launch.dict() for launch in amqp_handler.prepare_launches(launches, trusted=True)].should.equal(
+                [launch.dict() for launch in amqp_handler.prepare_launches(launches)])
+
+        launches = [{"launchId": "1", "project": 2, "testItems": [
+            {"testItemId": "3", "uniqueId": 4, "isAutoAnalyzed": "false",
+             "logs": [{"logId": 5, "logLevel": "40000", "message": "error", "clusterId": 6}]}]}]
+        launch = amqp_handler.prepare_launches(launches, trusted=True)[0]
+        launch.dict().should.equal(amqp_handler.prepare_launches(launches)[0].dict())
+        launch.testItems[0].logs[0].clusterId.should.equal("6")
+        launch.testItems[0].isAutoAnalyzed.should.be.false
+        launches[0]["testItems"][0]["testItemId"] = "wrong"
+        amqp_handler.prepare_launches.when.called_with(launches, trusted=True).should.throw(
+            ValueError, "TestItem.testItemId")
@@ -0,0 +1,104 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+import threading
+import sure # noqa
+from commons.merge_scheduler import MergeScheduler
+from utils import utils
+
+
+class FakeTasks:
+
+    def __init__(self, failed_tasks=()):
+        self.requested_tasks = []
+        self.failed_tasks = failed_tasks
+
+    def get(self, task_id, **kwargs):
+        self.requested_tasks.append(task_id)
+        if task_id in self.failed_tasks:
+            raise Exception("Connection timed out")
+        return {"completed": len(self.requested_tasks) > 1, "response": {"failures": []}}
+
+
+class FakeElasticsearch:
+
+    def __init__(self, failed_tasks=()):
+        self.tasks = FakeTasks(failed_tasks)
+
+
+class FakeEsClient:
+
+    def __init__(self, failed_tasks=()):
+        self.es_client = FakeElasticsearch(failed_tasks)
+        self.merged_test_items = []
+        self.deleted_task_results = []
+        self.merged = threading.Event()
+
+    def delete_task_result(self, task_id):
+        self.deleted_task_results.append(task_id)
+
+    def merge_logs_after_clean(self, test_item_ids, project):
+        self.merged_test_items.append((project, test_item_ids))
+        self.merged.set()
+
+
+class TestMergeScheduler(unittest.TestCase):
+    """Tests debouncing merging logs after clean requests"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    @utils.ignore_warnings
+    def test_test_items_are_merged_once(self):
+        es_client = FakeEsClient()
+        scheduler = MergeScheduler(es_client, debounce_interval=60, max_delay=60)
+        scheduler.schedule("1", ["2", "3"], ["node:1"])
+        scheduler.schedule("1", ["3", "4"])
+        scheduler.flush(due_only=True)
+        es_client.merged_test_items.should.have.length_of(0)
+        scheduler.close()
+        es_client.merged_test_items.should.equal([("1", ["2", "3", "4"])])
+        es_client.es_client.tasks.requested_tasks.should.equal(["node:1", "node:1"])
+        es_client.deleted_task_results.should.equal(["node:1"])
+
+    @utils.ignore_warnings
+    def test_test_items_are_merged_in_background(self):
+        es_client = FakeEsClient()
+        scheduler = MergeScheduler(es_client)
+        scheduler.schedule("1", ["2"])
+        es_client.merged.wait(5).should.be.true
+        es_client.merged_test_items.should.equal([("1", ["2"])])
+        scheduler.close()
+
+    @utils.ignore_warnings
+    def test_merge_is_rescheduled_if_task_status_is_unknown(self):
+        es_client = FakeEsClient(failed_tasks=["node:2"])
+        scheduler = MergeScheduler(es_client, debounce_interval=60, max_delay=60)
+        scheduler.schedule("1", ["2", "3"], ["node:1", "node:2"])
+        scheduler.flush()
+        es_client.merged_test_items.should.be.empty
+        scheduler.pending_test_items.should.equal({"1": {"2", "3"}})
+        scheduler.pending_tasks.should.equal({"1": ["node:2"]})
+        scheduler.attempts.should.equal({"1": 1})
+        scheduler.close()
+        es_client.merged_test_items.should.be.empty
+        scheduler.pending_tasks.should.be.empty
@@ -0,0 +1,124 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import os
+import tempfile
+import sure # noqa
+from types import SimpleNamespace
+from commons import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests rendering metrics in the Prometheus text format"""
+
+    def test_render_metrics(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.register(metrics.Counter("requests_total", "Requests", ["routing_key"]))
+        gauge = registry.register(metrics.Gauge("in_flight", "In flight"))
+        histogram = registry.register(metrics.Histogram("duration_seconds", "Duration", buckets=(0.1, 1)))
+        counter.inc(routing_key="analyze")
+        counter.inc(2, routing_key='a"b')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        registry.render().should.equal("\n".join([
+            "# HELP requests_total Requests",
+            "# TYPE requests_total counter",
+            'requests_total{routing_key="a\\"b"} 2.0',
+            'requests_total{routing_key="analyze"} 1.0',
+            "# HELP in_flight In flight",
+            "# TYPE in_flight gauge",
+            "in_flight 1.0",
+            "# HELP duration_seconds Duration",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{le="0.1"} 1.0',
+            'duration_seconds_bucket{le="1.0"} 2.0',
+            'duration_seconds_bucket{le="+Inf"} 3.0',
+            "duration_seconds_sum 5.55",
+            "duration_seconds_count 3.0"]) + "\n")
+
+    def test_track_amqp_request(self):
+        @metrics.track_amqp_request
+        def handle_request(channel, method, props, body):
+            metrics.AMQP_REQUESTS_IN_FLIGHT.values[("test_key",)].should.equal(1)
+            return body
+
+        handle_request(None, SimpleNamespace(routing_key="test_key"), None, True).should.be.true
+        handle_request(None, SimpleNamespace(routing_key="test_key"), None, False).should.be.false
+        metrics.AMQP_REQUESTS_IN_FLIGHT.values[("test_key",)].should.equal(0)
+        metrics.AMQP_REQUESTS.values[("test_key", "success")].should.equal(1)
+        metrics.AMQP_REQUESTS.values[("test_key", "error")].should.equal(1)
+        metrics.AMQP_REQUEST_DURATION.values[("test_key",)]["count"].should.equal(2)
+
+    def test_render_metrics_of_processes(self):
+        def create_registry():
+            registry = metrics.MetricsRegistry()
+            registry.register(metrics.Counter("requests_total", "Requests"))
+            registry.register(metrics.Gauge("in_flight", "In flight", multiprocess_mode="sum"))
+            registry.register(metrics.Gauge("batch_size", "Batch size"))
+            registry.register(metrics.Histogram("duration_seconds", "Duration", buckets=(1,)))
+            return registry
+        with tempfile.TemporaryDirectory() as directory:
+            registry = create_registry()
+            registry.set_multiprocess_dir(directory, dump_interval=60)
+            other_registry = create_registry()
+            other_registry.set_multiprocess_dir(directory, dump_interval=60)
+            for _registry in [registry, other_registry]:
+                _registry.metrics[0].inc()
+                _registry.metrics[1].inc()
+                _registry.metrics[2].set(10)
+                _registry.metrics[3].observe(0.5)
+            # values of another process, which has exited
+            registry.dump()
+            os.rename(registry.get_file_name(os.getpid()), registry.get_file_name(999999999))
+
+            other_registry.render().should.equal("\n".join([
+                "# HELP requests_total Requests",
+                "# TYPE requests_total counter",
+                "requests_total 2.0",
+                "# HELP in_flight In flight",
+                "# TYPE in_flight gauge",
+                "in_flight 1.0",
+                "# HELP batch_size Batch size",
+                "# TYPE batch_size gauge",
+                'batch_size{pid="%d"} 10.0' % os.getpid(),
+                "# HELP duration_seconds Duration",
+                "# TYPE duration_seconds histogram",
+                'duration_seconds_bucket{le="1.0"} 2.0',
+                'duration_seconds_bucket{le="+Inf"} 2.0',
+                "duration_seconds_sum 1.0",
+                "duration_seconds_count 2.0"]) + "\n")
+
+    def test_multiprocess_dir_without_dumping_before_fork(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = metrics.MetricsRegistry()
+            counter = registry.register(metrics.Counter("requests_total", "Requests"))
+            # files of a running and an exited process
+            for pid in [os.getpid(), 999999999]:
+                with open(os.path.join(directory, "metrics_%d.json" % pid), "w") as file:
+                    file.write("{}")
+            registry.set_multiprocess_dir(directory, dump_interval=60)
+            os.listdir(directory).should.equal(["metrics_%d.json" % os.getpid()])
+            registry.dumping_pid.should.be.none
+
+            counter.lock.acquire()
+            registry.recreate_locks()
+            counter.inc()
+            counter.values[()].should.equal(1)
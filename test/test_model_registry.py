@@ -0,0 +1,50 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+import sure # noqa
+from boosting_decision_making.model_registry import ModelRegistry
+from utils import utils
+
+
+class TestModelRegistry(unittest.TestCase):
+    """Tests sharing loaded models"""
+    @utils.ignore_warnings
+    def setUp(self):
+        self.model_settings = utils.read_json_file("", "model_settings.json", to_json=True)
+        logging.disable(logging.CRITICAL)
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    @utils.ignore_warnings
+    def test_models_are_loaded_once(self):
+        registry = ModelRegistry()
+        weights_folder = self.model_settings["SIMILARITY_WEIGHTS_FOLDER"]
+        boost_folder = self.model_settings["BOOST_MODEL_FOLDER"]
+        weights_model = registry.get_weighted_similarity_calculator(weights_folder)
+        registry.get_weighted_similarity_calculator(weights_folder).should.be(weights_model)
+        boost_model = registry.get_boosting_decision_maker(boost_folder)
+        registry.get_boosting_decision_maker(boost_folder).should.be(boost_model)
+
+        models_info = registry.get_models_info()
+        models_info.should.have.length_of(2)
+        for model_info in models_info:
+            model_info["folder"].should.be.within([weights_folder, boost_folder])
+            model_info["load_time"].should.be.greater_than_or_equal_to(0)
+            model_info["memory_mb"].should.be.greater_than_or_equal_to(0)
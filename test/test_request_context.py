@@ -0,0 +1,36 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import sure # noqa
+from commons.request_context import RequestContext
+
+
+class TestRequestContext(unittest.TestCase):
+    """Tests deadlines and cancellation of requests"""
+
+    def test_deadline(self):
+        context = RequestContext(timeout=300)
+        context.should_stop().should.be.false
+        context.should_stop(time_reserve=301).should.be.true
+        RequestContext().time_left().should.equal(float("inf"))
+
+    def test_contexts_are_cancelled_separately(self):
+        first_context = RequestContext(timeout=300)
+        second_context = RequestContext(timeout=300)
+        first_context.cancel()
+        first_context.should_stop().should.be.true
+        second_context.should_stop().should.be.false
@@ -15,11 +15,14 @@
 """
 
 import unittest
+import json
+from unittest.mock import MagicMock
 from http import HTTPStatus
 import sure # noqa
 import httpretty
 
 import commons.launch_objects as launch_objects
+from service import search_service
 from service.search_service import SearchService
 from test.test_service import TestService
 from utils import utils
@@ -27,22 +30,23 @@ from utils import utils
 
 class TestSearchService(TestService):
 
+    search_logs_uri = "/_msearch?filter_path=" + "%2C".join(search_service.SEARCH_LOGS_FILTER_PATH)
+
     @utils.ignore_warnings
     def test_search_logs(self):
         """Test search logs"""
         tests = [
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":         httpretty.GET,
-                                    "uri":            "/1/_search",
+                                    "uri":            self.search_logs_uri,
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(self.search_logs_rq),
-                                    "rs":             utils.get_fixture(
-                                        self.no_hits_search_rs),
+                                    "rq":             self.get_msearch_rq("1", self.search_logs_rq),
+                                    "rs":             self.get_msearch_rs(self.no_hits_search_rs),
                                     }, ],
                 "rq":             launch_objects.SearchLogs(launchId=1,
                                                             launchName="Launch 1",
@@ -54,7 +58,7 @@ class TestSearchService(TestService):
                 "expected_count": 0
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     }, ],
@@ -68,17 +72,16 @@ class TestSearchService(TestService):
                 "expected_count": 0
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":         httpretty.GET,
-                                    "uri":            "/1/_search",
+                                    "uri":            self.search_logs_uri,
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(self.search_logs_rq),
-                                    "rs":             utils.get_fixture(
-                                        self.one_hit_search_rs_search_logs),
+                                    "rq":             self.get_msearch_rq("1", self.search_logs_rq),
+                                    "rs":             self.get_msearch_rs(self.one_hit_search_rs_search_logs),
                                     }, ],
                 "rq":             launch_objects.SearchLogs(launchId=1,
                                                             launchName="Launch 1",
@@ -90,17 +93,16 @@ class TestSearchService(TestService):
                 "expected_count": 0
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":         httpretty.GET,
-                                    "uri":            "/1/_search",
+                                    "uri":            self.search_logs_uri,
                                     "status":         HTTPStatus.OK,
                                     "content_type":   "application/json",
-                                    "rq":             utils.get_fixture(
-                                        self.search_logs_rq_not_found),
-                                    "rs":             utils.get_fixture(
+                                    "rq":             self.get_msearch_rq("1", self.search_logs_rq_not_found),
+                                    "rs":             self.get_msearch_rs(
                                         self.two_hits_search_rs_search_logs),
                                     }, ],
                 "rq":             launch_objects.SearchLogs(launchId=1,
@@ -126,6 +128,42 @@ class TestSearchService(TestService):
 
                 TestSearchService.shutdown_server(test["test_calls"])
 
+    @utils.ignore_warnings
+    def test_search_logs_pages(self):
+        """Test requesting next pages of hits with search_after"""
+        test_calls = [{"method":         httpretty.HEAD,
+                       "uri":            "/1",
+                       "status":         HTTPStatus.OK,
+                       }]
+        self._start_server(test_calls)
+        app_config = dict(self.app_config, searchLogsPageSize=1)
+        _search_service = SearchService(app_config=app_config,
+                                        search_cfg=self.get_default_search_config())
+        hits = utils.get_fixture(self.two_hits_search_rs_search_logs, to_json=True)["hits"]["hits"]
+        hits[0]["sort"] = [15, 0]
+        hits[1]["sort"] = [10, 1]
+        _search_service.es_client.es_client.msearch = MagicMock(side_effect=[
+            {"responses": [{"status": 200, "hits": {"hits": [hits[0]]}}, {"status": 200}]},
+            {"responses": [{"status": 200, "hits": {"hits": [hits[1]]}}]},
+            {"responses": [{"status": 200}]}])
+
+        response = _search_service.search_logs(
+            launch_objects.SearchLogs(launchId=1,
+                                      launchName="Launch 1",
+                                      itemId=3,
+                                      projectId=1,
+                                      filteredLaunchIds=[1],
+                                      logMessages=["error occured once", "database connection failed"],
+                                      logLines=-1))
+
+        response.should.equal([launch_objects.SearchLogInfo(logId=1, testItemId=1)])
+        msearch_calls = _search_service.es_client.es_client.msearch.call_args_list
+        msearch_calls.should.have.length_of(3)
+        [json.loads(line)["search_after"] for line in msearch_calls[2][0][0].splitlines()[1::2]].should.equal(
+            [[10, 1]])
+
+        TestSearchService.shutdown_server(test_calls)
+
 
 if __name__ == '__main__':
     unittest.main()
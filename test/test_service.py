@@ -40,6 +40,7 @@ class TestService(unittest.TestCase):
         self.launch_w_test_items_w_logs_to_be_merged =\
             "launch_w_test_items_w_logs_to_be_merged.json"
         self.index_logs_rq = "index_logs_rq.json"
+        self.delete_and_index_merged_logs_rq = "delete_and_index_merged_logs_rq.json"
         self.index_logs_rq_big_messages = "index_logs_rq_big_messages.json"
         self.index_logs_rs = "index_logs_rs.json"
         self.search_rq_first = "search_rq_first.json"
@@ -87,6 +88,7 @@ class TestService(unittest.TestCase):
         self.cluster_update_es_update = "cluster_update_es_update.json"
         self.cluster_update_all_the_same_es_update = "cluster_update_all_the_same_es_update.json"
         self.cluster_update = "cluster_update.json"
+        self.update_by_query_rs = "update_by_query_rs.json"
         self.app_config = {
             "esHost": "http://localhost:9200",
             "esVerifyCerts":     False,
@@ -155,6 +157,20 @@ class TestService(unittest.TestCase):
                     status=test_info["status"],
                 )
 
+    @staticmethod
+    def get_msearch_rq(index, *rq_fixtures):
+        """Get lines of the msearch request with queries from fixtures"""
+        rq = []
+        for rq_fixture in rq_fixtures:
+            rq.extend([{"index": index}, utils.get_fixture(rq_fixture, to_json=True)])
+        return rq
+
+    @staticmethod
+    def get_msearch_rs(*rs_fixtures):
+        """Get the msearch response with responses from fixtures"""
+        return json.dumps({"responses": [utils.get_fixture(rs_fixture, to_json=True)
+                                         for rs_fixture in rs_fixtures]})
+
     @staticmethod
     @utils.ignore_warnings
     def shutdown_server(test_calls):
@@ -165,7 +181,11 @@ class TestService(unittest.TestCase):
             expected_test_call["uri"].should.equal(test_call.path)
             if "rq" in expected_test_call:
                 expected_body = expected_test_call["rq"]
-                real_body = test_call.parse_request_body(test_call.body)
+                if type(expected_body) == list:
+                    real_body = [json.loads(line) for line in test_call.body.decode("utf-8").split("\n")
+                                 if line.strip()]
+                else:
+                    real_body = test_call.parse_request_body(test_call.body)
                 if type(expected_body) == str and type(real_body) != str:
                     expected_body = json.loads(expected_body)
                 expected_body.should.equal(real_body)
@@ -0,0 +1,75 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+import sure # noqa
+from commons.stats_sink import StatsSink
+from utils import utils
+
+
+class FakeEsClient:
+
+    def __init__(self, fail_index_creation=False):
+        self.es_client = None
+        self.fail_index_creation = fail_index_creation
+        self.created_indices = []
+        self.indexed_bulks = []
+
+    def create_index_for_stats_info(self, es_client, index_name):
+        if self.fail_index_creation:
+            raise Exception("Elasticsearch is not available")
+        self.created_indices.append(index_name)
+
+    def _bulk_index(self, bodies, refresh=True):
+        self.indexed_bulks.append(bodies)
+
+
+class TestStatsSink(unittest.TestCase):
+    """Tests buffering stats documents"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        logging.disable(logging.DEBUG)
+
+    @utils.ignore_warnings
+    def test_documents_are_indexed_in_bulk(self):
+        es_client = FakeEsClient()
+        sink = StatsSink(es_client, buffer_size=3)
+        sink.add([{"_index": "rp_aa_stats", "_source": {}}] * 2)
+        es_client.indexed_bulks.should.have.length_of(0)
+        sink.add([{"_index": "rp_model_train_stats", "_source": {}}])
+        es_client.indexed_bulks.should.have.length_of(1)
+        es_client.indexed_bulks[0].should.have.length_of(3)
+        sink.add([{"_index": "rp_aa_stats", "_source": {}}])
+        sink.close()
+        es_client.indexed_bulks.should.have.length_of(2)
+        sorted(es_client.created_indices).should.equal(["rp_aa_stats", "rp_model_train_stats"])
+
+    @utils.ignore_warnings
+    def test_documents_are_kept_when_index_is_not_prepared(self):
+        es_client = FakeEsClient(fail_index_creation=True)
+        sink = StatsSink(es_client, buffer_size=1)
+        sink.add([{"_index": "rp_aa_stats", "_source": {}}])
+        es_client.indexed_bulks.should.have.length_of(0)
+        sink.buffer.should.have.length_of(1)
+        es_client.fail_index_creation = False
+        sink.flush()
+        es_client.indexed_bulks.should.have.length_of(1)
+        sink.buffer.should.have.length_of(0)
@@ -32,7 +32,7 @@ class TestSearchService(TestService):
         """Test suggest patterns"""
         tests = [
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.NOT_FOUND,
                                     },
@@ -43,7 +43,7 @@ class TestSearchService(TestService):
                 "expected_count_without_labels": []
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
@@ -54,7 +54,7 @@ class TestSearchService(TestService):
                 "expected_count_without_labels": []
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
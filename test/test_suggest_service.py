@@ -34,7 +34,7 @@ class TestSuggestService(TestService):
         """Test suggesting test items"""
         tests = [
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/1",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -49,7 +49,7 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/2",
                                     "status":         HTTPStatus.NOT_FOUND,
                                     }, ],
@@ -67,7 +67,7 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":          [{"method":         httpretty.GET,
+                "test_calls":          [{"method":         httpretty.HEAD,
                                          "uri":            "/1",
                                          "status":         HTTPStatus.OK,
                                          }, ],
@@ -85,32 +85,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.no_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.no_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.no_hits_search_rs,
+                                        self.no_hits_search_rs,
                                         self.no_hits_search_rs),
                                     }],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -119,32 +109,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.no_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.no_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.no_hits_search_rs,
+                                        self.no_hits_search_rs,
                                         self.no_hits_search_rs),
                                     }],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -153,32 +133,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([], [])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.no_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.no_hits_search_rs,
+                                        self.one_hit_search_rs,
                                         self.one_hit_search_rs),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -201,32 +171,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1], [[0.2, 0.8]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.one_hit_search_rs,
+                                        self.one_hit_search_rs,
                                         self.one_hit_search_rs),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -249,32 +209,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1], [[0.3, 0.7]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.two_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.one_hit_search_rs,
+                                        self.two_hits_search_rs,
                                         self.two_hits_search_rs),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -297,32 +247,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1, 0], [[0.3, 0.7], [0.9, 0.1]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.two_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.one_hit_search_rs,
+                                        self.two_hits_search_rs,
                                         self.no_hits_search_rs),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -359,32 +299,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1, 0], [[0.3, 0.7], [0.55, 0.45]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.two_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.three_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.two_hits_search_rs,
+                                        self.three_hits_search_rs,
                                         self.no_hits_search_rs),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -435,32 +365,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1, 0, 1], [[0.3, 0.7], [0.55, 0.45], [0.2, 0.8]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_first),
-                                    "rs":           utils.get_fixture(
-                                        self.two_hits_search_rs),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_second),
-                                    "rs":           utils.get_fixture(
-                                        self.three_hits_search_rs_with_duplicate),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_first,
+                                        self.search_rq_second,
+                                        self.search_rq_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.two_hits_search_rs,
+                                        self.three_hits_search_rs_with_duplicate,
                                         self.no_hits_search_rs),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -511,32 +431,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1, 1, 1], [[0.3, 0.7], [0.3, 0.7], [0.3, 0.7]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_merged_first),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs_merged),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_merged_second),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs_merged),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_merged_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_merged_first,
+                                        self.search_rq_merged_second,
+                                        self.search_rq_merged_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.one_hit_search_rs_merged,
+                                        self.one_hit_search_rs_merged,
                                         self.one_hit_search_rs_merged),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -559,32 +469,22 @@ class TestSuggestService(TestService):
                 "boost_predict":       ([1], [[0.1, 0.9]])
             },
             {
-                "test_calls":     [{"method":         httpretty.GET,
+                "test_calls":     [{"method":         httpretty.HEAD,
                                     "uri":            "/1",
                                     "status":         HTTPStatus.OK,
                                     },
                                    {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_merged_first),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs_merged_wrong),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
-                                    "status":       HTTPStatus.OK,
-                                    "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_merged_second),
-                                    "rs":           utils.get_fixture(
-                                        self.one_hit_search_rs_merged_wrong),
-                                    },
-                                   {"method":       httpretty.GET,
-                                    "uri":          "/1/_search",
+                                    "uri":          "/_msearch",
                                     "status":       HTTPStatus.OK,
                                     "content_type": "application/json",
-                                    "rq":           utils.get_fixture(self.search_rq_merged_third),
-                                    "rs":           utils.get_fixture(
+                                    "rq":           self.get_msearch_rq(
+                                        "1",
+                                        self.search_rq_merged_first,
+                                        self.search_rq_merged_second,
+                                        self.search_rq_merged_third),
+                                    "rs":           self.get_msearch_rs(
+                                        self.one_hit_search_rs_merged_wrong,
+                                        self.one_hit_search_rs_merged_wrong,
                                         self.one_hit_search_rs_merged_wrong),
                                     }, ],
                 "test_item_info":      launch_objects.TestItemInfo(
@@ -0,0 +1,89 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+import sure # noqa
+from time import sleep, time
+from commons.worker_supervisor import WorkerSupervisor
+from utils import utils
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class TestWorkerSupervisor(unittest.TestCase):
+    """Tests forking, restarting and stopping worker processes"""
+    @utils.ignore_warnings
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.workers_dir = tempfile.mkdtemp()
+
+    @utils.ignore_warnings
+    def tearDown(self):
+        shutil.rmtree(self.workers_dir)
+        logging.disable(logging.DEBUG)
+
+    def get_started_workers(self):
+        started_workers = []
+        for file_name in os.listdir(self.workers_dir):
+            worker_id, pid = file_name.split("_")
+            started_workers.append((int(worker_id), int(pid)))
+        return sorted(started_workers)
+
+    def wait_for_workers(self, workers_number, timeout=10):
+        deadline = time() + timeout
+        while len(self.get_started_workers()) < workers_number and time() < deadline:
+            sleep(0.05)
+        return self.get_started_workers()
+
+    def run_worker(self, worker_id):
+        crashed = any(started_worker_id == worker_id for started_worker_id, _ in self.get_started_workers())
+        open(os.path.join(self.workers_dir, "%d_%d" % (worker_id, os.getpid())), "w").close()
+        if worker_id == 0 and not crashed:
+            raise ValueError("The worker has crashed")
+        while True:
+            sleep(0.1)
+
+    @utils.ignore_warnings
+    def test_workers_are_restarted_and_stopped(self):
+        supervisor = WorkerSupervisor(2, self.run_worker, restart_delay=0, poll_interval=0.05)
+        supervisor_pid = supervisor.start()
+        try:
+            started_workers = self.wait_for_workers(3)
+        finally:
+            supervisor.stop()
+
+        [worker_id for worker_id, _ in started_workers].should.equal([0, 0, 1])
+        supervisor_pid.should_not.equal(os.getpid())
+        supervisor.pid.should.be.none
+        is_process_alive(supervisor_pid).should.be.false
+        for _, pid in started_workers:
+            is_process_alive(pid).should.be.false
+
+    @utils.ignore_warnings
+    def test_stop_without_start(self):
+        supervisor = WorkerSupervisor(1, self.run_worker)
+        supervisor.stop()
+        supervisor.workers.should.be.empty
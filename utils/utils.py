@@ -16,7 +16,6 @@
 
 import re
 import string
-import nltk
 import logging
 from dateutil.parser import parse
 import urllib
@@ -24,6 +23,7 @@ from urllib.parse import urlparse
 import warnings
 import os
 import json
+import copy
 import requests
 import commons
 from collections import Counter
@@ -32,8 +32,17 @@ import numpy as np
 
 logger = logging.getLogger("analyzerApp.utils")
 file_extensions = ["java", "php", "cpp", "cs", "c", "h", "js", "swift", "rb", "py", "scala"]
-stopwords = set(nltk.corpus.stopwords.words("english"))
 ERROR_LOGGING_LEVEL = 40000
+_stopwords = None
+
+
+def get_stopwords():
+    """Gets english stopwords, nltk is imported on the first call"""
+    global _stopwords
+    if _stopwords is None:
+        import nltk
+        _stopwords = set(nltk.corpus.stopwords.words("english"))
+    return _stopwords
 
 
 def ignore_warnings(method):
@@ -88,6 +97,7 @@ def reverse_log(log):
 def split_words(text, min_word_length=0, only_unique=True, split_urls=True, to_lower=True):
     all_unique_words = set()
     all_words = []
+    stopwords = get_stopwords()
     translate_map = {}
     for punct in string.punctuation + "<>{}[];=()'\"":
         if punct != "." and (split_urls or punct not in ["/", "\\"]):
@@ -411,6 +421,17 @@ def read_json_file(folder, filename, to_json=False):
         return file.read() if not to_json else json.loads(file.read())
 
 
+_json_files_cache = {}
+
+
+def read_json_file_cached(folder, filename):
+    """Read json file once per process, returns a copy of the parsed json"""
+    path = os.path.join(folder, filename)
+    if path not in _json_files_cache:
+        _json_files_cache[path] = read_json_file(folder, filename, to_json=True)
+    return copy.deepcopy(_json_files_cache[path])
+
+
 def get_found_exceptions(text, to_lower=False):
     """Extract exception and errors from logs"""
     unique_exceptions = set()
@@ -592,6 +613,32 @@ def send_request(url, method):
     return []
 
 
+def get_process_uptime():
+    """Gets seconds since the process start, None if it can't be found out"""
+    try:
+        with open("/proc/uptime", "r") as file:
+            system_uptime = float(file.read().split()[0])
+        with open("/proc/self/stat", "r") as file:
+            process_start_ticks = float(file.read().rsplit(")", 1)[1].split()[19])
+        return system_uptime - process_start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return None
+
+
+def get_process_memory():
+    """Get resident memory of the current process in bytes"""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+
 def extract_all_exceptions(bodies):
     logs_with_exceptions = []
     for log_body in bodies: